@@ -0,0 +1 @@
+"""Offline benchmarks for reaper against simulated cloud backends."""
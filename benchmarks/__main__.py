@@ -0,0 +1,236 @@
+"""
+Benchmark reaper against simulated EC2 and Azure backends.
+
+Examples:
+    python -m benchmarks
+    python -m benchmarks --regions 20 --snapshots 50000 --latency 0.02
+    python -m benchmarks --scenario aws-reap --throttle-rate 0.01 --json
+
+Inventory sizes are per region (or per subscription for Azure). API rates are
+effectively unlimited by default so the benchmarks measure reaper itself; pass
+--api-rate to include reaper's own rate limiting.
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import time
+from contextlib import ExitStack, contextmanager
+from unittest.mock import patch
+
+from benchmarks import fakes
+from reaper import aws_delete, azure_power_off_vms, configure_logging, throttle
+
+
+@contextmanager
+def quiet_logging():
+    """Send reaper's log output to /dev/null but still pay for formatting it."""
+    handlers = [
+        handler
+        for handler in logging.getLogger("reaper").handlers
+        if isinstance(handler, logging.StreamHandler)
+    ]
+    with open(os.devnull, "w") as devnull:
+        streams = [handler.setStream(devnull) for handler in handlers]
+        try:
+            yield
+        finally:
+            for handler, stream in zip(handlers, streams):
+                handler.setStream(stream)
+
+
+def configure(args):
+    """Patch reaper's settings for one benchmark run."""
+    stack = ExitStack()
+    for module, name, value in (
+        (aws_delete, "REAP_REGION_CONCURRENCY", args.region_concurrency),
+        (aws_delete, "REAP_DELETE_CONCURRENCY", args.delete_concurrency),
+        (aws_delete, "REAP_PAGE_SIZE", args.page_size),
+        (aws_delete, "get_now", lambda: fakes.NOW),
+        (throttle, "REAP_API_RATE_INITIAL", args.api_rate),
+        (throttle, "REAP_API_RATE_MAX", args.api_rate),
+        (throttle, "_buckets", {}),
+        (azure_power_off_vms, "REAP_POWER_OFF_CONCURRENCY", args.delete_concurrency),
+    ):
+        stack.enter_context(patch.object(module, name, value))
+    return stack
+
+
+def install_aws(args, backend):
+    """Install fake AWS clients and return {region name: FakeEC2Client}."""
+    return fakes.install_aws(
+        backend,
+        regions=args.regions,
+        volumes=args.volumes,
+        snapshots=args.snapshots,
+        tag_count=args.tags,
+        seed=args.seed,
+    )
+
+
+def get_oldest_allowed(age_seconds):
+    """Get the cutoff time for the fake inventory."""
+    return fakes.NOW - datetime.timedelta(seconds=age_seconds)
+
+
+def prepare_aws_discovery(args, backend):
+    """Describe every snapshot in one region without evaluating any."""
+    ec2_client = next(iter(install_aws(args, backend).values()))
+
+    def measure():
+        snapshots = throttle.paginate(
+            ec2_client, "describe_snapshots", "Snapshots", MaxResults=args.page_size
+        )
+        return sum(1 for _ in snapshots)
+
+    return measure
+
+
+def prepare_aws_filtering(args, backend):
+    """Describe and evaluate every volume and snapshot in one region."""
+    ec2_client = next(iter(install_aws(args, backend).values()))
+
+    def measure():
+        volumes = aws_delete.describe_volumes_to_delete(
+            ec2_client, get_oldest_allowed(aws_delete.REAP_AGE_VOLUMES)
+        )
+        snapshots = aws_delete.describe_snapshots_to_delete(
+            ec2_client,
+            fakes.ACCOUNT,
+            get_oldest_allowed(aws_delete.REAP_AGE_SNAPSHOTS),
+        )
+        for _ in itertools.chain(volumes, snapshots):
+            pass
+        return len(ec2_client.volumes) + len(ec2_client.snapshots)
+
+    return measure
+
+
+def prepare_aws_delete(args, backend):
+    """Delete every old snapshot in one region."""
+    ec2_client = next(iter(install_aws(args, backend).values()))
+
+    def measure():
+        count, _ = aws_delete.delete_old_snapshots(
+            ec2_client,
+            fakes.ACCOUNT,
+            get_oldest_allowed(aws_delete.REAP_AGE_SNAPSHOTS),
+        )
+        return count
+
+    return measure
+
+
+def prepare_aws_reap(args, backend):
+    """Reap volumes and snapshots in every region."""
+    ec2_clients = install_aws(args, backend)
+
+    def measure():
+        aws_delete.reap()
+        return sum(
+            args.volumes + args.snapshots - len(client.volumes) - len(client.snapshots)
+            for client in ec2_clients.values()
+        )
+
+    return measure
+
+
+def prepare_azure_reap(args, backend):
+    """Power off every running VM and VM scale set VM in one subscription."""
+    compute_client = fakes.FakeComputeClient(
+        backend,
+        vms=args.vms,
+        scale_sets=args.scale_sets,
+        vms_per_scale_set=args.vms_per_scale_set,
+        tag_count=args.tags,
+        seed=args.seed,
+    )
+
+    def measure():
+        with patch.object(
+            azure_power_off_vms,
+            "get_azure_compute_client",
+            return_value=compute_client,
+        ):
+            outcomes = azure_power_off_vms.reap_subscription(None, "benchmark")
+        return outcomes["stopped"]
+
+    return measure
+
+
+SCENARIOS = {
+    "aws-discovery": prepare_aws_discovery,
+    "aws-filtering": prepare_aws_filtering,
+    "aws-delete": prepare_aws_delete,
+    "aws-reap": prepare_aws_reap,
+    "azure-reap": prepare_azure_reap,
+}
+
+
+def run(scenario, args):
+    """Run one scenario and return its result dict."""
+    backend = fakes.FakeBackend(args.latency, args.throttle_rate, args.seed)
+    with configure(args), quiet_logging():
+        measure = SCENARIOS[scenario](args, backend)
+        start = time.perf_counter()
+        items = measure()
+        seconds = time.perf_counter() - start
+    return {
+        "scenario": scenario,
+        "seconds": seconds,
+        "items": items,
+        "items_per_second": items / seconds if seconds else 0.0,
+        "calls": dict(backend.calls),
+    }
+
+
+def get_parser():
+    """Get the command line argument parser."""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--scenario", choices=list(SCENARIOS), action="append")
+    parser.add_argument("--regions", type=int, default=4)
+    parser.add_argument("--volumes", type=int, default=1000)
+    parser.add_argument("--snapshots", type=int, default=5000)
+    parser.add_argument("--tags", type=int, default=10)
+    parser.add_argument("--vms", type=int, default=1000)
+    parser.add_argument("--scale-sets", type=int, default=20)
+    parser.add_argument("--vms-per-scale-set", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per call")
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--api-rate", type=float, default=1e9, help="calls/second")
+    parser.add_argument("--page-size", type=int, default=aws_delete.REAP_PAGE_SIZE)
+    parser.add_argument("--region-concurrency", type=int, default=4)
+    parser.add_argument("--delete-concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    return parser
+
+
+def main(argv=None):
+    """Run the selected benchmarks and print their results."""
+    args = get_parser().parse_args(argv)
+    configure_logging()
+    results = []
+    for scenario in args.scenario or SCENARIOS:
+        result = run(scenario, args)
+        results.append(result)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                f"{scenario:<14} {result['seconds']:>9.3f}s "
+                f"{result['items']:>9} items {result['items_per_second']:>11.1f}/s "
+                f"{sum(result['calls'].values()):>8} calls"
+            )
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""
+Fake EC2, STS and Azure compute clients backed by synthetic inventories.
+
+The fakes implement just the calls reaper makes, with the same shapes as boto3
+and the Azure SDK return. Each call sleeps for the configured latency and every
+call is counted. EC2 calls that reaper rate limits may also be throttled at the
+configured rate; the Azure SDK retries throttled requests itself, so Azure
+calls never are.
+"""
+
+import datetime
+import fnmatch
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+BYPASS_TAG = "do-not-delete"
+ACCOUNT = "123456789012"
+
+
+class FakeBackend:
+    """Shared latency, throttling and call counting for fake clients."""
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, seed=0):
+        """Initialize a backend with per-call latency and throttle probability."""
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self, action, throttle=True):
+        """Count the call, wait out its latency, and maybe throttle it."""
+        with self._lock:
+            self.calls[action] += 1
+            throttled = throttle and self._random.random() < self.throttle_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if throttled:
+            raise client_error("RequestLimitExceeded", action)
+
+
+def client_error(code, action):
+    """Make a ClientError like botocore raises."""
+    return ClientError(error_response={"Error": {"Code": code}}, operation_name=action)
+
+
+def make_tags(rng, count, bypass):
+    """Make a described resource's tag list."""
+    tags = [{"Key": f"tag-{n}", "Value": f"value-{n}"} for n in range(count)]
+    if bypass:
+        tags.insert(rng.randrange(len(tags) + 1), {"Key": BYPASS_TAG, "Value": ""})
+    return tags
+
+
+def make_created(rng, young_fraction, age_seconds):
+    """Make a creation time that is younger or older than age_seconds."""
+    if rng.random() < young_fraction:
+        return NOW - datetime.timedelta(seconds=rng.uniform(0, age_seconds))
+    return NOW - datetime.timedelta(seconds=rng.uniform(age_seconds, 10 * age_seconds))
+
+
+def matches_filters(resource, filters, filter_fields):
+    """Check a described resource against EC2-style Filters."""
+    for described_filter in filters or []:
+        field = filter_fields[described_filter["Name"]]
+        value = resource[field]
+        if isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        if not any(fnmatch.fnmatchcase(value, v) for v in described_filter["Values"]):
+            return False
+    return True
+
+
+class FakeEC2Client:
+    """Just enough of a boto3 EC2 client for reaper, for one region."""
+
+    VOLUME_FILTER_FIELDS = {
+        "status": "State",
+        "create-time": "CreateTime",
+        "volume-id": "VolumeId",
+    }
+    SNAPSHOT_FILTER_FIELDS = {
+        "status": "State",
+        "start-time": "StartTime",
+        "snapshot-id": "SnapshotId",
+    }
+
+    def __init__(
+        self,
+        backend,
+        region_name,
+        volumes=0,
+        snapshots=0,
+        young_fraction=0.3,
+        bypass_fraction=0.1,
+        in_use_fraction=0.05,
+        tag_count=10,
+        age_seconds=7 * 24 * 60 * 60,
+        account=ACCOUNT,
+        region_names=(),
+        seed=0,
+    ):
+        """Generate a synthetic inventory for one region."""
+        self.backend = backend
+        self.meta = SimpleNamespace(region_name=region_name)
+        self.region_names = list(region_names)
+        self.in_use = set()
+        rng = random.Random(f"{seed}-{region_name}")
+        self.volumes = {}
+        for n in range(volumes):
+            volume_id = f"vol-{region_name}-{n}"
+            self.volumes[volume_id] = {
+                "VolumeId": volume_id,
+                "Size": rng.choice((1, 8, 20, 100)),
+                "CreateTime": make_created(rng, young_fraction, age_seconds),
+                "State": "available" if rng.random() < 0.9 else "in-use",
+                "Attachments": [],
+                "Tags": make_tags(rng, tag_count, rng.random() < bypass_fraction),
+            }
+        self.snapshots = {}
+        for n in range(snapshots):
+            snapshot_id = f"snap-{region_name}-{n}"
+            self.snapshots[snapshot_id] = {
+                "SnapshotId": snapshot_id,
+                "OwnerId": account,
+                "VolumeSize": rng.choice((1, 8, 20, 100)),
+                "StartTime": make_created(rng, young_fraction, age_seconds),
+                "State": "completed",
+                "Tags": make_tags(rng, tag_count, rng.random() < bypass_fraction),
+            }
+            if rng.random() < in_use_fraction:
+                self.in_use.add(snapshot_id)
+        # Every snapshot in use is the root device of one of the account's images.
+        self.images = {}
+        for n, snapshot_id in enumerate(sorted(self.in_use)):
+            image_id = f"ami-{region_name}-{n}"
+            self.images[image_id] = {
+                "ImageId": image_id,
+                "OwnerId": account,
+                "CreationDate": self.snapshots[snapshot_id]["StartTime"].strftime(
+                    "%Y-%m-%dT%H:%M:%S.000Z"
+                ),
+                "BlockDeviceMappings": [
+                    {"DeviceName": "/dev/sda1", "Ebs": {"SnapshotId": snapshot_id}}
+                ],
+                "Tags": [],
+            }
+        self._listings = {}
+        self._listing_ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def describe_regions(self):
+        """Describe the configured regions."""
+        self.backend.call("describe_regions", throttle=False)
+        return {"Regions": [{"RegionName": name} for name in self.region_names]}
+
+    def _describe(self, action, inventory, result_key, fields, kwargs):
+        self.backend.call(action)
+        if "NextToken" in kwargs:
+            listing_id, start = kwargs["NextToken"].split(":")
+            matching, start = self._listings[listing_id], int(start)
+        else:
+            # Like EC2, page through a snapshot of the listing taken up front.
+            with self._lock:
+                resources = list(inventory.values())
+            matching = [
+                resource
+                for resource in resources
+                if matches_filters(resource, kwargs.get("Filters"), fields)
+            ]
+            listing_id, start = str(next(self._listing_ids)), 0
+            self._listings[listing_id] = matching
+        end = start + kwargs.get("MaxResults", 1000)
+        page = {result_key: matching[start:end]}
+        if end < len(matching):
+            page["NextToken"] = f"{listing_id}:{end}"
+        else:
+            self._listings.pop(listing_id, None)
+        return page
+
+    def describe_volumes(self, **kwargs):
+        """Describe one page of volumes."""
+        return self._describe(
+            "describe_volumes",
+            self.volumes,
+            "Volumes",
+            self.VOLUME_FILTER_FIELDS,
+            kwargs,
+        )
+
+    def describe_snapshots(self, **kwargs):
+        """Describe one page of snapshots."""
+        return self._describe(
+            "describe_snapshots",
+            self.snapshots,
+            "Snapshots",
+            self.SNAPSHOT_FILTER_FIELDS,
+            kwargs,
+        )
+
+    def describe_images(self, **kwargs):
+        """Describe one page of the account's images."""
+        return self._describe("describe_images", self.images, "Images", {}, kwargs)
+
+    def _delete(self, action, inventory, resource_id, dry_run, not_found_code):
+        self.backend.call(action)
+        if dry_run:
+            raise client_error("DryRunOperation", action)
+        if resource_id in self.in_use:
+            raise client_error("InvalidSnapshot.InUse", action)
+        with self._lock:
+            if inventory.pop(resource_id, None) is None:
+                raise client_error(not_found_code, action)
+        return {}
+
+    def delete_volume(self, VolumeId, DryRun=False):
+        """Delete a volume."""
+        return self._delete(
+            "delete_volume", self.volumes, VolumeId, DryRun, "InvalidVolume.NotFound"
+        )
+
+    def delete_snapshot(self, SnapshotId, DryRun=False):
+        """Delete a snapshot."""
+        return self._delete(
+            "delete_snapshot",
+            self.snapshots,
+            SnapshotId,
+            DryRun,
+            "InvalidSnapshot.NotFound",
+        )
+
+
+class FakeSTSClient:
+    """Just enough of a boto3 STS client for reaper."""
+
+    def __init__(self, backend, account=ACCOUNT):
+        """Initialize a client for the given account."""
+        self.backend = backend
+        self.account = account
+
+    def get_caller_identity(self):
+        """Get the caller's account."""
+        self.backend.call("get_caller_identity", throttle=False)
+        return {"Account": self.account}
+
+
+def install_aws(backend, regions=1, volumes=0, snapshots=0, **inventory):
+    """
+    Put fake STS and EC2 clients into reaper's shared client cache.
+
+    Each of the regions gets its own inventory of volumes and snapshots.
+    Return {region name: FakeEC2Client}.
+    """
+    from reaper import aws_clients
+
+    region_names = [f"region-{n}" for n in range(regions)]
+    aws_clients.clear()
+    aws_clients.clients[("sts", None, None)] = FakeSTSClient(backend)
+    aws_clients.clients[("ec2", None, None)] = FakeEC2Client(
+        backend, None, region_names=region_names
+    )
+    ec2_clients = {}
+    for region_name in region_names:
+        ec2_clients[region_name] = FakeEC2Client(
+            backend, region_name, volumes, snapshots, **inventory
+        )
+        aws_clients.clients[("ec2", region_name, None)] = ec2_clients[region_name]
+    return ec2_clients
+
+
+class FakePoller:
+    """An LROPoller that finishes after the backend's latency."""
+
+    def __init__(self, backend):
+        """Start a long-running operation."""
+        self.backend = backend
+        self.finishes_at = time.monotonic() + backend.latency
+
+    def wait(self, timeout=None):
+        """Wait for the operation to finish or for the timeout."""
+        remaining = self.finishes_at - time.monotonic()
+        if timeout is not None:
+            remaining = min(remaining, timeout)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def done(self):
+        """Check if the operation finished."""
+        return time.monotonic() >= self.finishes_at
+
+    def status(self):
+        """Get the operation's status."""
+        return "Succeeded" if self.done() else "InProgress"
+
+
+def make_azure_vm(rng, subscription, n, tag_count, bypass_fraction, running_fraction):
+    """Make the with-tags and with-status views of one fake Azure VM."""
+    name = f"vm-{n}"
+    vm_id = (
+        f"/subscriptions/{subscription}/resourceGroups/rg-{n % 10}"
+        f"/providers/Microsoft.Compute/virtualMachines/{name}"
+    )
+    tags = {f"tag-{t}": f"value-{t}" for t in range(tag_count)}
+    if rng.random() < bypass_fraction:
+        tags[BYPASS_TAG] = ""
+    power_state = (
+        "PowerState/running"
+        if rng.random() < running_fraction
+        else "PowerState/deallocated"
+    )
+    statuses = [
+        SimpleNamespace(code="ProvisioningState/succeeded"),
+        SimpleNamespace(code=power_state),
+    ]
+    with_tags = SimpleNamespace(id=vm_id, name=name, tags=tags, instance_view=None)
+    with_status = SimpleNamespace(
+        id=vm_id.upper(),
+        name=name,
+        tags=None,
+        instance_view=SimpleNamespace(statuses=statuses),
+        instance_id=str(n),
+    )
+    return with_tags, with_status
+
+
+class FakeComputeClient:
+    """Just enough of an Azure ComputeManagementClient for reaper."""
+
+    def __init__(
+        self,
+        backend,
+        vms=0,
+        scale_sets=0,
+        vms_per_scale_set=0,
+        tag_count=10,
+        bypass_fraction=0.1,
+        running_fraction=0.5,
+        subscription="00000000-0000-0000-0000-000000000000",
+        seed=0,
+    ):
+        """Generate a synthetic inventory of VMs and VM scale sets."""
+        self.backend = backend
+        rng = random.Random(seed)
+        pairs = [
+            make_azure_vm(
+                rng, subscription, n, tag_count, bypass_fraction, running_fraction
+            )
+            for n in range(vms)
+        ]
+        self._vms_with_tags = [with_tags for with_tags, _ in pairs]
+        self._vms_with_status = [with_status for _, with_status in pairs]
+        self._scale_sets = []
+        self._scale_set_vms = {}
+        for s in range(scale_sets):
+            name = f"vmss-{s}"
+            self._scale_sets.append(
+                SimpleNamespace(
+                    id=(
+                        f"/subscriptions/{subscription}/resourceGroups/rg-vmss"
+                        f"/providers/Microsoft.Compute/virtualMachineScaleSets/{name}"
+                    ),
+                    name=name,
+                    tags={},
+                )
+            )
+            scale_set_vms = []
+            for n in range(vms_per_scale_set):
+                with_tags, with_status = make_azure_vm(
+                    rng, subscription, n, tag_count, bypass_fraction, running_fraction
+                )
+                with_status.tags = with_tags.tags
+                scale_set_vms.append(with_status)
+            self._scale_set_vms[name] = scale_set_vms
+        self.virtual_machines = SimpleNamespace(
+            list_all=self._list_all_vms, begin_power_off=self._begin_power_off
+        )
+        self.virtual_machine_scale_sets = SimpleNamespace(
+            list_all=self._list_all_scale_sets,
+            begin_power_off=self._begin_scale_set_power_off,
+        )
+        self.virtual_machine_scale_set_vms = SimpleNamespace(
+            list=self._list_scale_set_vms
+        )
+
+    def _list_all_vms(self, params=None):
+        self.backend.call("virtual_machines.list_all", throttle=False)
+        if params and params.get("statusOnly") == "true":
+            return iter(self._vms_with_status)
+        return iter(self._vms_with_tags)
+
+    def _begin_power_off(self, resource_group_name, vm_name):
+        self.backend.call("virtual_machines.begin_power_off", throttle=False)
+        return FakePoller(self.backend)
+
+    def _list_all_scale_sets(self):
+        self.backend.call("virtual_machine_scale_sets.list_all", throttle=False)
+        return iter(self._scale_sets)
+
+    def _list_scale_set_vms(
+        self, resource_group_name, virtual_machine_scale_set_name, expand=None
+    ):
+        self.backend.call("virtual_machine_scale_set_vms.list", throttle=False)
+        return iter(self._scale_set_vms[virtual_machine_scale_set_name])
+
+    def _begin_scale_set_power_off(
+        self, resource_group_name, vm_scale_set_name, vm_instance_i_ds=None
+    ):
+        self.backend.call("virtual_machine_scale_sets.begin_power_off", throttle=False)
+        return FakePoller(self.backend)
@@ -1,6 +1,14 @@
-"""Package for reaping the clouds."""
+"""
+Package for reaping the clouds.
 
-import logging.config
+Importing reaper is kept cheap: nothing here configures logging or imports a
+cloud SDK. Entry points call configure_logging(), and each cloud's SDK is only
+imported by the modules that reap that cloud.
+"""
+
+# The AWS resources that can be reaped, in the order they are reaped. They live
+# here so the command line can validate them without importing boto3.
+AWS_RESOURCES = ("autoscaling", "instances", "volumes", "snapshots")
 
 LOGGING = {
     "version": 1,
@@ -24,4 +32,18 @@ LOGGING = {
         "azure": {"handlers": ["console"], "level": "WARNING", "propagate": False},
     },
 }
-logging.config.dictConfig(LOGGING)
+
+
+def configure_logging():
+    """
+    Configure logging for a reaper command.
+
+    Console logging can also be switched to JSON, aggregated per resource and
+    moved off the reaping threads; see reaper.logs.
+    """
+    import logging.config
+
+    from reaper import logs
+
+    logging.config.dictConfig(LOGGING)
+    logs.install()
@@ -0,0 +1,110 @@
+"""
+Reap the clouds from a single entry point.
+
+Examples:
+    python -m reaper aws
+    python -m reaper aws --resources volumes,snapshots
+    python -m reaper aws --until 2024-01-01T06:00
+    python -m reaper aws --plan plan.jsonl
+    python -m reaper aws --apply plan.jsonl
+    python -m reaper azure
+"""
+
+import argparse
+import datetime
+
+from reaper import AWS_RESOURCES, configure_logging
+
+
+def parse_resources(value):
+    """Parse a comma-separated list of AWS resource kinds."""
+    resources = tuple(resource.strip() for resource in value.split(",") if resource)
+    unknown = set(resources) - set(AWS_RESOURCES)
+    if unknown or not resources:
+        raise argparse.ArgumentTypeError(
+            f"choose from {', '.join(AWS_RESOURCES)} (got {value!r})"
+        )
+    return resources
+
+
+def parse_until(value):
+    """Parse an ISO 8601 time, in UTC unless it has an offset."""
+    try:
+        # fromisoformat only accepts a trailing Z for UTC from Python 3.11.
+        until = datetime.datetime.fromisoformat(
+            value[:-1] + "+00:00" if value[-1:] in ("Z", "z") else value
+        )
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected an ISO 8601 time (got {value!r})")
+    if until.tzinfo is None:
+        until = until.replace(tzinfo=datetime.timezone.utc)
+    return until
+
+
+def reap_aws(args):
+    """Reap the selected AWS resources."""
+    from reaper import aws_reap
+
+    if args.apply:
+        aws_reap.apply(args.apply)
+    else:
+        aws_reap.reap(args.resources, until=args.until, plan=args.plan)
+
+
+def reap_azure(args):
+    """Reap Azure VMs."""
+    from reaper import azure_power_off_vms
+
+    azure_power_off_vms.reap()
+
+
+def get_parser():
+    """Get the command line argument parser."""
+    parser = argparse.ArgumentParser(
+        prog="python -m reaper",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="cloud", required=True)
+
+    aws_parser = subparsers.add_parser("aws", help="reap AWS resources")
+    aws_parser.add_argument(
+        "--resources",
+        type=parse_resources,
+        default=",".join(AWS_RESOURCES),
+        help="comma-separated resources to reap (default: %(default)s)",
+    )
+    mode_group = aws_parser.add_mutually_exclusive_group()
+    mode_group.add_argument(
+        "--until",
+        type=parse_until,
+        help="keep running to delete volumes and snapshots as they become old "
+        "enough until this ISO 8601 time (UTC unless an offset is given)",
+    )
+    mode_group.add_argument(
+        "--plan",
+        metavar="FILE",
+        help="only write the volumes and snapshots that would be deleted to FILE, "
+        "without any mutating or DryRun calls",
+    )
+    mode_group.add_argument(
+        "--apply",
+        metavar="FILE",
+        help="delete the volumes and snapshots in a plan written by --plan",
+    )
+    aws_parser.set_defaults(func=reap_aws)
+
+    azure_parser = subparsers.add_parser("azure", help="power off Azure VMs")
+    azure_parser.set_defaults(func=reap_azure)
+    return parser
+
+
+def main(argv=None):
+    """Parse arguments and run the selected reaper."""
+    args = get_parser().parse_args(argv)
+    configure_logging()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Share boto3 sessions and their clients across regions and services.
+
+Building a boto3 client reloads the botocore service model and opens a new
+connection pool, so every client is built once per (service, region, role) and
+then reused. Tests may put stubs directly into `clients` to bypass boto3 entirely.
+
+A role ARN selects a session whose credentials come from assuming that role with
+the default session's credentials. Those credentials refresh themselves before
+they expire, so long runs do not fail partway through an account.
+"""
+
+import threading
+
+import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import (
+    AssumeRoleCredentialFetcher,
+    DeferredRefreshableCredentials,
+)
+from envparse import env
+
+REAP_DELETE_CONCURRENCY = env.int("REAP_DELETE_CONCURRENCY", default=1)
+REAP_AWS_ROLE_SESSION_NAME = env("REAP_AWS_ROLE_SESSION_NAME", default="reaper")
+
+# Every regional client is shared by its region's describing thread and its delete
+# workers. Never go below botocore's own default of 10 connections.
+MAX_POOL_CONNECTIONS = max(10, REAP_DELETE_CONCURRENCY + 1)
+
+# reaper.throttle retries throttled calls itself and adapts its rate to them, so
+# botocore must not retry them first: that would hide throttling from the rate
+# limiter and multiply every one of throttle's retries by botocore's. botocore
+# cannot retry only some errors, so throttle retries transient errors as well.
+RETRIES = {"total_max_attempts": 1}
+
+clients = {}
+sessions = {}
+_lock = threading.RLock()
+
+
+def get_session(role_arn=None):
+    """Get the shared boto3 session, or the shared session for an assumed role."""
+    with _lock:
+        if role_arn not in sessions:
+            if role_arn is None:
+                sessions[role_arn] = boto3.session.Session()
+            else:
+                sessions[role_arn] = assume_role_session(get_session(), role_arn)
+        return sessions[role_arn]
+
+
+def assume_role_session(source_session, role_arn):
+    """Build a boto3 session using refreshable credentials for the given role."""
+    fetcher = AssumeRoleCredentialFetcher(
+        client_creator=source_session._session.create_client,
+        source_credentials=source_session.get_credentials(),
+        role_arn=role_arn,
+        extra_args={"RoleSessionName": REAP_AWS_ROLE_SESSION_NAME},
+    )
+    credentials = DeferredRefreshableCredentials(
+        method="assume-role", refresh_using=fetcher.fetch_credentials
+    )
+    botocore_session = botocore.session.Session()
+    # This is how botocore itself wires assume-role credentials into a session.
+    botocore_session._credentials = credentials
+    return boto3.session.Session(
+        botocore_session=botocore_session,
+        region_name=source_session.region_name,
+    )
+
+
+def get_client(service_name, region_name=None, role_arn=None):
+    """Get the shared client for the given service, region, and role."""
+    key = (service_name, region_name, role_arn)
+    with _lock:
+        # boto3 sessions are not thread-safe, so clients are also built under lock.
+        if key not in clients:
+            clients[key] = get_session(role_arn).client(
+                service_name,
+                region_name=region_name,
+                config=Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS, retries=RETRIES
+                ),
+            )
+        return clients[key]
+
+
+def clear():
+    """Forget every shared session and cached client."""
+    with _lock:
+        clients.clear()
+        sessions.clear()
@@ -7,12 +7,27 @@ but sooner or later you dance with the reaper.
 
 import datetime
 import logging
+import time
+from collections import namedtuple
 from contextlib import contextmanager
 
-import boto3
 from botocore.exceptions import ClientError
 from envparse import env
 
+from reaper import (
+    aws_filters,
+    aws_history,
+    aws_plan,
+    aws_schedule,
+    aws_state,
+    configure_logging,
+    logs,
+    metrics,
+    throttle,
+)
+from reaper.aws_clients import get_client
+from reaper.concurrency import Tally, batched, run_pipeline
+
 logger = logging.getLogger(__name__)
 
 REAP_AGE_DEFAULT = 7 * 24 * 60 * 60  # one week in seconds
@@ -20,18 +35,55 @@ REAP_AGE_SNAPSHOTS = env.int("REAP_AGE_SNAPSHOTS", default=REAP_AGE_DEFAULT)
 REAP_AGE_VOLUMES = env.int("REAP_AGE_VOLUMES", default=REAP_AGE_DEFAULT)
 REAP_DRYRUN = env.bool("REAP_DRYRUN", default=False)
 REAP_BYPASS_TAG = env("REAP_BYPASS_TAG", default="do-not-delete")
+REAP_REGION_CONCURRENCY = env.int("REAP_REGION_CONCURRENCY", default=1)
+REAP_PAGE_SIZE = env.int("REAP_PAGE_SIZE", default=500)
+REAP_DELETE_CONCURRENCY = env.int("REAP_DELETE_CONCURRENCY", default=1)
+REAP_AWS_ACCOUNTS = env.list("REAP_AWS_ACCOUNTS", default=[])
+REAP_AWS_ROLE_NAME = env("REAP_AWS_ROLE_NAME", default="OrganizationAccountAccessRole")
+REAP_ACCOUNT_CONCURRENCY = env.int("REAP_ACCOUNT_CONCURRENCY", default=1)
+REAP_DEREGISTER_IMAGES = env.bool("REAP_DEREGISTER_IMAGES", default=False)
+
+# The smallest page that describe_volumes and describe_snapshots accept.
+PROBE_PAGE_SIZE = 5
+
+# Described volumes and snapshots carry tags, KMS and attachment details that are
+# not needed once a resource is chosen, so only this much of each one is kept.
+# fingerprint is the resource's tags fingerprint, or None if state is disabled.
+Candidate = namedtuple(
+    "Candidate", ["id", "region", "size", "timestamp", "reason", "fingerprint"]
+)
+
+
+def get_role_arn(account_or_role_arn):
+    """Get the ARN of the role to assume for the given account ID or role ARN."""
+    if account_or_role_arn.startswith("arn:"):
+        return account_or_role_arn
+    return f"arn:aws:iam::{account_or_role_arn}:role/{REAP_AWS_ROLE_NAME}"
+
+
+def get_role_arns():
+    """Get the ARNs of the roles to assume, or [None] for the default credentials."""
+    return [get_role_arn(account) for account in REAP_AWS_ACCOUNTS] or [None]
 
 
-def get_account():
-    """Get the current active AWS Account."""
-    sts_client = boto3.client("sts")
-    return sts_client.get_caller_identity()["Account"]
+def find_role_arn(account):
+    """Find the role in REAP_AWS_ACCOUNTS to assume for an account ID, if any."""
+    for role_arn in get_role_arns():
+        if role_arn and role_arn.split(":")[4] == account:
+            return role_arn
+    return None
 
 
-def get_region_names():
+def get_account(role_arn=None):
+    """Get the active AWS Account, optionally for an assumed role."""
+    sts_client = get_client("sts", role_arn=role_arn)
+    return throttle.call(sts_client, "get_caller_identity")["Account"]
+
+
+def get_region_names(role_arn=None):
     """Get a list of all available region names."""
-    ec2_client = boto3.client("ec2")
-    regions = ec2_client.describe_regions()["Regions"]
+    ec2_client = get_client("ec2", role_arn=role_arn)
+    regions = throttle.call(ec2_client, "describe_regions")["Regions"]
     return [region["RegionName"] for region in regions]
 
 
@@ -48,7 +100,10 @@ def handle_dryrun():
     except ClientError as e:
         error_code = e.response.get("Error").get("Code")
         if error_code == "DryRunOperation":
-            logger.info("Skipping due to DryRunOperation")
+            logger.info(
+                "Skipping due to DryRunOperation",
+                extra=logs.per_resource("Skipped", "calls due to DryRunOperation"),
+            )
         else:
             raise e
 
@@ -60,36 +115,80 @@ def has_bypass_tag(described_resource):
     return REAP_BYPASS_TAG in tag_keys
 
 
-def delete_old_volumes(ec2_client, oldest_allowed_volume_age):
-    """Delete available volumes older than the allowed age."""
-    volumes = describe_volumes_to_delete(ec2_client, oldest_allowed_volume_age)
-    initial_count = len(volumes)
-    initial_size = sum((float(volume.get("Size", 0.0)) for volume in volumes))
-    logger.info("Found %s volumes having total %s GB", initial_count, initial_size)
+def make_candidate(kind, resource_id, region, size, timestamp, tags):
+    """Keep only what deleting, planning and logging need of a described resource."""
+    fingerprint = aws_state.get_fingerprint(tags) if aws_state.is_enabled() else None
+    return Candidate(
+        resource_id, region, size, timestamp, aws_plan.REASONS[kind], fingerprint
+    )
 
-    total_count, total_size = 0, 0
-    for volume in volumes:
+
+def record_candidate(candidate, decision):
+    """Record this run's decision about the candidate."""
+    aws_state.record_fingerprint(candidate.id, candidate.fingerprint, decision)
+
+
+def record_deleted(candidate):
+    """Record that the candidate was deleted, or only would have been in a dry run."""
+    record_candidate(candidate, "eligible" if REAP_DRYRUN else "deleted")
+
+
+def record_reclaimed(resource, size):
+    """Count one deleted resource and the GB it reclaimed."""
+    metrics.increment("reaper_deleted_total", resource=resource)
+    metrics.increment("reaper_deleted_gigabytes_total", size, resource=resource)
+
+
+def delete_old_volumes(ec2_client, oldest_allowed_volume_age, volume_ids=None):
+    """
+    Delete available volumes older than the allowed age.
+
+    Volumes are deleted by a pool of REAP_DELETE_CONCURRENCY workers while they
+    are still being described. If volume_ids is given, only those are described.
+    """
+    volumes = describe_volumes_to_delete(
+        ec2_client, oldest_allowed_volume_age, volume_ids
+    )
+    found, deleted = Tally(), Tally()
+
+    def delete_one(volume):
+        found.add(volume.size)
         try:
             delete_volume(ec2_client, volume)
-            total_count += 1
-            total_size += float(volume.get("Size", 0.0))
+            deleted.add(volume.size)
+            record_reclaimed("volumes", volume.size)
+            record_deleted(volume)
         except ClientError as exception:
             error_code = exception.response.get("Error", {}).get("Code")
             if error_code == "InvalidVolume.NotFound":
-                logger.info("Skipping because InvalidVolume.NotFound")
+                logger.info(
+                    "Skipping because InvalidVolume.NotFound",
+                    extra=logs.per_resource(
+                        "Skipped", "missing volumes", volume.region
+                    ),
+                )
             else:
+                record_candidate(volume, "failed")
                 logger.error(
                     "Failed to delete volume %s because %s; %s",
-                    volume.get("VolumeId"),
+                    volume.id,
                     error_code,
                     exception,
                 )
-    return total_count, total_size
 
+    run_pipeline(volumes, delete_one, REAP_DELETE_CONCURRENCY)
+    logger.info("Found %s volumes having total %s GB", found.count, found.size)
+    return deleted.count, deleted.size
 
-def describe_volumes_to_delete(ec2_client, oldest_allowed):
+
+def describe_volumes_to_delete(ec2_client, oldest_allowed, volume_ids=None):
     """
-    Get a list of described volumes that meet the criteria for deletion.
+    Generate candidates for the described volumes that meet the criteria for deletion.
+
+    Volumes are described one rate-limited page at a time so that deleting can
+    begin before the whole account has been described. EC2 filters out what it
+    can (see reaper.aws_filters) and the rest is checked here. Resources settled
+    by an earlier run are skipped (see reaper.aws_state).
 
     The volume must:
     - be older than allowed
@@ -97,149 +196,464 @@ def describe_volumes_to_delete(ec2_client, oldest_allowed):
     - not be attached to any instances
     - not have the bypass tag
     """
-    volumes = ec2_client.describe_volumes(
-        # Yes, the described volume has "State", and the filter uses "status".
-        # This mismatch is a mystery, but multiple experiments confirm this works.
-        Filters=[{"Name": "status", "Values": ["available"]}]
+    volumes = throttle.paginate(
+        ec2_client,
+        "describe_volumes",
+        "Volumes",
+        Filters=aws_filters.get_volume_filters(oldest_allowed, volume_ids),
+        MaxResults=REAP_PAGE_SIZE,
     )
-    volumes = [
-        volume
-        for volume in volumes["Volumes"]
-        if volume["CreateTime"] < oldest_allowed
-        and len(volume.get("Attachments", [])) == 0
-        and not has_bypass_tag(volume)
-    ]
-    return volumes
+    volumes = aws_history.count_described(ec2_client, "volumes", volumes)
+    region = metrics.get_client_region(ec2_client)
+    for volume in volumes:
+        volume_id, tags = volume.get("VolumeId"), volume.get("Tags")
+        if aws_state.is_settled(volume_id, tags):
+            continue
+        if volume["CreateTime"] >= oldest_allowed:
+            aws_state.record(volume_id, tags, "young")
+            aws_schedule.add(
+                volume["CreateTime"] + datetime.timedelta(seconds=REAP_AGE_VOLUMES),
+                "volume",
+                volume_id,
+                float(volume.get("Size", 0.0)),
+                ec2_client,
+            )
+        elif len(volume.get("Attachments", [])) != 0:
+            aws_state.record(volume_id, tags, "attached")
+        elif has_bypass_tag(volume):
+            aws_state.record(volume_id, tags, "protected")
+        else:
+            yield make_candidate(
+                "volume",
+                volume_id,
+                region,
+                float(volume.get("Size", 0.0)),
+                volume["CreateTime"],
+                tags,
+            )
 
 
 @handle_dryrun()
 def delete_volume(ec2_client, volume):
-    """Delete the described volume."""
-    logger.info(volume)
+    """Delete the candidate volume."""
     logger.info(
-        f"Deleting VolumeId {volume['VolumeId']} "
-        f"(CreateTime='{volume['CreateTime']}' "
-        f"Size={volume['Size']})"
+        "Deleting VolumeId %s in %s (CreateTime='%s' Size=%s)",
+        volume.id,
+        volume.region,
+        volume.timestamp,
+        volume.size,
+        extra=logs.per_resource("Attempted to delete", "volumes", volume.region),
     )
-    ec2_client.delete_volume(VolumeId=volume["VolumeId"], DryRun=REAP_DRYRUN)
+    throttle.call(ec2_client, "delete_volume", VolumeId=volume.id, DryRun=REAP_DRYRUN)
 
 
-def delete_old_snapshots(ec2_client, account, oldest_allowed_snapshot_age):
-    """Delete completed snapshots older than the allowed age."""
+def delete_old_snapshots(
+    ec2_client,
+    account,
+    oldest_allowed_snapshot_age,
+    snapshot_ids=None,
+    image_snapshot_ids=None,
+):
+    """
+    Delete completed snapshots older than the allowed age.
+
+    Snapshots are deleted by a pool of REAP_DELETE_CONCURRENCY workers while they
+    are still being described. If snapshot_ids is given, only those are described.
+    Snapshots used by the account's images are never sent a delete; the images are
+    described first unless image_snapshot_ids is given.
+    """
+    if image_snapshot_ids is None:
+        image_snapshot_ids = get_image_snapshot_ids(
+            ec2_client, account, oldest_allowed_snapshot_age
+        )
     snapshots = describe_snapshots_to_delete(
-        ec2_client, account, oldest_allowed_snapshot_age
+        ec2_client,
+        account,
+        oldest_allowed_snapshot_age,
+        snapshot_ids,
+        image_snapshot_ids,
     )
-    initial_count = len(snapshots)
-    initial_size = sum(
-        (float(snapshot.get("VolumeSize", 0.0)) for snapshot in snapshots)
-    )
-    logger.info("Found %s snapshots having total %s GB", initial_count, initial_size)
+    found, deleted = Tally(), Tally()
 
-    total_count, total_size = 0, 0
-    for snapshot in snapshots:
+    def delete_one(snapshot):
+        found.add(snapshot.size)
         try:
             delete_snapshot(ec2_client, snapshot)
-            total_count += 1
-            total_size += float(snapshot.get("VolumeSize", 0.0))
+            deleted.add(snapshot.size)
+            record_reclaimed("snapshots", snapshot.size)
+            record_deleted(snapshot)
         except ClientError as exception:
             error_code = exception.response.get("Error", {}).get("Code")
             if error_code == "InvalidSnapshot.InUse":
-                logger.info("Skipping because InvalidSnapshot.InUse")
+                logger.info(
+                    "Skipping because InvalidSnapshot.InUse",
+                    extra=logs.per_resource(
+                        "Skipped", "snapshots in use", snapshot.region
+                    ),
+                )
+                record_candidate(snapshot, "in_use")
             else:
+                record_candidate(snapshot, "failed")
                 logger.error(
                     "Failed to delete snapshot %s because %s; %s",
-                    snapshot.get("SnapshotId"),
+                    snapshot.id,
                     error_code,
                     exception,
                 )
-    return total_count, total_size
+
+    run_pipeline(snapshots, delete_one, REAP_DELETE_CONCURRENCY)
+    logger.info("Found %s snapshots having total %s GB", found.count, found.size)
+    return deleted.count, deleted.size
 
 
-def describe_snapshots_to_delete(ec2_client, account, oldest_allowed):
+def describe_snapshots_to_delete(
+    ec2_client,
+    account,
+    oldest_allowed,
+    snapshot_ids=None,
+    image_snapshot_ids=frozenset(),
+):
     """
-    Get a list of described snapshots that meet the criteria for deletion.
+    Generate candidates for the described snapshots that meet the criteria for deletion.
+
+    Snapshots are described one rate-limited page at a time so that deleting can
+    begin before the whole account has been described. EC2 filters out what it
+    can (see reaper.aws_filters) and the rest is checked here. Resources settled
+    by an earlier run are skipped (see reaper.aws_state).
 
     The snapshot must:
     - be older than allowed
     - be completed
     - not have the bypass tag
+    - not be used by any of image_snapshot_ids' images
     """
-    snapshots = ec2_client.describe_snapshots(
-        # Yes, the described snapshot has "State", and the filter uses "status".
-        # This mismatch is a mystery, but multiple experiments confirm this works.
-        Filters=[{"Name": "status", "Values": ["completed"]}],
+    snapshots = throttle.paginate(
+        ec2_client,
+        "describe_snapshots",
+        "Snapshots",
+        Filters=aws_filters.get_snapshot_filters(oldest_allowed, snapshot_ids),
         OwnerIds=[account],
+        MaxResults=REAP_PAGE_SIZE,
     )
-    snapshots = [
-        snapshot
-        for snapshot in snapshots["Snapshots"]
-        if snapshot["StartTime"] < oldest_allowed and not has_bypass_tag(snapshot)
-    ]
-    return snapshots
+    snapshots = aws_history.count_described(ec2_client, "snapshots", snapshots)
+    region = metrics.get_client_region(ec2_client)
+    for snapshot in snapshots:
+        snapshot_id, tags = snapshot.get("SnapshotId"), snapshot.get("Tags")
+        if aws_state.is_settled(snapshot_id, tags):
+            continue
+        if snapshot["StartTime"] >= oldest_allowed:
+            aws_state.record(snapshot_id, tags, "young")
+            aws_schedule.add(
+                snapshot["StartTime"] + datetime.timedelta(seconds=REAP_AGE_SNAPSHOTS),
+                "snapshot",
+                snapshot_id,
+                float(snapshot.get("VolumeSize", 0.0)),
+                ec2_client,
+                account,
+            )
+        elif has_bypass_tag(snapshot):
+            aws_state.record(snapshot_id, tags, "protected")
+        elif snapshot_id in image_snapshot_ids:
+            aws_state.record(snapshot_id, tags, "used_by_image")
+        else:
+            yield make_candidate(
+                "snapshot",
+                snapshot_id,
+                region,
+                float(snapshot.get("VolumeSize", 0.0)),
+                snapshot["StartTime"],
+                tags,
+            )
 
 
-@handle_dryrun()
-def delete_snapshot(ec2_client, snapshot):
-    """Delete the described snapshot."""
+def get_image_snapshot_ids(ec2_client, account, oldest_allowed, deregister=None):
+    """
+    Get the IDs of the snapshots used by the account's images.
+
+    Describing every image once per region is far cheaper than sending a delete
+    for each of their snapshots only to get InvalidSnapshot.InUse back.
+
+    If deregister (default REAP_DEREGISTER_IMAGES) is true, images older than
+    allowed and without the bypass tag are deregistered first, so their snapshots
+    are deleted in the same pass.
+    """
+    deregister = deregister if deregister is not None else REAP_DEREGISTER_IMAGES
+    images = throttle.paginate(
+        ec2_client,
+        "describe_images",
+        "Images",
+        Owners=[account],
+        IncludeDisabled=True,
+        MaxResults=REAP_PAGE_SIZE,
+    )
+    image_snapshot_ids = set()
+    image_count = deregistered_count = 0
+    for image in images:
+        image_count += 1
+        if deregister and is_image_expired(image, oldest_allowed):
+            try:
+                deregister_image(ec2_client, image)
+                deregistered_count += 1
+                metrics.increment("reaper_deregistered_images_total")
+                continue
+            except ClientError as e:
+                logger.error(
+                    "Failed to deregister image %s because %s", image["ImageId"], e
+                )
+        image_snapshot_ids.update(
+            mapping["Ebs"]["SnapshotId"]
+            for mapping in image.get("BlockDeviceMappings", [])
+            if mapping.get("Ebs", {}).get("SnapshotId")
+        )
     logger.info(
-        f"Deleting SnapshotId {snapshot['SnapshotId']} "
-        f"(StartTime='{snapshot['StartTime']}' "
-        f"VolumeSize={snapshot.get('VolumeSize')} "
-        f"OwnerId={snapshot['OwnerId']})"
+        "Found %s images using %s snapshots and deregistered %s of them",
+        image_count,
+        len(image_snapshot_ids),
+        deregistered_count,
     )
-    ec2_client.delete_snapshot(SnapshotId=snapshot["SnapshotId"], DryRun=REAP_DRYRUN)
+    return image_snapshot_ids
 
 
-def reap():
-    """Iterate through all regions to delete old volumes and snapshots."""
-    logger.info("Preparing to delete AWS volumes and snapshots.")
-    account = get_account()
-    now = get_now()
-    oldest_allowed_snapshot_age = now - datetime.timedelta(seconds=REAP_AGE_SNAPSHOTS)
-    oldest_allowed_volume_age = now - datetime.timedelta(seconds=REAP_AGE_VOLUMES)
-
-    total_volume_count = 0
-    total_volume_size = 0.0
-    total_snapshot_count = 0
-    total_snapshot_size = 0.0
+def is_image_expired(image, oldest_allowed):
+    """Check if the described image is older than allowed and may be deregistered."""
+    created = datetime.datetime.strptime(
+        image["CreationDate"], "%Y-%m-%dT%H:%M:%S.%f%z"
+    )
+    return created < oldest_allowed and not has_bypass_tag(image)
 
+
+@handle_dryrun()
+def deregister_image(ec2_client, image):
+    """Deregister the described image, keeping its snapshots for the sweep."""
     logger.info(
-        f"Finding volumes older than {oldest_allowed_volume_age} "
-        f"({REAP_AGE_VOLUMES} seconds old)"
+        "Deregistering ImageId %s (CreationDate='%s')",
+        image["ImageId"],
+        image["CreationDate"],
+        extra=logs.per_resource(
+            "Attempted to deregister", "images", metrics.get_client_region(ec2_client)
+        ),
     )
+    throttle.call(
+        ec2_client, "deregister_image", ImageId=image["ImageId"], DryRun=REAP_DRYRUN
+    )
+
+
+@handle_dryrun()
+def delete_snapshot(ec2_client, snapshot):
+    """Delete the candidate snapshot."""
     logger.info(
-        f"Finding snapshots older than {oldest_allowed_snapshot_age} "
-        f"({REAP_AGE_SNAPSHOTS} seconds old)"
+        "Deleting SnapshotId %s in %s (StartTime='%s' VolumeSize=%s)",
+        snapshot.id,
+        snapshot.region,
+        snapshot.timestamp,
+        snapshot.size,
+        extra=logs.per_resource("Attempted to delete", "snapshots", snapshot.region),
+    )
+    throttle.call(
+        ec2_client, "delete_snapshot", SnapshotId=snapshot.id, DryRun=REAP_DRYRUN
     )
-    try:
-        for region_name in get_region_names():
-            logger.info(f"Checking {region_name}")
-            ec2_client = boto3.client("ec2", region_name=region_name)
 
-            volume_count, volume_size = delete_old_volumes(
-                ec2_client, oldest_allowed_volume_age
-            )
-            total_volume_count += volume_count
-            total_volume_size += volume_size
 
-            snapshot_count, snapshot_size = delete_old_snapshots(
-                ec2_client, account, oldest_allowed_snapshot_age
-            )
-            total_snapshot_count += snapshot_count
-            total_snapshot_size += snapshot_size
-    except Exception as e:
-        logger.exception(e)
-        raise e
-    finally:
-        logger.info(
-            f"Deleted {total_volume_count} volumes "
-            f"having total {total_volume_size} GB"
+def plan_old_volumes(ec2_client, oldest_allowed_volume_age, account=None):
+    """
+    Add the volumes that delete_old_volumes would delete to the plan.
+
+    The account, if given, is saved with them so they can be applied with the
+    same role.
+
+    Nothing is deleted, not even with DryRun. Return a tuple of (count, size).
+    """
+    planned = Tally()
+    for volume in describe_volumes_to_delete(ec2_client, oldest_allowed_volume_age):
+        planned.add(volume.size)
+        aws_plan.add(
+            "volume", volume.id, volume.size, volume.timestamp, ec2_client, account
+        )
+        record_candidate(volume, "eligible")
+    logger.info("Planned %s volumes having total %s GB", planned.count, planned.size)
+    return planned.count, planned.size
+
+
+def plan_old_snapshots(ec2_client, account, oldest_allowed_snapshot_age):
+    """
+    Add the snapshots that delete_old_snapshots would delete to the plan.
+
+    Nothing is deleted and no image is deregistered, not even with DryRun.
+    Return a tuple of (count, size).
+    """
+    image_snapshot_ids = get_image_snapshot_ids(
+        ec2_client, account, oldest_allowed_snapshot_age, deregister=False
+    )
+    snapshots = describe_snapshots_to_delete(
+        ec2_client,
+        account,
+        oldest_allowed_snapshot_age,
+        image_snapshot_ids=image_snapshot_ids,
+    )
+    planned = Tally()
+    for snapshot in snapshots:
+        planned.add(snapshot.size)
+        aws_plan.add(
+            "snapshot",
+            snapshot.id,
+            snapshot.size,
+            snapshot.timestamp,
+            ec2_client,
+            account,
+        )
+        record_candidate(snapshot, "eligible")
+    logger.info("Planned %s snapshots having total %s GB", planned.count, planned.size)
+    return planned.count, planned.size
+
+
+def apply_plan_group(now, group):
+    """
+    Delete the volumes or snapshots in one group of a saved plan.
+
+    The planned resources are described again by ID and checked against the
+    current criteria before they are deleted, but images are never deregistered
+    because the plan did not include them. If the group's account is listed in
+    REAP_AWS_ACCOUNTS, its role is assumed. Return a tuple of (volume count,
+    volume size, snapshot count, snapshot size).
+    """
+    ec2_client = get_client(
+        "ec2", region_name=group["region"], role_arn=find_role_arn(group["account"])
+    )
+    resource_ids = [resource[0] for resource in group["resources"]]
+    totals = [0, 0.0, 0, 0.0]
+    if group["kind"] == "volume":
+        oldest_allowed = now - datetime.timedelta(seconds=REAP_AGE_VOLUMES)
+        for ids in batched(resource_ids, aws_schedule.MAX_IDS_PER_FILTER):
+            count, size = delete_old_volumes(ec2_client, oldest_allowed, ids)
+            totals[0] += count
+            totals[1] += size
+        return tuple(totals)
+    oldest_allowed = now - datetime.timedelta(seconds=REAP_AGE_SNAPSHOTS)
+    image_snapshot_ids = get_image_snapshot_ids(
+        ec2_client, group["account"], oldest_allowed, deregister=False
+    )
+    for ids in batched(resource_ids, aws_schedule.MAX_IDS_PER_FILTER):
+        count, size = delete_old_snapshots(
+            ec2_client, group["account"], oldest_allowed, ids, image_snapshot_ids
+        )
+        totals[2] += count
+        totals[3] += size
+    return tuple(totals)
+
+
+def is_sweep_needed(resource, ec2_client, account, region_name, oldest_allowed):
+    """
+    Check if the region's volumes or snapshots need a full sweep.
+
+    A region where last run's sweep described none of the resource (see
+    reaper.aws_history) is first probed with one small describe using the sweep's
+    own filters, and is skipped if that still finds nothing at all to evaluate.
+    """
+    if not aws_history.is_known_empty(account, region_name, resource):
+        return True
+    if resource == "volumes":
+        page = throttle.call(
+            ec2_client,
+            "describe_volumes",
+            Filters=aws_filters.get_volume_filters(oldest_allowed),
+            MaxResults=PROBE_PAGE_SIZE,
         )
-        logger.info(
-            f"Deleted {total_snapshot_count} snapshots "
-            f"having total {total_snapshot_size} GB"
+        found = page.get("Volumes")
+    else:
+        page = throttle.call(
+            ec2_client,
+            "describe_snapshots",
+            Filters=aws_filters.get_snapshot_filters(oldest_allowed),
+            OwnerIds=[account],
+            MaxResults=PROBE_PAGE_SIZE,
         )
+        found = page.get("Snapshots")
+    # With filters, EC2 may return an empty page that still has more to come.
+    if found or page.get("NextToken"):
+        return True
+    logger.info("Skipping %s in %s because there are none", resource, region_name)
+    return False
+
+
+def reap_due(kind, ec2_client, account, resource_ids, now, image_snapshot_ids=None):
+    """
+    Delete the given scheduled volumes or snapshots if they are still eligible.
+
+    Snapshots used by images are kept; the images are described first unless
+    image_snapshot_ids is given. Return a tuple of (volume count, volume size,
+    snapshot count, snapshot size).
+    """
+    if kind == "volume":
+        oldest_allowed = now - datetime.timedelta(seconds=REAP_AGE_VOLUMES)
+        count, size = delete_old_volumes(ec2_client, oldest_allowed, resource_ids)
+        return count, size, 0, 0.0
+    oldest_allowed = now - datetime.timedelta(seconds=REAP_AGE_SNAPSHOTS)
+    count, size = delete_old_snapshots(
+        ec2_client, account, oldest_allowed, resource_ids, image_snapshot_ids
+    )
+    return 0, 0.0, count, size
+
+
+def reap_scheduled(until):
+    """
+    Keep deleting scheduled volumes and snapshots as they become old enough.
+
+    Sleep until the next scheduled resource is eligible, then describe the due
+    resources again by ID (their tags may have changed since) and delete them.
+    Images are described once per region and account at each wake-up and never
+    deregistered here, like when applying a plan. Stop once nothing else becomes
+    eligible before `until`. Return a tuple of (volume count, volume size,
+    snapshot count, snapshot size).
+    """
+    totals = [0, 0.0, 0, 0.0]
+    while True:
+        next_eligible_at = aws_schedule.get_next_eligible_at()
+        if next_eligible_at is None or next_eligible_at > until:
+            return tuple(totals)
+        time.sleep(max(0.0, (next_eligible_at - get_now()).total_seconds()))
+        now = get_now()
+        due = aws_schedule.pop_due(now)
+        for (kind, ec2_client, account), resource_ids in due.items():
+            image_snapshot_ids = None
+            if kind == "snapshot":
+                try:
+                    image_snapshot_ids = get_image_snapshot_ids(
+                        ec2_client,
+                        account,
+                        now - datetime.timedelta(seconds=REAP_AGE_SNAPSHOTS),
+                        deregister=False,
+                    )
+                except Exception as e:
+                    logger.error(
+                        "Failed to reap scheduled %ss because %s", kind, e, exc_info=e
+                    )
+                    continue
+            for ids in batched(resource_ids, aws_schedule.MAX_IDS_PER_FILTER):
+                try:
+                    result = reap_due(
+                        kind, ec2_client, account, ids, now, image_snapshot_ids
+                    )
+                except Exception as e:
+                    logger.error(
+                        "Failed to reap scheduled %ss because %s", kind, e, exc_info=e
+                    )
+                    continue
+                totals = [total + value for total, value in zip(totals, result)]
+
+
+def reap():
+    """
+    Iterate through all regions of every account to delete old volumes and snapshots.
+
+    This is the same as `python -m reaper aws --resources volumes,snapshots`; see
+    reaper.aws_reap.reap.
+    """
+    # Imported here because reaper.aws_reap imports this module.
+    from reaper import aws_reap
+
+    aws_reap.reap(aws_reap.PLANNED_RESOURCES)
 
 
 if __name__ == "__main__":
+    configure_logging()
     reap()
@@ -0,0 +1,66 @@
+"""
+Plan the server-side filters for describing volumes and snapshots to delete.
+
+EC2 filters can only match values. They cannot negate a match, so the bypass tag
+must still be checked client-side, and they cannot compare timestamps, so the age
+cutoff can only be approximated with wildcard date prefixes. EC2 also has no
+projection: `--query` in the AWS CLI is applied client-side after the full
+response is downloaded, so there is nothing to gain from it here.
+
+With REAP_SERVER_AGE_FILTER, resources younger than the cutoff's day are not
+even returned, which is usually most of the describe payload. Everything the
+server cannot filter exactly is still checked in Python by the describe
+functions in reaper.aws_delete.
+"""
+
+from envparse import env
+
+REAP_SERVER_AGE_FILTER = env.bool("REAP_SERVER_AGE_FILTER", default=False)
+
+# Nothing in EBS can be older than EBS itself.
+EBS_FIRST_YEAR = 2008
+
+
+def get_age_prefixes(oldest_allowed):
+    """
+    Get wildcard values that match every timestamp on or before oldest_allowed's day.
+
+    Whole years, then whole months, then single days are matched by prefix, so
+    this never needs more than about 60 values. Resources created on the cutoff
+    day itself but after the cutoff time also match and must be filtered out
+    client-side.
+    """
+    year, month, day = oldest_allowed.year, oldest_allowed.month, oldest_allowed.day
+    prefixes = [f"{y}-*" for y in range(EBS_FIRST_YEAR, year)]
+    prefixes += [f"{year}-{m:02d}-*" for m in range(1, month)]
+    prefixes += [f"{year}-{month:02d}-{d:02d}*" for d in range(1, day + 1)]
+    return prefixes
+
+
+def get_volume_filters(oldest_allowed, volume_ids=None):
+    """Get the describe_volumes filters for volumes that may be deleted."""
+    # Yes, the described volume has "State", and the filter uses "status".
+    # This mismatch is a mystery, but multiple experiments confirm this works.
+    # "available" also means detached, so no attachment.status filter is needed.
+    filters = [{"Name": "status", "Values": ["available"]}]
+    if REAP_SERVER_AGE_FILTER:
+        filters.append(
+            {"Name": "create-time", "Values": get_age_prefixes(oldest_allowed)}
+        )
+    if volume_ids is not None:
+        filters.append({"Name": "volume-id", "Values": list(volume_ids)})
+    return filters
+
+
+def get_snapshot_filters(oldest_allowed, snapshot_ids=None):
+    """Get the describe_snapshots filters for snapshots that may be deleted."""
+    # Yes, the described snapshot has "State", and the filter uses "status".
+    # This mismatch is a mystery, but multiple experiments confirm this works.
+    filters = [{"Name": "status", "Values": ["completed"]}]
+    if REAP_SERVER_AGE_FILTER:
+        filters.append(
+            {"Name": "start-time", "Values": get_age_prefixes(oldest_allowed)}
+        )
+    if snapshot_ids is not None:
+        filters.append({"Name": "snapshot-id", "Values": list(snapshot_ids)})
+    return filters
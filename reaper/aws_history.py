@@ -0,0 +1,133 @@
+"""
+Remember how much work each region was between runs, and plan around it.
+
+If REAP_HISTORY_FILE names a JSON-lines file, every reaped region is recorded
+there with its wall time and how many volumes and snapshots its sweeps described.
+Later runs then:
+- start the regions that took longest first, so one huge region does not start
+  last and hold up the end of an otherwise finished run, and
+- probe regions where the sweep described nothing last time with one small
+  describe, and skip their full sweep if that still finds nothing to evaluate.
+
+Described rather than deleted resources are counted, because a region holding
+only young or protected resources would otherwise be probed and then swept in
+full on every run.
+
+Regions missing from the history are treated as the longest, since nothing is
+known about them yet.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from envparse import env
+
+logger = logging.getLogger(__name__)
+
+REAP_HISTORY_FILE = env("REAP_HISTORY_FILE", default="")
+
+_previous = {}
+_current = {}
+_described = {}
+_enabled = False
+_lock = threading.Lock()
+
+
+def load(path=None):
+    """Load the history of earlier runs and start recording this run."""
+    global _enabled
+    path = path if path is not None else REAP_HISTORY_FILE
+    with _lock:
+        _previous.clear()
+        _current.clear()
+        _described.clear()
+        _enabled = bool(path)
+        if not _enabled or not os.path.exists(path):
+            return
+        with open(path) as history_file:
+            for line in history_file:
+                entry = json.loads(line)
+                _previous[(entry["account"], entry["region"])] = entry
+    logger.info("Loaded the history of %s regions from %s", len(_previous), path)
+
+
+def order_regions(account, region_names):
+    """Sort region names by their last wall time, longest and unknown first."""
+    if not _enabled:
+        return list(region_names)
+    with _lock:
+        seconds = {
+            region_name: _previous[(account, region_name)]["seconds"]
+            for region_name in region_names
+            if (account, region_name) in _previous
+        }
+    return sorted(
+        region_names, key=lambda region_name: -seconds.get(region_name, float("inf"))
+    )
+
+
+def is_known_empty(account, region_name, resource):
+    """Check if the last run's sweep described none of the resource in the region."""
+    if not _enabled:
+        return False
+    with _lock:
+        entry = _previous.get((account, region_name), {})
+    return entry.get(resource) == 0
+
+
+def count_described(client, resource, described):
+    """
+    Generate the described resources while counting them for the regional client.
+
+    The count is added once the description is finished or abandoned.
+    """
+    count = 0
+    try:
+        for item in described:
+            count += 1
+            yield item
+    finally:
+        if _enabled and count:
+            with _lock:
+                key = (client, resource)
+                _described[key] = _described.get(key, 0) + count
+
+
+def pop_described(client, resource):
+    """Get and forget how many of the resource were described with the client."""
+    with _lock:
+        return _described.pop((client, resource), 0)
+
+
+def record(account, region_name, seconds, **counts):
+    """Record this run's wall time and counts of described resources for a region."""
+    if not _enabled:
+        return
+    with _lock:
+        entry = dict(_previous.get((account, region_name), {}))
+        entry.update(
+            counts,
+            account=account,
+            region=region_name,
+            seconds=seconds,
+            recorded_at=time.time(),
+        )
+        _current[(account, region_name)] = entry
+
+
+def save(path=None):
+    """Replace the history file, keeping regions this run did not reach."""
+    if not _enabled:
+        return
+    path = path if path is not None else REAP_HISTORY_FILE
+    with _lock:
+        history = {**_previous, **_current}
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as history_file:
+            for entry in history.values():
+                history_file.write(json.dumps(entry) + "\n")
+        os.replace(temp_path, path)
+    logger.info("Saved the history of %s regions to %s", len(history), path)
@@ -0,0 +1,80 @@
+"""
+Write the volumes and snapshots a run would delete to a plan, and read it back.
+
+`python -m reaper aws --plan FILE` describes and evaluates every region like a
+normal run but sends no mutating calls at all, not even DryRun ones, so it costs
+only the describe calls. Candidates are written as JSON lines, one line per
+account, region and kind, each with the reason they were chosen and a compact
+[id, size, created] triple per resource.
+
+`python -m reaper aws --apply FILE` describes the planned resources again by ID,
+so anything tagged, attached or deleted since planning is left alone, and
+deletes the rest with the usual concurrent delete path.
+"""
+
+import json
+import logging
+import os
+import threading
+
+from reaper import metrics
+
+logger = logging.getLogger(__name__)
+
+REASONS = {
+    "volume": "available, unattached, older than allowed and not protected",
+    "snapshot": "completed, unused by images, older than allowed and not protected",
+}
+
+_groups = {}
+_lock = threading.Lock()
+
+
+def add(kind, resource_id, size, created_at, ec2_client, account=None):
+    """Add a volume or snapshot that would be deleted to the plan."""
+    key = (account, metrics.get_client_region(ec2_client), kind)
+    with _lock:
+        _groups.setdefault(key, []).append([resource_id, size, created_at.isoformat()])
+
+
+def clear():
+    """Forget every planned resource."""
+    with _lock:
+        _groups.clear()
+
+
+def save(path):
+    """Replace the plan file with every planned resource."""
+    with _lock:
+        groups = sorted(_groups.items(), key=lambda item: tuple(map(str, item[0])))
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as plan_file:
+        for (account, region, kind), resources in groups:
+            group = {
+                "account": account,
+                "region": region,
+                "kind": kind,
+                "reason": REASONS[kind],
+                "resources": resources,
+            }
+            plan_file.write(json.dumps(group, separators=(",", ":")) + "\n")
+    os.replace(temp_path, path)
+    logger.info(
+        "Saved a plan for %s resources in %s groups to %s",
+        sum(len(resources) for _, resources in groups),
+        len(groups),
+        path,
+    )
+
+
+def load(path):
+    """Load the groups of a saved plan as dicts."""
+    with open(path) as plan_file:
+        groups = [json.loads(line) for line in plan_file if line.strip()]
+    logger.info(
+        "Loaded a plan for %s resources in %s groups from %s",
+        sum(len(group["resources"]) for group in groups),
+        len(groups),
+        path,
+    )
+    return groups
@@ -0,0 +1,352 @@
+"""
+Run every AWS reaper over a single fan-out of regions.
+
+Regions are discovered once per account and then reaped concurrently. If
+REAP_AWS_ACCOUNTS lists account IDs or role ARNs, a role is assumed in each of
+those accounts and they are reaped concurrently too. Within each region the
+selected resources are reaped in dependency order: auto scaling groups are zeroed
+before instances are stopped (so they are not immediately replaced), and
+instances are stopped before volumes and snapshots are swept.
+
+A run can instead only plan which volumes and snapshots to delete, and a saved
+plan can be applied later (see reaper.aws_plan).
+"""
+
+import datetime
+import logging
+import time
+from functools import partial
+
+from reaper import (
+    AWS_RESOURCES,
+    aws_delete,
+    aws_history,
+    aws_plan,
+    aws_schedule,
+    aws_state,
+    aws_stop_instances,
+    aws_zero_autoscaling,
+    metrics,
+    throttle,
+)
+from reaper.aws_clients import get_client
+from reaper.concurrency import map_concurrently
+
+logger = logging.getLogger(__name__)
+
+RESOURCES = AWS_RESOURCES
+PLANNED_RESOURCES = ("volumes", "snapshots")
+
+
+def reap_resource(
+    resource, region_name, account, oldest_allowed, planning=False, role_arn=None
+):
+    """
+    Reap (or only plan to reap) one kind of resource in one region.
+
+    Use the default credentials if role_arn is None.
+    """
+    if resource == "autoscaling":
+        return aws_zero_autoscaling.reap_region(region_name, role_arn=role_arn)
+    if resource == "instances":
+        return aws_stop_instances.reap_region(region_name, role_arn=role_arn)
+    ec2_client = get_client("ec2", region_name=region_name, role_arn=role_arn)
+    if not aws_delete.is_sweep_needed(
+        resource, ec2_client, account, region_name, oldest_allowed[resource]
+    ):
+        return 0, 0.0
+    if planning and resource == "volumes":
+        return aws_delete.plan_old_volumes(
+            ec2_client, oldest_allowed["volumes"], account
+        )
+    if planning:
+        return aws_delete.plan_old_snapshots(
+            ec2_client, account, oldest_allowed["snapshots"]
+        )
+    if resource == "volumes":
+        return aws_delete.delete_old_volumes(ec2_client, oldest_allowed["volumes"])
+    return aws_delete.delete_old_snapshots(
+        ec2_client, account, oldest_allowed["snapshots"]
+    )
+
+
+def reap_region(
+    resources, account, oldest_allowed, region_name, planning=False, role_arn=None
+):
+    """
+    Reap the selected resources in a single region in dependency order.
+
+    A failure reaping one kind of resource is logged and does not stop the rest.
+    Return a tuple of ({resource: result}, [failed resources]).
+    """
+    logger.info("Checking %s", region_name)
+    start = time.monotonic()
+    results, failed_resources = {}, []
+    with metrics.timer("reaper_region_seconds", account=account, region=region_name):
+        for resource in RESOURCES:
+            if resource not in resources:
+                continue
+            try:
+                with metrics.timer(
+                    "reaper_resource_seconds",
+                    account=account,
+                    resource=resource,
+                    region=region_name,
+                ):
+                    results[resource] = reap_resource(
+                        resource,
+                        region_name,
+                        account,
+                        oldest_allowed,
+                        planning,
+                        role_arn,
+                    )
+            except Exception as e:
+                logger.error(
+                    "Failed to reap %s in %s because %s",
+                    resource,
+                    region_name,
+                    e,
+                    exc_info=e,
+                )
+                failed_resources.append(resource)
+    # The history keeps how many resources each sweep described, not how many it
+    # reaped, so regions holding only young or protected ones are not probed.
+    ec2_client = get_client("ec2", region_name=region_name, role_arn=role_arn)
+    aws_history.record(
+        account,
+        region_name,
+        time.monotonic() - start,
+        **{
+            resource: aws_history.pop_described(ec2_client, resource)
+            for resource in PLANNED_RESOURCES
+            if resource in results
+        },
+    )
+    return results, failed_resources
+
+
+def new_totals(resources=RESOURCES):
+    """Get zeroed totals: a count for each resource, plus a size for some."""
+    return {
+        resource: [0, 0.0] if resource in PLANNED_RESOURCES else 0
+        for resource in resources
+    }
+
+
+def add_totals(totals, results):
+    """Add the results of reaping a region or an account to the totals."""
+    for resource, value in results.items():
+        if resource in PLANNED_RESOURCES:
+            totals[resource][0] += value[0]
+            totals[resource][1] += value[1]
+        else:
+            totals[resource] += value
+
+
+def reap_account(resources, oldest_allowed, role_arn, planning=False):
+    """
+    Reap the selected resources in every region of one account.
+
+    Use the default credentials if role_arn is None. Return a tuple of (account,
+    totals, failures).
+    """
+    # Always resolved, even without snapshots, because it keys the region history.
+    account = aws_delete.get_account(role_arn)
+    totals = new_totals()
+    failures = []
+    for region_name, result, exception in map_concurrently(
+        partial(
+            reap_region,
+            resources,
+            account,
+            oldest_allowed,
+            planning=planning,
+            role_arn=role_arn,
+        ),
+        aws_history.order_regions(account, aws_delete.get_region_names(role_arn)),
+        aws_delete.REAP_REGION_CONCURRENCY,
+    ):
+        if exception:
+            logger.error(
+                "Failed to reap %s because %s",
+                region_name,
+                exception,
+                exc_info=exception,
+            )
+            failures.append(region_name)
+            continue
+        results, failed_resources = result
+        failures.extend(f"{resource} in {region_name}" for resource in failed_resources)
+        add_totals(totals, results)
+    return account, totals, failures
+
+
+def reap(resources=RESOURCES, until=None, plan=None):
+    """
+    Iterate through all regions of every account to reap the selected resources.
+
+    If until is a datetime, keep running afterwards to delete volumes and
+    snapshots that become old enough before then. If plan is a file path, only
+    write the volumes and snapshots that would be deleted to that plan. Regions
+    are started longest first according to REAP_HISTORY_FILE, if set.
+
+    If REAP_AWS_ACCOUNTS lists account IDs or role ARNs, assume a role in each of
+    those accounts and reap them concurrently, logging totals for each account and
+    then for all of them. Otherwise, reap only the account of the default
+    credentials.
+    """
+    if plan:
+        resources = tuple(r for r in resources if r in PLANNED_RESOURCES)
+        logger.info("Planning to reap AWS %s into %s.", ", ".join(resources), plan)
+    else:
+        logger.info("Preparing to reap AWS %s.", ", ".join(resources))
+    verb = "Planned to delete" if plan else "Deleted"
+    now = aws_delete.get_now()
+    oldest_allowed = {
+        "volumes": now - datetime.timedelta(seconds=aws_delete.REAP_AGE_VOLUMES),
+        "snapshots": now - datetime.timedelta(seconds=aws_delete.REAP_AGE_SNAPSHOTS),
+    }
+
+    totals = new_totals()
+    aws_state.load()
+    aws_history.load()
+    aws_schedule.clear()
+    aws_plan.clear()
+    metrics.reset()
+    try:
+        failures = []
+        for role_arn, result, exception in map_concurrently(
+            partial(reap_account, resources, oldest_allowed, planning=bool(plan)),
+            aws_delete.get_role_arns(),
+            aws_delete.REAP_ACCOUNT_CONCURRENCY,
+        ):
+            if exception:
+                logger.error(
+                    "Failed to reap %s because %s",
+                    role_arn,
+                    exception,
+                    exc_info=exception,
+                )
+                failures.append(str(role_arn))
+                continue
+            account, account_totals, account_failures = result
+            if role_arn:
+                failures.extend(
+                    f"{failure} in {account}" for failure in account_failures
+                )
+                log_totals(resources, account_totals, verb, account)
+            else:
+                failures.extend(account_failures)
+            add_totals(totals, account_totals)
+        if not plan:
+            # Rated over the sweep only, so that --until's waiting and trickle of
+            # scheduled deletes do not dilute it.
+            for resource in PLANNED_RESOURCES:
+                metrics.set_rate(
+                    "reaper_deletes_per_second", totals[resource][0], resource=resource
+                )
+        if until:
+            logger.info("Reaping volumes and snapshots as they age until %s", until)
+            volume_count, volume_size, snapshot_count, snapshot_size = (
+                aws_delete.reap_scheduled(until)
+            )
+            add_totals(
+                totals,
+                {
+                    "volumes": (volume_count, volume_size),
+                    "snapshots": (snapshot_count, snapshot_size),
+                },
+            )
+        if failures:
+            raise RuntimeError(f"Failed to reap {', '.join(sorted(failures))}")
+        if plan:
+            aws_plan.save(plan)
+    except Exception as e:
+        logger.exception(e)
+        raise e
+    finally:
+        aws_state.save()
+        aws_history.save()
+        aws_schedule.save_report()
+        metrics.write_reports()
+        log_summary(resources, totals, verb=verb)
+
+
+def apply(plan):
+    """Delete the volumes and snapshots in a plan saved by reap."""
+    groups = aws_plan.load(plan)
+    totals = new_totals(PLANNED_RESOURCES)
+    aws_state.load()
+    aws_schedule.clear()
+    metrics.reset()
+    try:
+        failures = []
+        for group, result, exception in map_concurrently(
+            partial(aws_delete.apply_plan_group, aws_delete.get_now()),
+            groups,
+            aws_delete.REAP_REGION_CONCURRENCY,
+        ):
+            if exception:
+                logger.error(
+                    "Failed to reap planned %ss in %s because %s",
+                    group["kind"],
+                    group["region"],
+                    exception,
+                    exc_info=exception,
+                )
+                failures.append(f"{group['kind']}s in {group['region']}")
+                continue
+            volume_count, volume_size, snapshot_count, snapshot_size = result
+            add_totals(
+                totals,
+                {
+                    "volumes": (volume_count, volume_size),
+                    "snapshots": (snapshot_count, snapshot_size),
+                },
+            )
+        if failures:
+            raise RuntimeError(f"Failed to reap {', '.join(sorted(failures))}")
+    except Exception as e:
+        logger.exception(e)
+        raise e
+    finally:
+        aws_state.save()
+        for resource in PLANNED_RESOURCES:
+            metrics.set_rate(
+                "reaper_deletes_per_second", totals[resource][0], resource=resource
+            )
+        metrics.write_reports()
+        log_summary(PLANNED_RESOURCES, totals)
+
+
+def log_totals(resources, totals, verb="Deleted", account=None):
+    """Log the totals for the selected resources, optionally for one account."""
+    suffix, args = (" in account %s", (account,)) if account else ("", ())
+    if "autoscaling" in resources:
+        logger.info(
+            f"Scaled down %s auto scaling groups{suffix}", totals["autoscaling"], *args
+        )
+    if "instances" in resources:
+        logger.info(f"Stopped %s instances{suffix}", totals["instances"], *args)
+    if "volumes" in resources:
+        logger.info(
+            f"{verb} %s volumes having total %s GB{suffix}", *totals["volumes"], *args
+        )
+    if "snapshots" in resources:
+        logger.info(
+            f"{verb} %s snapshots having total %s GB{suffix}",
+            *totals["snapshots"],
+            *args,
+        )
+
+
+def log_summary(resources, totals, verb="Deleted"):
+    """Log one consolidated summary for the selected resources."""
+    log_totals(resources, totals, verb)
+    throttle_stats = throttle.get_stats()
+    logger.info(
+        "Throttled %s API calls and retried %s failed calls",
+        throttle_stats["throttles"],
+        throttle_stats["retries"],
+    )
@@ -0,0 +1,108 @@
+"""
+Schedule volumes and snapshots that are not old enough to delete yet.
+
+Every resource that the scan skips only because it is too young is pushed onto a
+heap keyed by when it will become old enough. The heap can be written out as a
+report (REAP_SCHEDULE_FILE) and drives `python -m reaper aws --until`, which
+keeps deleting resources as they age out instead of rescanning on a cron.
+
+Only resources the scan actually saw are scheduled, so with
+REAP_SERVER_AGE_FILTER the schedule covers just the cutoff day.
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import threading
+from collections import namedtuple
+
+from envparse import env
+
+logger = logging.getLogger(__name__)
+
+REAP_SCHEDULE_FILE = env("REAP_SCHEDULE_FILE", default="")
+
+# EC2 accepts at most 200 values in a single filter.
+MAX_IDS_PER_FILTER = 200
+
+# The unique sequence number breaks ties so clients are never compared.
+ScheduledReap = namedtuple(
+    "ScheduledReap",
+    ["eligible_at", "sequence", "kind", "resource_id", "size", "ec2_client", "account"],
+)
+
+_schedule = []
+_sequence = itertools.count()
+_lock = threading.Lock()
+
+
+def add(eligible_at, kind, resource_id, size, ec2_client, account=None):
+    """Schedule the resource to be reaped once it is eligible."""
+    with _lock:
+        heapq.heappush(
+            _schedule,
+            ScheduledReap(
+                eligible_at,
+                next(_sequence),
+                kind,
+                resource_id,
+                size,
+                ec2_client,
+                account,
+            ),
+        )
+
+
+def clear():
+    """Forget every scheduled resource."""
+    with _lock:
+        _schedule.clear()
+
+
+def get_next_eligible_at():
+    """Get when the next scheduled resource becomes eligible, if there is one."""
+    with _lock:
+        return _schedule[0].eligible_at if _schedule else None
+
+
+def pop_due(now):
+    """
+    Remove every resource that is eligible by now from the schedule.
+
+    Return a dict of {(kind, ec2_client, account): [resource IDs]}.
+    """
+    due = {}
+    with _lock:
+        while _schedule and _schedule[0].eligible_at <= now:
+            scheduled = heapq.heappop(_schedule)
+            key = (scheduled.kind, scheduled.ec2_client, scheduled.account)
+            due.setdefault(key, []).append(scheduled.resource_id)
+    return due
+
+
+def save_report(path=None):
+    """Write the schedule in eligibility order as JSON lines, if enabled."""
+    path = path if path is not None else REAP_SCHEDULE_FILE
+    if not path:
+        return
+    with _lock:
+        schedule = sorted(_schedule)
+    with open(path, "w") as report_file:
+        for scheduled in schedule:
+            meta = getattr(scheduled.ec2_client, "meta", None)
+            report = {
+                "eligible_at": scheduled.eligible_at.isoformat(),
+                "kind": scheduled.kind,
+                "id": scheduled.resource_id,
+                "size": scheduled.size,
+                "region": getattr(meta, "region_name", None),
+                "account": scheduled.account,
+            }
+            report_file.write(json.dumps(report, default=str) + "\n")
+    if schedule:
+        logger.info(
+            "Scheduled %s resources; the next becomes eligible at %s",
+            len(schedule),
+            schedule[0].eligible_at,
+        )
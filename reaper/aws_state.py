@@ -0,0 +1,140 @@
+"""
+Remember what was decided about each volume and snapshot between runs.
+
+If REAP_STATE_FILE names a JSON-lines file, every evaluated resource is recorded
+there with its decision and a fingerprint of its tags. Later runs then skip
+resources that are settled (protected by the bypass tag, or still in use after a
+delete attempt) without re-evaluating or re-deleting them, and log how decisions
+changed since the last run.
+
+A settled decision is trusted only while the resource's tags are unchanged and
+for at most REAP_STATE_TTL seconds after it was made. Resources are still
+described every run: the describe response is the only way to see tag changes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from envparse import env
+
+logger = logging.getLogger(__name__)
+
+REAP_STATE_FILE = env("REAP_STATE_FILE", default="")
+REAP_STATE_TTL = env.int("REAP_STATE_TTL", default=24 * 60 * 60)
+
+SETTLED_DECISIONS = {"protected", "in_use"}
+
+_previous = {}
+_current = {}
+_enabled = False
+_lock = threading.Lock()
+
+
+def get_fingerprint(tags):
+    """Get a short fingerprint of a described resource's tags."""
+    pairs = sorted((tag.get("Key"), tag.get("Value")) for tag in tags or [])
+    return hashlib.sha1(json.dumps(pairs).encode()).hexdigest()[:16]
+
+
+def load(path=None, now=None):
+    """Load the unexpired records of the last run and start recording this run."""
+    global _enabled
+    path = path if path is not None else REAP_STATE_FILE
+    now = now if now is not None else time.time()
+    with _lock:
+        _previous.clear()
+        _current.clear()
+        _enabled = bool(path)
+        if not _enabled or not os.path.exists(path):
+            return
+        with open(path) as state_file:
+            for line in state_file:
+                record = json.loads(line)
+                if now - record["evaluated_at"] <= REAP_STATE_TTL:
+                    _previous[record["id"]] = record
+    logger.info("Loaded %s resource records from %s", len(_previous), path)
+
+
+def is_settled(resource_id, tags):
+    """
+    Check if the resource was settled by an earlier run and can be skipped.
+
+    A settled resource is carried over into this run's records unchanged.
+    """
+    if not _enabled:
+        return False
+    with _lock:
+        record = _previous.get(resource_id)
+        if (
+            record is None
+            or record["decision"] not in SETTLED_DECISIONS
+            or record["tags"] != get_fingerprint(tags)
+        ):
+            return False
+        _current[resource_id] = record
+        return True
+
+
+def is_enabled():
+    """Check if this run's decisions are being recorded."""
+    return _enabled
+
+
+def record(resource_id, tags, decision, now=None):
+    """Record this run's decision about the resource."""
+    if not _enabled:
+        return
+    record_fingerprint(resource_id, get_fingerprint(tags), decision, now)
+
+
+def record_fingerprint(resource_id, fingerprint, decision, now=None):
+    """Record this run's decision about a resource whose tags were fingerprinted."""
+    if not _enabled:
+        return
+    with _lock:
+        _current[resource_id] = {
+            "id": resource_id,
+            "decision": decision,
+            "tags": fingerprint,
+            "evaluated_at": now if now is not None else time.time(),
+        }
+
+
+def get_changes():
+    """Count the (old decision, new decision) changes since the last run."""
+    with _lock:
+        changes = Counter()
+        for resource_id, current in _current.items():
+            previous = _previous.get(resource_id)
+            old_decision = previous["decision"] if previous else "new"
+            if old_decision != current["decision"]:
+                changes[(old_decision, current["decision"])] += 1
+        for resource_id in _previous.keys() - _current.keys():
+            changes[(_previous[resource_id]["decision"], "gone")] += 1
+        return changes
+
+
+def save(path=None):
+    """Log what changed since the last run and replace the state file."""
+    if not _enabled:
+        return
+    path = path if path is not None else REAP_STATE_FILE
+    for (old_decision, new_decision), count in sorted(get_changes().items()):
+        logger.info(
+            "%s resources went from %s to %s since the last run",
+            count,
+            old_decision,
+            new_decision,
+        )
+    with _lock:
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as state_file:
+            for current in _current.values():
+                state_file.write(json.dumps(current) + "\n")
+        os.replace(temp_path, path)
+        logger.info("Saved %s resource records to %s", len(_current), path)
@@ -0,0 +1,142 @@
+"""Stop running EC2 instances that are not tagged for bypass."""
+
+import logging
+
+from botocore.exceptions import ClientError
+
+from reaper import configure_logging, throttle
+from reaper.aws_clients import get_client
+from reaper.aws_delete import (
+    REAP_DRYRUN,
+    REAP_PAGE_SIZE,
+    handle_dryrun,
+    has_bypass_tag,
+)
+from reaper.concurrency import batched
+
+logger = logging.getLogger(__name__)
+
+INSTANCE_STATE_CODE_RUNNING = "16"
+MAX_INSTANCE_IDS_PER_CALL = 1000
+
+# Errors that may be caused by just one instance in a batch. Anything else, such
+# as UnauthorizedOperation, would fail the same way for every instance alone.
+INSTANCE_ERROR_CODES = {"IncorrectInstanceState", "UnsupportedOperation"}
+INSTANCE_ERROR_CODE_PREFIXES = ("InvalidInstanceID.",)
+
+
+def describe_instances_to_stop(ec2_client):
+    """Generate the IDs of running instances that do not have the bypass tag."""
+    reservations = throttle.paginate(
+        ec2_client,
+        "describe_instances",
+        "Reservations",
+        Filters=[
+            {"Name": "instance-state-code", "Values": [INSTANCE_STATE_CODE_RUNNING]}
+        ],
+        MaxResults=REAP_PAGE_SIZE,
+    )
+    for reservation in reservations:
+        for instance in reservation["Instances"]:
+            if has_bypass_tag(instance):
+                logger.info(
+                    "Instance %s has bypass tag and will not be stopped.",
+                    instance["InstanceId"],
+                )
+                continue
+            yield instance["InstanceId"]
+
+
+@handle_dryrun()
+def stop_instances(ec2_client, instance_ids):
+    """Stop the given instances with a single API call."""
+    logger.info("Stopping instances %s", ", ".join(instance_ids))
+    throttle.call(
+        ec2_client, "stop_instances", InstanceIds=instance_ids, DryRun=REAP_DRYRUN
+    )
+
+
+def stop_running_instances(ec2_client):
+    """
+    Stop all running instances that do not have the bypass tag.
+
+    Instances are stopped in batches. If EC2 rejects a whole batch because of
+    one of its instances, for example one that changed state since it was
+    described, each instance in that batch is retried alone so one bad ID cannot
+    protect the rest. A batch rejected for any other reason is logged as failed.
+    """
+    instance_ids = describe_instances_to_stop(ec2_client)
+    total_count = 0
+    for batch in batched(instance_ids, MAX_INSTANCE_IDS_PER_CALL):
+        try:
+            stop_instances(ec2_client, batch)
+            total_count += len(batch)
+            continue
+        except ClientError as exception:
+            if len(batch) == 1:
+                log_stop_failure(batch[0], exception)
+                continue
+            if not is_instance_error(exception):
+                logger.error(
+                    "Failed to stop a batch of %s instances because %s; %s",
+                    len(batch),
+                    exception.response.get("Error", {}).get("Code"),
+                    exception,
+                )
+                continue
+            logger.info("Failed to stop a batch of instances; retrying one by one")
+        for instance_id in batch:
+            try:
+                stop_instances(ec2_client, [instance_id])
+                total_count += 1
+            except ClientError as exception:
+                log_stop_failure(instance_id, exception)
+    return total_count
+
+
+def is_instance_error(exception):
+    """Check if the ClientError may have been caused by a single instance."""
+    error_code = exception.response.get("Error", {}).get("Code", "")
+    return error_code in INSTANCE_ERROR_CODES or error_code.startswith(
+        INSTANCE_ERROR_CODE_PREFIXES
+    )
+
+
+def log_stop_failure(instance_id, exception):
+    """Log why the given instance could not be stopped."""
+    error_code = exception.response.get("Error", {}).get("Code")
+    logger.error(
+        "Failed to stop instance %s because %s; %s",
+        instance_id,
+        error_code,
+        exception,
+    )
+
+
+def reap_region(region_name, role_arn=None):
+    """
+    Stop running instances in a single region and return how many stopped.
+
+    Use the default credentials if role_arn is None.
+    """
+    logger.info("Checking %s for running instances", region_name)
+    ec2_client = get_client("ec2", region_name=region_name, role_arn=role_arn)
+    return stop_running_instances(ec2_client)
+
+
+def reap():
+    """
+    Iterate through all regions of every account to stop running instances.
+
+    This is the same as `python -m reaper aws --resources instances`; see
+    reaper.aws_reap.reap.
+    """
+    # Imported here because reaper.aws_reap imports this module.
+    from reaper import aws_reap
+
+    aws_reap.reap(("instances",))
+
+
+if __name__ == "__main__":
+    configure_logging()
+    reap()
@@ -0,0 +1,113 @@
+"""Scale AWS auto scaling groups down to zero capacity."""
+
+import logging
+
+from botocore.exceptions import ClientError
+
+from reaper import configure_logging, throttle
+from reaper.aws_clients import get_client
+from reaper.aws_delete import (
+    REAP_DRYRUN,
+    has_bypass_tag,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_RECORDS_PER_PAGE = 100  # the most describe_auto_scaling_groups allows
+
+
+def is_scaled_down(group):
+    """Check if the described auto scaling group is already at zero capacity."""
+    return group["MinSize"] == group["MaxSize"] == group["DesiredCapacity"] == 0
+
+
+def describe_groups_to_scale_down(autoscaling_client):
+    """Generate described auto scaling groups that need to be scaled down."""
+    groups = throttle.paginate(
+        autoscaling_client,
+        "describe_auto_scaling_groups",
+        "AutoScalingGroups",
+        MaxRecords=MAX_RECORDS_PER_PAGE,
+    )
+    for group in groups:
+        if has_bypass_tag(group):
+            logger.info(
+                "Auto scaling group %s has bypass tag and will not be scaled down.",
+                group["AutoScalingGroupName"],
+            )
+            continue
+        if is_scaled_down(group):
+            continue
+        yield group
+
+
+def scale_down_group(autoscaling_client, group):
+    """Set the described auto scaling group's capacity to zero."""
+    name = group["AutoScalingGroupName"]
+    if REAP_DRYRUN:
+        logger.info("Skipping scale down of %s due to REAP_DRYRUN", name)
+        return
+    logger.info(
+        "Scaling down %s (MinSize=%s MaxSize=%s DesiredCapacity=%s)",
+        name,
+        group["MinSize"],
+        group["MaxSize"],
+        group["DesiredCapacity"],
+    )
+    throttle.call(
+        autoscaling_client,
+        "update_auto_scaling_group",
+        AutoScalingGroupName=name,
+        MinSize=0,
+        MaxSize=0,
+        DesiredCapacity=0,
+    )
+
+
+def scale_down_groups(autoscaling_client):
+    """Scale down every auto scaling group that needs it and return the count."""
+    total_count = 0
+    for group in describe_groups_to_scale_down(autoscaling_client):
+        try:
+            scale_down_group(autoscaling_client, group)
+            total_count += 1
+        except ClientError as exception:
+            error_code = exception.response.get("Error", {}).get("Code")
+            logger.error(
+                "Failed to scale down %s because %s; %s",
+                group["AutoScalingGroupName"],
+                error_code,
+                exception,
+            )
+    return total_count
+
+
+def reap_region(region_name, role_arn=None):
+    """
+    Scale down auto scaling groups in a single region and return the count.
+
+    Use the default credentials if role_arn is None.
+    """
+    logger.info("Checking %s for auto scaling groups", region_name)
+    autoscaling_client = get_client(
+        "autoscaling", region_name=region_name, role_arn=role_arn
+    )
+    return scale_down_groups(autoscaling_client)
+
+
+def reap():
+    """
+    Iterate through all regions of every account to scale down auto scaling groups.
+
+    This is the same as `python -m reaper aws --resources autoscaling`; see
+    reaper.aws_reap.reap.
+    """
+    # Imported here because reaper.aws_reap imports this module.
+    from reaper import aws_reap
+
+    aws_reap.reap(("autoscaling",))
+
+
+if __name__ == "__main__":
+    configure_logging()
+    reap()
@@ -1,28 +1,109 @@
-"""Shut down running Azure VMs."""
+"""
+Shut down running Azure VMs.
+
+By default only AZURE_SUBSCRIPTION_ID is reaped. AZURE_SUBSCRIPTION_IDS may list
+several subscriptions instead, or be "all" to reap every enabled subscription the
+credential can see. Every subscription shares one credential (and so one token
+cache), and up to REAP_SUBSCRIPTION_CONCURRENCY subscriptions are reaped at once.
+"""
 
 import logging
+import time
+from collections import Counter, namedtuple
+from functools import partial
 
+from azure.core.pipeline.policies import RetryPolicy
+from azure.core.rest import HttpRequest
 from azure.identity import EnvironmentCredential
 from azure.mgmt.compute import ComputeManagementClient
+from azure.mgmt.compute.models import VirtualMachineScaleSetVMInstanceIDs
+from azure.mgmt.core import ARMPipelineClient
+from azure.mgmt.core.policies import ARMChallengeAuthenticationPolicy
 from envparse import env
 
+from reaper import configure_logging, metrics
+from reaper.concurrency import batched, map_concurrently
+
 logger = logging.getLogger(__name__)
 
 REAP_BYPASS_TAG = env("REAP_BYPASS_TAG", default="do-not-delete")
+REAP_POWER_OFF_CONCURRENCY = env.int("REAP_POWER_OFF_CONCURRENCY", default=10)
+REAP_POWER_OFF_TIMEOUT = env.int("REAP_POWER_OFF_TIMEOUT", default=15 * 60)
+REAP_SCALE_SET_CONCURRENCY = env.int("REAP_SCALE_SET_CONCURRENCY", default=10)
+REAP_SCALE_SET_BATCH_SIZE = env.int("REAP_SCALE_SET_BATCH_SIZE", default=100)
+REAP_SUBSCRIPTION_CONCURRENCY = env.int("REAP_SUBSCRIPTION_CONCURRENCY", default=1)
+
+ARM_URL = "https://management.azure.com"
+ARM_SCOPE = f"{ARM_URL}/.default"
+SUBSCRIPTIONS_API_VERSION = "2022-12-01"
+
+POWER_STATE_RUNNING = "PowerState/running"
 
+# Just enough about a regular VM to decide whether and how to power it off.
+VmRecord = namedtuple(
+    "VmRecord", ["id", "name", "resource_group", "has_bypass_tag", "power_state"]
+)
 
-def get_azure_compute_client(azure_subscription_id):
+
+def get_azure_compute_client(azure_subscription_id, credential=None):
     """Get an Azure compute management client."""
-    return ComputeManagementClient(EnvironmentCredential(), azure_subscription_id)
+    if credential is None:
+        credential = EnvironmentCredential()
+    return ComputeManagementClient(credential, azure_subscription_id)
 
 
-def vm_is_running(vm):
-    """Return true if the vm specified has a PowerState/running state."""
+def list_subscription_ids(credential):
+    """Generate the ID of every enabled subscription the credential can see."""
+    # azure-mgmt-resource has a SubscriptionClient for this, but a plain ARM
+    # pipeline is all it takes and saves us another SDK dependency.
+    client = ARMPipelineClient(
+        base_url=ARM_URL,
+        policies=[
+            RetryPolicy(),
+            ARMChallengeAuthenticationPolicy(credential, ARM_SCOPE),
+        ],
+    )
+    # send_request does not resolve relative URLs against base_url, and the
+    # authentication policy refuses anything that is not https.
+    url = f"{ARM_URL}/subscriptions?api-version={SUBSCRIPTIONS_API_VERSION}"
+    while url:
+        response = client.send_request(HttpRequest("GET", url))
+        response.raise_for_status()
+        page = response.json()
+        for subscription in page.get("value", []):
+            if subscription.get("state") != "Enabled":
+                logger.info(
+                    "Subscription %s is %s and will not be reaped.",
+                    subscription["subscriptionId"],
+                    subscription.get("state"),
+                )
+                continue
+            yield subscription["subscriptionId"]
+        url = page.get("nextLink")
+
+
+def get_subscription_ids(credential):
+    """Get the IDs of the subscriptions to reap."""
+    subscription_ids = env.list("AZURE_SUBSCRIPTION_IDS", default=[])
+    if subscription_ids == ["all"]:
+        return list(list_subscription_ids(credential))
+    return subscription_ids or [env("AZURE_SUBSCRIPTION_ID")]
+
+
+def get_power_state(vm):
+    """Get the PowerState/... status code of the given VM, if it has one."""
     if vm and vm.instance_view:
         for status in vm.instance_view.statuses:
-            if status.code == "PowerState/running":
-                logger.info(f"Found running VM {vm.name}")
-                return True
+            if status.code and status.code.startswith("PowerState/"):
+                return status.code
+    return None
+
+
+def vm_is_running(vm):
+    """Return true if the vm specified has a PowerState/running state."""
+    if get_power_state(vm) == POWER_STATE_RUNNING:
+        logger.info(f"Found running VM {vm.name}")
+        return True
     return False
 
 
@@ -42,16 +123,55 @@ def get_resource_group_name(resource):
 
 
 def power_off_vm(compute_client, vm):
-    """Power off the given VM."""
+    """Begin powering off the given VM and return its LROPoller."""
     resource_group = get_resource_group_name(vm)
-    # Note: begin_power_off returns an LROPoller object that we could repeatedly
-    # poll until the operation is done, but we don't need to monitor this here.
-    # We can just discard the result and assume it completes.
-    compute_client.virtual_machines.begin_power_off(resource_group, vm.name)
+    return compute_client.virtual_machines.begin_power_off(resource_group, vm.name)
+
+
+def power_off_all(power_offs):
+    """
+    Begin power-offs concurrently and wait for all of them to finish.
+
+    power_offs is an iterable of (name, VM count, function) tuples where each
+    function begins one power-off of that many VMs and returns its LROPoller. Up
+    to REAP_POWER_OFF_CONCURRENCY power-offs are begun at once, and then every
+    poller gets until a shared deadline REAP_POWER_OFF_TIMEOUT seconds from now
+    to finish.
+
+    Return a Counter of how many VMs were "stopped", "failed", or "timed_out".
+    """
+    deadline = time.monotonic() + REAP_POWER_OFF_TIMEOUT
+    outcomes = Counter(stopped=0, failed=0, timed_out=0)
+    pollers = []
+    for (name, count, _), poller, exception in map_concurrently(
+        lambda power_off: power_off[2](), power_offs, REAP_POWER_OFF_CONCURRENCY
+    ):
+        if exception:
+            logger.error("Failed to begin powering off %s because %s", name, exception)
+            outcomes["failed"] += count
+        else:
+            pollers.append((name, count, poller))
+
+    for name, count, poller in pollers:
+        try:
+            poller.wait(timeout=max(0, deadline - time.monotonic()))
+        except Exception as e:
+            logger.error("Failed to power off %s because %s", name, e)
+            outcomes["failed"] += count
+            continue
+        if not poller.done():
+            logger.error("Timed out waiting for %s to power off", name)
+            outcomes["timed_out"] += count
+        elif poller.status() == "Succeeded":
+            outcomes["stopped"] += count
+        else:
+            logger.error("Failed to power off %s (status %s)", name, poller.status())
+            outcomes["failed"] += count
+    return outcomes
 
 
 def get_vms(compute_client):
-    """Get list of VMs with all the metadata we need."""
+    """Generate a VmRecord with all the metadata we need for each VM."""
     vms_with_tags = compute_client.virtual_machines.list_all()
     vms_with_status = compute_client.virtual_machines.list_all(
         params={"statusOnly": "true"}
@@ -61,23 +181,41 @@ def get_vms(compute_client):
     # vms_with_tags has the tags but no statuses.
     # vms_with_status has the statuses but no tags.
     # *sigh*
-    # So, we iterate and merge them in this hacky way.
-    vms_by_id = dict(((vm.id, vm) for vm in vms_with_tags))
+    # So, we keep only what we need from the first listing and merge it into the
+    # second as it streams by. VMs may be created or deleted between the two
+    # listings, and Azure does not always agree with itself on the case of IDs.
+    tagged_by_id = {vm.id.lower(): has_bypass_tag(vm) for vm in vms_with_tags}
     for vm in vms_with_status:
-        vms_by_id[vm.id].instance_view = vm.instance_view
-    return [vm for vm in vms_by_id.values()]
+        bypass = tagged_by_id.pop(vm.id.lower(), None)
+        if bypass is None:
+            logger.info(f"VM {vm.name} was created during listing and is skipped.")
+            continue
+        yield VmRecord(
+            id=vm.id,
+            name=vm.name,
+            resource_group=get_resource_group_name(vm),
+            has_bypass_tag=bypass,
+            power_state=get_power_state(vm),
+        )
+    if tagged_by_id:
+        logger.info(f"{len(tagged_by_id)} VMs were deleted during listing.")
 
 
-def handle_regular_vms(compute_client):
-    """Identify and conditionally power off regular VMs."""
+def get_regular_vm_power_offs(compute_client):
+    """Generate (name, VM count, function) power-offs for running regular VMs."""
     vms = get_vms(compute_client)
     for vm in vms:
-        if has_bypass_tag(vm):
+        if vm.has_bypass_tag:
             logger.info(f"VM {vm.name} has bypass tag and will not be powered off.")
             continue
-        if vm_is_running(vm):
+        if vm.power_state == POWER_STATE_RUNNING:
             logger.info(f"Attempting to power off VM {vm.name}")
-            power_off_vm(compute_client, vm)
+            yield vm.name, 1, partial(power_off_vm, compute_client, vm)
+
+
+def handle_regular_vms(compute_client):
+    """Identify and conditionally power off regular VMs."""
+    return power_off_all(get_regular_vm_power_offs(compute_client))
 
 
 def get_scale_sets(compute_client):
@@ -97,50 +235,164 @@ def get_vms_for_scale_set(compute_client, scale_set):
     return vms
 
 
-def power_off_scale_set_vm(compute_client, scale_set, vm):
-    """Power off the given VM belonging to the given scale set."""
-    resource_group = get_resource_group_name(vm)
-    # Note: begin_power_off returns an LROPoller object that we could repeatedly
-    # poll until the operation is done, but we don't need to monitor this here.
-    # We can just discard the result and assume it completes.
-    compute_client.virtual_machine_scale_set_vms.begin_power_off(
+def power_off_scale_set_vms(compute_client, scale_set, instance_ids=None):
+    """
+    Begin powering off VMs in the given scale set and return the LROPoller.
+
+    Power off only the given instance IDs, or every VM if instance_ids is None.
+    """
+    resource_group = get_resource_group_name(scale_set)
+    vm_instance_ids = (
+        VirtualMachineScaleSetVMInstanceIDs(instance_ids=instance_ids)
+        if instance_ids is not None
+        else None
+    )
+    return compute_client.virtual_machine_scale_sets.begin_power_off(
         resource_group_name=resource_group,
         vm_scale_set_name=scale_set.name,
-        instance_id=vm.instance_id,
+        vm_instance_i_ds=vm_instance_ids,
     )
 
 
-def handle_scale_set_vms(compute_client):
-    """Identify and conditionally power off VM scale set VMs."""
-    scale_sets = get_scale_sets(compute_client)
-    for scale_set in scale_sets:
+def get_scale_sets_to_list(compute_client):
+    """Generate VM scale sets that do not have the bypass tag."""
+    for scale_set in get_scale_sets(compute_client):
         if has_bypass_tag(scale_set):
             logger.info(
                 f"VM scale set {scale_set.name} has bypass tag "
                 "and will not be powered off."
             )
             continue
-        vms = get_vms_for_scale_set(compute_client, scale_set)
+        yield scale_set
+
+
+def get_scale_set_vm_power_offs(compute_client):
+    """
+    Generate (name, VM count, function) power-offs for running VM scale set VMs.
+
+    Up to REAP_SCALE_SET_CONCURRENCY scale sets are listed at once, and each scale
+    set's power-offs are generated as soon as its listing finishes. Running VMs
+    are powered off with one call per REAP_SCALE_SET_BATCH_SIZE instances, or with
+    one call for the whole scale set if none of its VMs has the bypass tag.
+    """
+    for scale_set, vms, exception in map_concurrently(
+        lambda scale_set: list(get_vms_for_scale_set(compute_client, scale_set)),
+        get_scale_sets_to_list(compute_client),
+        REAP_SCALE_SET_CONCURRENCY,
+    ):
+        if exception:
+            logger.error(
+                "Failed to list VMs in VM scale set %s because %s",
+                scale_set.name,
+                exception,
+            )
+            continue
+        any_bypassed = False
+        running_instance_ids = []
         for vm in vms:
             if has_bypass_tag(vm):
                 logger.info(
                     f"VM scale set VM {vm.name} has bypass tag "
                     "and will not be powered off."
                 )
+                any_bypassed = True
                 continue
             if vm_is_running(vm):
-                logger.info(f"Attempting to power off VM scale set VM {vm.name}")
-                power_off_scale_set_vm(compute_client, scale_set, vm)
+                running_instance_ids.append(vm.instance_id)
+        if not running_instance_ids:
+            continue
+        if not any_bypassed:
+            logger.info(f"Attempting to power off VM scale set {scale_set.name}")
+            yield (
+                f"VM scale set {scale_set.name}",
+                len(running_instance_ids),
+                partial(power_off_scale_set_vms, compute_client, scale_set),
+            )
+            continue
+        for instance_ids in batched(running_instance_ids, REAP_SCALE_SET_BATCH_SIZE):
+            name = f"VM scale set {scale_set.name} instances {', '.join(instance_ids)}"
+            logger.info(f"Attempting to power off {name}")
+            yield (
+                name,
+                len(instance_ids),
+                partial(
+                    power_off_scale_set_vms, compute_client, scale_set, instance_ids
+                ),
+            )
+
+
+def handle_scale_set_vms(compute_client):
+    """Identify and conditionally power off VM scale set VMs."""
+    return power_off_all(get_scale_set_vm_power_offs(compute_client))
+
+
+def reap_subscription(credential, azure_subscription_id):
+    """Power off all running VMs in one subscription and return the outcomes."""
+    compute_client = get_azure_compute_client(azure_subscription_id, credential)
+    outcomes = Counter(stopped=0, failed=0, timed_out=0)
+    with metrics.timer(
+        "reaper_subscription_seconds", subscription=azure_subscription_id
+    ):
+        outcomes.update(handle_regular_vms(compute_client))
+        outcomes.update(handle_scale_set_vms(compute_client))
+    for outcome, count in outcomes.items():
+        metrics.increment(
+            "reaper_vms_total",
+            count,
+            outcome=outcome,
+            subscription=azure_subscription_id,
+        )
+    return outcomes
 
 
 def reap():
-    """Power off all running VMs."""
+    """Power off all running VMs in every selected subscription."""
     logger.info("Preparing to power off Azure VMs.")
-    azure_subscription_id = env("AZURE_SUBSCRIPTION_ID")
-    compute_client = get_azure_compute_client(azure_subscription_id)
-    handle_regular_vms(compute_client)
-    handle_scale_set_vms(compute_client)
+    credential = EnvironmentCredential()
+    outcomes = Counter(stopped=0, failed=0, timed_out=0)
+    metrics.reset()
+    try:
+        subscription_ids = get_subscription_ids(credential)
+        failures = []
+        for subscription_id, result, exception in map_concurrently(
+            partial(reap_subscription, credential),
+            subscription_ids,
+            REAP_SUBSCRIPTION_CONCURRENCY,
+        ):
+            if exception:
+                logger.error(
+                    "Failed to reap subscription %s because %s",
+                    subscription_id,
+                    exception,
+                    exc_info=exception,
+                )
+                failures.append(subscription_id)
+                continue
+            if len(subscription_ids) > 1:
+                logger.info(
+                    "Powered off %s VMs; %s failed and %s timed out in subscription %s",
+                    result["stopped"],
+                    result["failed"],
+                    result["timed_out"],
+                    subscription_id,
+                )
+            outcomes.update(result)
+        if failures:
+            raise RuntimeError(f"Failed to reap {', '.join(sorted(failures))}")
+    except Exception as e:
+        logger.exception(e)
+        raise e
+    finally:
+        metrics.set_rate("reaper_power_offs_per_second", outcomes["stopped"])
+        metrics.write_reports()
+        logger.info(
+            "Powered off %s VMs; %s failed and %s timed out",
+            outcomes["stopped"],
+            outcomes["failed"],
+            outcomes["timed_out"],
+        )
 
 
 if __name__ == "__main__":
+    configure_logging()
     reap()
@@ -0,0 +1,97 @@
+"""Helpers for running reaper work concurrently."""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+_DONE = object()
+
+
+def map_concurrently(func, items, max_workers=1):
+    """
+    Call func for each item using a bounded pool of worker threads.
+
+    Yield (item, result, exception) tuples as each call completes. A call that
+    raises yields its exception instead of raising it here, so one failing item
+    never stops the others from being processed.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            exception = future.exception()
+            result = None if exception else future.result()
+            yield futures[future], result, exception
+
+
+def run_pipeline(items, handler, max_workers=1, queue_size=None):
+    """
+    Feed items through a bounded queue to a pool of handler threads.
+
+    The calling thread iterates items (typically a generator still describing
+    resources) while up to max_workers threads call handler on each item as it
+    arrives. The queue holds at most queue_size items (default: four per worker)
+    so a fast producer cannot run far ahead of the handlers.
+
+    Handlers are expected to deal with their own per-item errors. If a handler
+    or the producer raises anyway, the remaining items are abandoned and the
+    first exception is re-raised once every worker has stopped.
+    """
+    max_workers = max(1, max_workers)
+    work = queue.Queue(maxsize=queue_size or max_workers * 4)
+    errors = []
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is _DONE:
+                return
+            if errors:
+                continue  # keep draining so the producer never blocks forever
+            try:
+                handler(item)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max_workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for item in items:
+            if errors:
+                break
+            work.put(item)
+    finally:
+        for _ in threads:
+            work.put(_DONE)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+
+
+class Tally:
+    """Thread-safe running count and total size."""
+
+    def __init__(self):
+        """Initialize an empty tally."""
+        self._lock = threading.Lock()
+        self.count = 0
+        self.size = 0
+
+    def add(self, size):
+        """Count one more item having the given size."""
+        with self._lock:
+            self.count += 1
+            self.size += size
+
+
+def batched(items, size):
+    """Generate lists of up to size items at a time from any iterable."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,187 @@
+"""
+Optional logging pipeline: JSON lines, per-resource aggregation and a queue.
+
+reaper.configure_logging() sets up plain console logging and then calls install()
+to apply these opt-in settings to the console handler:
+- REAP_LOG_FORMAT=json writes one JSON object per line.
+- REAP_LOG_AGGREGATE counts per-resource records (see per_resource) instead of
+  writing them, and writes one total per action, kind and region at exit, such as
+  "Attempted to delete 500 snapshots in us-east-1". REAP_LOG_SAMPLE=N still
+  writes every Nth of those records.
+- REAP_LOG_QUEUE hands every record to a background thread, so reaping workers
+  never wait on console I/O. The queue is drained at exit, even if reaping raised.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import threading
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener
+
+from envparse import env
+
+REAP_LOG_FORMAT = env("REAP_LOG_FORMAT", default="text")
+REAP_LOG_AGGREGATE = env.bool("REAP_LOG_AGGREGATE", default=False)
+REAP_LOG_SAMPLE = env.int("REAP_LOG_SAMPLE", default=0)
+REAP_LOG_QUEUE = env.bool("REAP_LOG_QUEUE", default=False)
+
+# The loggers that reaper.LOGGING gives the console handler.
+CONSOLE_LOGGERS = ("", "reaper", "azure")
+
+_listener = None
+_installed_handlers = []
+
+
+def per_resource(action, kind, region=None):
+    """
+    Get the `extra` that marks a record as one of many for the same kind of work.
+
+    Records marked this way may be counted instead of written; see
+    AggregatingHandler.
+    """
+    return {"aggregate": (action, kind, region)}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format each record as a single line of JSON."""
+
+    def format(self, record):
+        """Format the record as JSON."""
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class AggregatingHandler(logging.Handler):
+    """
+    Pass records on to a target handler, but count per-resource records.
+
+    Every sample_every-th record with the same action, kind and region is still
+    passed on, starting with the first; 0 passes none of them. The totals are
+    written to the target when this handler is closed.
+    """
+
+    def __init__(self, target, sample_every=0):
+        """Initialize a handler that passes records on to target."""
+        super().__init__()
+        self.target = target
+        self.sample_every = sample_every
+        self.counts = Counter()
+        self.counts_lock = threading.Lock()
+
+    def emit(self, record):
+        """Count a per-resource record, and pass on the rest and the sample."""
+        key = getattr(record, "aggregate", None)
+        if key is None:
+            self.target.handle(record)
+            return
+        with self.counts_lock:
+            self.counts[key] += 1
+            count = self.counts[key]
+        if self.sample_every and (count - 1) % self.sample_every == 0:
+            self.target.handle(record)
+
+    def write_totals(self):
+        """Write and forget the totals counted so far."""
+        with self.counts_lock:
+            counts = sorted(self.counts.items(), key=lambda item: str(item[0]))
+            self.counts.clear()
+        for (action, kind, region), count in counts:
+            if region:
+                msg, args = "%s %s %s in %s", (action, count, kind, region)
+            else:
+                msg, args = "%s %s %s", (action, count, kind)
+            self.target.handle(
+                logging.makeLogRecord(
+                    {
+                        "name": __name__,
+                        "levelno": logging.INFO,
+                        "levelname": "INFO",
+                        "msg": msg,
+                        "args": args,
+                    }
+                )
+            )
+
+    def close(self):
+        """Write the totals before closing."""
+        self.write_totals()
+        super().close()
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    Queue records for the console handler to format, exception and all.
+
+    QueueHandler.prepare formats each record itself and folds its traceback into
+    the message, which would leave JsonFormatter no exception to put in its own
+    field.
+    """
+
+    def prepare(self, record):
+        """Merge the arguments into the message, but keep the exception info."""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def get_console_handler():
+    """Get the console handler that reaper.LOGGING configured."""
+    for handler in logging.getLogger("reaper").handlers:
+        if handler.name == "console":
+            return handler
+    return None
+
+
+def install():
+    """Apply the configured logging options to the console handler."""
+    global _listener
+    stop()
+    console = get_console_handler()
+    if console is None:
+        return
+    if REAP_LOG_FORMAT == "json":
+        console.setFormatter(JsonFormatter())
+    handler = console
+    if REAP_LOG_AGGREGATE or REAP_LOG_SAMPLE:
+        handler = AggregatingHandler(console, REAP_LOG_SAMPLE)
+        handler.setLevel(console.level)
+        _installed_handlers.append(handler)
+    if REAP_LOG_QUEUE:
+        records = queue.SimpleQueue()
+        _listener = QueueListener(records, handler, respect_handler_level=True)
+        _listener.start()
+        handler = RecordQueueHandler(records)
+        handler.setLevel(console.level)
+        _installed_handlers.append(handler)
+    for name in CONSOLE_LOGGERS:
+        logger = logging.getLogger(name)
+        logger.handlers = [handler if h is console else h for h in logger.handlers]
+
+
+def stop():
+    """
+    Drain the queue, if there is one, and write the aggregated totals.
+
+    This runs at exit, before logging itself shuts down, so nothing queued is lost
+    even when reaping raised.
+    """
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+    while _installed_handlers:
+        _installed_handlers.pop(0).close()
+
+
+atexit.register(stop)
@@ -0,0 +1,200 @@
+"""
+Collect run metrics and write them as a JSON report and a Prometheus textfile.
+
+Counters, gauges and latency histograms are kept in memory while reaping and
+written once at the end of the run:
+- REAP_METRICS_FILE is a JSON report for people and scripts.
+- REAP_METRICS_TEXTFILE is for the node_exporter textfile collector, so it is
+  replaced atomically and never read half-written.
+Neither is written unless configured.
+"""
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from envparse import env
+
+logger = logging.getLogger(__name__)
+
+REAP_METRICS_FILE = env("REAP_METRICS_FILE", default="")
+REAP_METRICS_TEXTFILE = env("REAP_METRICS_TEXTFILE", default="")
+
+# Upper bounds in seconds; enough to tell a slow API call from a stuck region.
+HISTOGRAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_counters = {}
+_gauges = {}
+_histograms = {}
+_started_at = time.time()
+_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def reset():
+    """Forget every metric and start timing a new run."""
+    global _started_at
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+        _started_at = time.time()
+
+
+def increment(name, value=1, **labels):
+    """Add to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge."""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, seconds, **labels):
+    """Record a duration in a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        if key not in _histograms:
+            # One count per bucket, one for +Inf, then the sum.
+            _histograms[key] = [0] * (len(HISTOGRAM_BUCKETS) + 1) + [0.0]
+        histogram = _histograms[key]
+        histogram[bisect.bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+
+def set_rate(name, count, **labels):
+    """Set a gauge to the given count per second of this run so far."""
+    with _lock:
+        elapsed = time.time() - _started_at
+    set_gauge(name, count / elapsed if elapsed > 0 else 0.0, **labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Record how long the block took in a gauge, even if it raised."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        set_gauge(name, time.monotonic() - start, **labels)
+
+
+def get_client_region(client):
+    """Get the region name of a boto3 client, for use as a label."""
+    return getattr(getattr(client, "meta", None), "region_name", None)
+
+
+def get_report():
+    """Get every metric as a JSON-friendly dict."""
+    with _lock:
+        duration = time.time() - _started_at
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+        gauges = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_gauges.items())
+        ]
+        histograms = []
+        for (name, labels), histogram in sorted(_histograms.items()):
+            counts = histogram[:-1]
+            histograms.append(
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": sum(counts),
+                    "sum": histogram[-1],
+                    "buckets": dict(
+                        zip([*map(str, HISTOGRAM_BUCKETS), "+Inf"], counts)
+                    ),
+                }
+            )
+    return {
+        "started_at": _started_at,
+        "duration_seconds": duration,
+        "counters": counters,
+        "gauges": gauges,
+        "histograms": histograms,
+    }
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (label, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for label, value in labels.items()
+    )
+    return "{" + ",".join(f'{label}="{value}"' for label, value in escaped) + "}"
+
+
+def format_textfile(report):
+    """Format a report in the Prometheus text exposition format."""
+    lines = []
+    typed = set()
+
+    def add_type(name, metric_type):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {metric_type}")
+
+    for counter in report["counters"]:
+        add_type(counter["name"], "counter")
+        lines.append(
+            f"{counter['name']}{_format_labels(counter['labels'])} {counter['value']}"
+        )
+    add_type("reaper_run_seconds", "gauge")
+    lines.append(f"reaper_run_seconds {report['duration_seconds']}")
+    for gauge in report["gauges"]:
+        add_type(gauge["name"], "gauge")
+        lines.append(
+            f"{gauge['name']}{_format_labels(gauge['labels'])} {gauge['value']}"
+        )
+    for histogram in report["histograms"]:
+        name, labels = histogram["name"], histogram["labels"]
+        add_type(name, "histogram")
+        cumulative = 0
+        for bound, count in histogram["buckets"].items():
+            cumulative += count
+            bucket_labels = _format_labels({**labels, "le": bound})
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomically(path, content):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as temp_file:
+        temp_file.write(content)
+    os.replace(temp_path, path)
+
+
+def write_reports(json_path=None, textfile_path=None):
+    """Write the configured reports, logging rather than raising on failure."""
+    json_path = json_path if json_path is not None else REAP_METRICS_FILE
+    textfile_path = (
+        textfile_path if textfile_path is not None else REAP_METRICS_TEXTFILE
+    )
+    if not json_path and not textfile_path:
+        return
+    report = get_report()
+    try:
+        if json_path:
+            _write_atomically(json_path, json.dumps(report, indent=2) + "\n")
+        if textfile_path:
+            _write_atomically(textfile_path, format_textfile(report))
+    except OSError as e:
+        logger.error("Failed to write metrics because %s", e)
@@ -0,0 +1,225 @@
+"""
+Rate limit and retry AWS API calls that may be throttled or fail transiently.
+
+Every (client, action) pair gets its own token bucket, and clients are shared
+per account and region, so each bucket tracks one API quota. Each successful
+call nudges that bucket's rate up a little (additive increase) and each
+throttled call cuts it in half (multiplicative decrease), so our call rate
+settles just under whatever the account's API quota actually allows.
+
+botocore's own retries are turned off (see reaper.aws_clients), so transient
+failures such as 5xx responses, connection errors and read timeouts are retried
+here too, with the same backoff but without slowing the bucket down.
+"""
+
+import itertools
+import logging
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
+from envparse import env
+
+from reaper import metrics
+
+logger = logging.getLogger(__name__)
+
+REAP_API_RATE_INITIAL = env.float("REAP_API_RATE_INITIAL", default=10.0)
+REAP_API_RATE_MAX = env.float("REAP_API_RATE_MAX", default=100.0)
+REAP_API_MAX_RETRIES = env.int("REAP_API_MAX_RETRIES", default=8)
+
+RATE_MIN = 0.5  # calls per second
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_CAP = 20.0  # seconds
+THROTTLING_ERROR_CODES = {
+    "RequestLimitExceeded",
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+}
+# The same transient failures that botocore's standard retry mode retries.
+TRANSIENT_ERROR_CODES = {
+    "InternalError",
+    "InternalFailure",
+    "PriorRequestNotComplete",
+    "RequestTimeout",
+    "RequestTimeoutException",
+    "ServiceUnavailable",
+    "Unavailable",
+}
+TRANSIENT_STATUS_CODES = {500, 502, 503, 504}
+# ConnectionError covers connect timeouts, and HTTPClientError covers read
+# timeouts and connections closed mid-response.
+TRANSIENT_EXCEPTIONS = (BotocoreConnectionError, HTTPClientError)
+
+
+class TokenBucket:
+    """Token bucket whose refill rate adapts to throttling with AIMD."""
+
+    def __init__(self, rate=None, max_rate=None):
+        """Initialize a full bucket refilling at the given calls per second."""
+        self._lock = threading.Lock()
+        self.rate = rate if rate else REAP_API_RATE_INITIAL
+        self.max_rate = max_rate if max_rate else REAP_API_RATE_MAX
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    @property
+    def capacity(self):
+        """Allow bursts of up to one second's worth of calls."""
+        return max(1.0, self.rate)
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        """Additively increase the rate, by about one call/second per second."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 1.0 / self.rate)
+
+    def on_throttle(self):
+        """Multiplicatively decrease the rate."""
+        with self._lock:
+            self.rate = max(RATE_MIN, self.rate / 2)
+            self.tokens = min(self.tokens, self.capacity)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+_stats = {"throttles": 0, "retries": 0}
+_stats_lock = threading.Lock()
+
+
+def get_bucket(client, action):
+    """Get the shared token bucket for the given client and API action."""
+    with _buckets_lock:
+        key = (client, action)
+        if key not in _buckets:
+            _buckets[key] = TokenBucket()
+        return _buckets[key]
+
+
+def get_stats():
+    """Get a copy of the throttle and retry counters for this run."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(**increments):
+    with _stats_lock:
+        for name, increment in increments.items():
+            _stats[name] += increment
+
+
+def get_backoff(attempt):
+    """Get a jittered exponential backoff delay for the given retry attempt."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+
+def get_error_code(exception):
+    """Get the error code of a ClientError, or the name of any other exception."""
+    if isinstance(exception, ClientError):
+        return exception.response.get("Error", {}).get("Code")
+    return type(exception).__name__
+
+
+def is_throttling_error(exception):
+    """Check if the ClientError means AWS throttled the call."""
+    return (
+        isinstance(exception, ClientError)
+        and get_error_code(exception) in THROTTLING_ERROR_CODES
+    )
+
+
+def is_transient_error(exception):
+    """Check if the exception is a transient failure worth retrying."""
+    if isinstance(exception, TRANSIENT_EXCEPTIONS):
+        return True
+    status_code = exception.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return (
+        get_error_code(exception) in TRANSIENT_ERROR_CODES
+        or status_code in TRANSIENT_STATUS_CODES
+    )
+
+
+def _observe_call(action, region, start, error_code=None):
+    metrics.observe(
+        "reaper_api_call_seconds",
+        time.monotonic() - start,
+        action=action,
+        region=region,
+    )
+    if error_code:
+        metrics.increment("reaper_api_errors_total", action=action, code=error_code)
+
+
+def call(client, action, **kwargs):
+    """
+    Call the named client action under its rate limit.
+
+    Throttled and transiently failed calls are retried with jittered backoff up
+    to REAP_API_MAX_RETRIES times; only throttling slows the bucket down. Any
+    other error is raised immediately.
+    """
+    bucket = get_bucket(client, action)
+    method = getattr(client, action)
+    region = metrics.get_client_region(client)
+    for attempt in itertools.count():
+        bucket.acquire()
+        start = time.monotonic()
+        try:
+            response = method(**kwargs)
+        except (ClientError, *TRANSIENT_EXCEPTIONS) as e:
+            error_code = get_error_code(e)
+            _observe_call(action, region, start, error_code)
+            if is_throttling_error(e):
+                bucket.on_throttle()
+                _count(throttles=1)
+            elif not is_transient_error(e):
+                raise
+            if attempt >= REAP_API_MAX_RETRIES:
+                raise
+            _count(retries=1)
+            logger.debug("%s failed with %s; retry %s", action, error_code, attempt + 1)
+            time.sleep(get_backoff(attempt))
+            continue
+        _observe_call(action, region, start)
+        bucket.on_success()
+        return response
+
+
+def paginate(client, action, result_key, **kwargs):
+    """
+    Generate every item of a paginated describe action under its rate limit.
+
+    We page with NextToken ourselves instead of using a boto3 paginator because
+    a paginator cannot be resumed after one of its page requests is throttled.
+    """
+    next_token = None
+    while True:
+        if next_token:
+            kwargs["NextToken"] = next_token
+        page = call(client, action, **kwargs)
+        metrics.increment(
+            "reaper_describe_pages_total",
+            action=action,
+            region=metrics.get_client_region(client),
+        )
+        yield from page[result_key]
+        next_token = page.get("NextToken")
+        if not next_token:
+            return
@@ -0,0 +1,49 @@
+"""Shared pytest fixtures."""
+
+import pytest
+
+import reaper.aws_clients
+import reaper.aws_history
+import reaper.aws_plan
+import reaper.aws_schedule
+import reaper.aws_state
+
+
+@pytest.fixture(autouse=True)
+def clear_aws_clients():
+    """Make sure no test sees AWS clients cached or injected by another test."""
+    reaper.aws_clients.clear()
+    yield
+    reaper.aws_clients.clear()
+
+
+@pytest.fixture(autouse=True)
+def disable_aws_state():
+    """Make sure no test records resources into another test's state."""
+    reaper.aws_state.load("")
+    yield
+    reaper.aws_state.load("")
+
+
+@pytest.fixture(autouse=True)
+def disable_aws_history():
+    """Make sure no test orders or probes regions by another test's history."""
+    reaper.aws_history.load("")
+    yield
+    reaper.aws_history.load("")
+
+
+@pytest.fixture(autouse=True)
+def clear_aws_schedule():
+    """Make sure no test sees resources scheduled by another test."""
+    reaper.aws_schedule.clear()
+    yield
+    reaper.aws_schedule.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_aws_plan():
+    """Make sure no test sees resources planned by another test."""
+    reaper.aws_plan.clear()
+    yield
+    reaper.aws_plan.clear()
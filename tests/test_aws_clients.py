@@ -0,0 +1,66 @@
+"""Unit tests for reaper.aws_clients."""
+
+from unittest.mock import Mock, patch
+
+import reaper.aws_clients
+
+
+@patch("reaper.aws_clients.boto3")
+def test_get_session_is_shared(mock_boto3):
+    """Test get_session creates only one boto3 session."""
+    session = reaper.aws_clients.get_session()
+    assert reaper.aws_clients.get_session() is session
+    mock_boto3.session.Session.assert_called_once_with()
+
+
+@patch("reaper.aws_clients.boto3")
+def test_get_client_is_cached(mock_boto3):
+    """Test get_client builds one client per service and region."""
+    mock_session = mock_boto3.session.Session.return_value
+    mock_session.client.side_effect = lambda service_name, **kwargs: object()
+
+    client = reaper.aws_clients.get_client("ec2", region_name="us-east-1")
+
+    assert reaper.aws_clients.get_client("ec2", region_name="us-east-1") is client
+    assert reaper.aws_clients.get_client("ec2", region_name="us-west-2") is not client
+    assert reaper.aws_clients.get_client("sts") is not client
+    assert len(mock_session.client.mock_calls) == 3
+    config = mock_session.client.call_args.kwargs["config"]
+    assert config.max_pool_connections == reaper.aws_clients.MAX_POOL_CONNECTIONS
+    assert config.retries == {"total_max_attempts": 1}
+
+
+def test_get_client_returns_injected_stub():
+    """Test get_client returns a stub injected into the cache."""
+    stub = object()
+    reaper.aws_clients.clients[("sts", None, None)] = stub
+    assert reaper.aws_clients.get_client("sts") is stub
+
+
+@patch("reaper.aws_clients.DeferredRefreshableCredentials")
+@patch("reaper.aws_clients.AssumeRoleCredentialFetcher")
+@patch("reaper.aws_clients.boto3")
+def test_get_session_for_role(mock_boto3, mock_fetcher_class, mock_credentials_class):
+    """Test get_session builds one refreshable assumed-role session per role."""
+    role_arn = "arn:aws:iam::123456789:role/potato"
+    default_session = Mock()
+    role_session = Mock()
+    mock_boto3.session.Session.side_effect = [default_session, role_session]
+
+    session = reaper.aws_clients.get_session(role_arn)
+
+    assert session is role_session
+    assert reaper.aws_clients.get_session(role_arn) is role_session
+    assert reaper.aws_clients.get_session() is default_session
+    mock_fetcher_class.assert_called_once_with(
+        client_creator=default_session._session.create_client,
+        source_credentials=default_session.get_credentials.return_value,
+        role_arn=role_arn,
+        extra_args={"RoleSessionName": reaper.aws_clients.REAP_AWS_ROLE_SESSION_NAME},
+    )
+    mock_credentials_class.assert_called_once_with(
+        method="assume-role",
+        refresh_using=mock_fetcher_class.return_value.fetch_credentials,
+    )
+    botocore_session = mock_boto3.session.Session.call_args.kwargs["botocore_session"]
+    assert botocore_session._credentials == mock_credentials_class.return_value
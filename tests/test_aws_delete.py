@@ -5,25 +5,39 @@ from unittest.mock import Mock, call, patch
 
 from botocore.exceptions import ClientError
 
+import reaper.aws_clients
 import reaper.aws_delete
+import reaper.aws_history
+import reaper.aws_plan
+import reaper.aws_schedule
+import reaper.aws_state
 
 
-@patch("reaper.aws_delete.boto3")
-def test_get_account(mock_boto3):
+def make_candidate(resource_id, size):
+    """Make a candidate as the describe functions would."""
+    return reaper.aws_delete.Candidate(
+        resource_id, "region-1", size, datetime.datetime(2020, 10, 26), "", None
+    )
+
+
+def test_get_account():
     """Test getting the current active AWS account."""
     expected_account = "123456789"
     fake_response = {"Account": expected_account}
-    mock_boto3.client.return_value.get_caller_identity.return_value = fake_response
+    mock_sts_client = Mock()
+    mock_sts_client.get_caller_identity.return_value = fake_response
+    reaper.aws_clients.clients[("sts", None, None)] = mock_sts_client
     account = reaper.aws_delete.get_account()
     assert account == expected_account
 
 
-@patch("reaper.aws_delete.boto3")
-def test_get_region_names(mock_boto3):
+def test_get_region_names():
     """Test getting a list of all available region names."""
     expected_regions = ["hello", "world"]
     fake_response = {"Regions": [{"RegionName": name} for name in expected_regions]}
-    mock_boto3.client.return_value.describe_regions.return_value = fake_response
+    mock_ec2_client = Mock()
+    mock_ec2_client.describe_regions.return_value = fake_response
+    reaper.aws_clients.clients[("ec2", None, None)] = mock_ec2_client
     regions = reaper.aws_delete.get_region_names()
     assert regions == expected_regions
 
@@ -62,7 +76,11 @@ def test_has_bypass_tag_not_found():
 def test_delete_old_volumes(mock_logger, mock_describe, mock_delete):
     """Test delete_old_volumes typical behavior."""
     ec2_client = Mock()
-    fake_volumes = [{"Size": "5"}, {"Size": "1"}, {}]
+    fake_volumes = [
+        make_candidate("vol-1", 5.0),
+        make_candidate("vol-2", 1.0),
+        make_candidate("vol-3", 0.0),
+    ]
     mock_describe.return_value = fake_volumes
 
     total_count, total_size = reaper.aws_delete.delete_old_volumes(ec2_client, Mock())
@@ -80,7 +98,11 @@ def test_delete_old_volumes(mock_logger, mock_describe, mock_delete):
 def test_delete_old_volumes_exception(mock_describe, mock_delete):
     """Test delete_old_volumes handles unexpected failures."""
     ec2_client = Mock()
-    fake_volumes = [{"Size": "5"}, {"Size": "1"}, {}]
+    fake_volumes = [
+        make_candidate("vol-1", 5.0),
+        make_candidate("vol-2", 1.0),
+        make_candidate("vol-3", 0.0),
+    ]
     mock_describe.return_value = fake_volumes
     client_error = ClientError(
         error_response={"Error": {"Code": "UnknownError"}},
@@ -96,37 +118,108 @@ def test_delete_old_volumes_exception(mock_describe, mock_delete):
     mock_delete.assert_has_calls(expected_delete_calls)
 
 
+@patch("reaper.aws_delete.delete_volume")
+@patch("reaper.aws_delete.describe_volumes_to_delete")
+@patch("reaper.aws_delete.REAP_DELETE_CONCURRENCY", 4)
+def test_delete_old_volumes_concurrent(mock_describe, mock_delete):
+    """Test delete_old_volumes totals stay correct with concurrent workers."""
+    ec2_client = Mock()
+    fake_volumes = [make_candidate(str(n), 2.0) for n in range(100)]
+    mock_describe.return_value = iter(fake_volumes)
+    not_found_error = ClientError(
+        error_response={"Error": {"Code": "InvalidVolume.NotFound"}},
+        operation_name=Mock(),
+    )
+
+    def fake_delete_volume(client, volume):
+        if volume.id == "42":
+            raise not_found_error
+
+    mock_delete.side_effect = fake_delete_volume
+
+    total_count, total_size = reaper.aws_delete.delete_old_volumes(ec2_client, Mock())
+
+    assert total_count == 99
+    assert total_size == 198
+    assert len(mock_delete.mock_calls) == len(fake_volumes)
+
+
+@patch("reaper.aws_delete.REAP_DRYRUN", False)
+def test_delete_volume():
+    """Test delete_volume deletes the candidate volume by ID."""
+    ec2_client = Mock()
+    reaper.aws_delete.delete_volume(ec2_client, make_candidate("vol-1", 8.0))
+    ec2_client.delete_volume.assert_called_once_with(VolumeId="vol-1", DryRun=False)
+
+
+@patch("reaper.aws_delete.REAP_DRYRUN", False)
+def test_delete_snapshot():
+    """Test delete_snapshot deletes the candidate snapshot by ID."""
+    ec2_client = Mock()
+    reaper.aws_delete.delete_snapshot(ec2_client, make_candidate("snap-1", 8.0))
+    ec2_client.delete_snapshot.assert_called_once_with(
+        SnapshotId="snap-1", DryRun=False
+    )
+
+
 def test_describe_volumes_to_delete():
     """Test describe_volumes_to_delete filters described results as expected."""
     oldest_allowed = datetime.datetime(2020, 10, 26, 12, 34, 56)
     older = datetime.datetime(2020, 10, 26, 10, 0, 0)
     younger = datetime.datetime(2020, 10, 26, 13, 0, 0)
-    fake_response = {
-        "Volumes": [
-            {"CreateTime": older},  # ready to delete
-            {"CreateTime": older, "Attachments": []},  # ready to delete
-            {"CreateTime": older, "Attachments": ["some-value"]},
-            {"CreateTime": older, "Tags": [{"Key": reaper.aws_delete.REAP_BYPASS_TAG}]},
-            {"CreateTime": oldest_allowed},
-            {"CreateTime": younger},
-        ]
-    }
-    expected_volumes = fake_response["Volumes"][:2]  # first two are ready to delete
+    fake_pages = [
+        {
+            "Volumes": [
+                {"VolumeId": "vol-1", "CreateTime": older},  # ready to delete
+                {"VolumeId": "vol-2", "CreateTime": older, "Attachments": []},
+                {"CreateTime": older, "Attachments": ["some-value"]},
+            ]
+        },
+        {
+            "Volumes": [
+                {
+                    "CreateTime": older,
+                    "Tags": [{"Key": reaper.aws_delete.REAP_BYPASS_TAG}],
+                },
+                {"CreateTime": oldest_allowed},
+                {"CreateTime": younger},
+            ]
+        },
+    ]
+    fake_pages[0]["NextToken"] = "page-2"
     ec2_client = Mock()
-    ec2_client.describe_volumes.return_value = fake_response
+    ec2_client.meta.region_name = "region-1"
+    ec2_client.describe_volumes.side_effect = fake_pages
 
     volumes = reaper.aws_delete.describe_volumes_to_delete(ec2_client, oldest_allowed)
 
-    assert volumes == expected_volumes
+    # Only the first two are ready to delete.
+    assert list(volumes) == [
+        reaper.aws_delete.Candidate(
+            volume_id, "region-1", 0.0, older, reaper.aws_plan.REASONS["volume"], None
+        )
+        for volume_id in ("vol-1", "vol-2")
+    ]
+    assert len(ec2_client.describe_volumes.mock_calls) == 2
+    assert ec2_client.describe_volumes.call_args.kwargs["NextToken"] == "page-2"
+    assert (
+        ec2_client.describe_volumes.call_args.kwargs["MaxResults"]
+        == reaper.aws_delete.REAP_PAGE_SIZE
+    )
 
 
+@patch("reaper.aws_delete.get_image_snapshot_ids", Mock(return_value=set()))
 @patch("reaper.aws_delete.delete_snapshot")
 @patch("reaper.aws_delete.describe_snapshots_to_delete")
 @patch("reaper.aws_delete.logger")
 def test_delete_old_snapshots(mock_logger, mock_describe, mock_delete):
     """Test delete_old_snapshots typical behavior."""
     ec2_client = Mock()
-    fake_snapshots = [{"VolumeSize": "5"}, {"VolumeSize": "1"}, {}]
+    fake_snapshots = [
+        make_candidate("snap-1", 5.0),
+        make_candidate("snap-2", 1.0),
+        make_candidate("snap-3", 0.0),
+    ]
     mock_describe.return_value = fake_snapshots
 
     total_count, total_size = reaper.aws_delete.delete_old_snapshots(
@@ -142,12 +235,17 @@ def test_delete_old_snapshots(mock_logger, mock_describe, mock_delete):
     mock_logger.info.assert_has_calls(expected_info_calls)
 
 
+@patch("reaper.aws_delete.get_image_snapshot_ids", Mock(return_value=set()))
 @patch("reaper.aws_delete.delete_snapshot")
 @patch("reaper.aws_delete.describe_snapshots_to_delete")
 def test_delete_old_snapshots_exception(mock_describe, mock_delete):
     """Test delete_old_snapshots handles unexpected failures."""
     ec2_client = Mock()
-    fake_snapshots = [{"VolumeSize": "5"}, {"VolumeSize": "1"}, {}]
+    fake_snapshots = [
+        make_candidate("snap-1", 5.0),
+        make_candidate("snap-2", 1.0),
+        make_candidate("snap-3", 0.0),
+    ]
     mock_describe.return_value = fake_snapshots
     client_error = ClientError(
         error_response={"Error": {"Code": "UnknownError"}},
@@ -170,56 +268,351 @@ def test_describe_snapshots_to_delete():
     oldest_allowed = datetime.datetime(2020, 10, 26, 12, 34, 56)
     older = datetime.datetime(2020, 10, 26, 10, 0, 0)
     younger = datetime.datetime(2020, 10, 26, 13, 0, 0)
-    fake_response = {
+    fake_pages = [
+        {
+            "Snapshots": [
+                {"SnapshotId": "snap-1", "StartTime": older, "VolumeSize": 8},
+                {"SnapshotId": "snap-2", "StartTime": older},
+            ]
+        },
+        {
+            "Snapshots": [
+                {
+                    "StartTime": older,
+                    "Tags": [{"Key": reaper.aws_delete.REAP_BYPASS_TAG}],
+                },
+                {"StartTime": oldest_allowed},
+                {"StartTime": younger},
+            ]
+        },
+    ]
+    fake_pages[0]["NextToken"] = "page-2"
+    ec2_client = Mock()
+    ec2_client.describe_snapshots.side_effect = fake_pages
+
+    snapshots = reaper.aws_delete.describe_snapshots_to_delete(
+        ec2_client, Mock(), oldest_allowed
+    )
+
+    # Only the first page is ready to delete.
+    assert [(s.id, s.size) for s in snapshots] == [("snap-1", 8.0), ("snap-2", 0.0)]
+    assert len(ec2_client.describe_snapshots.mock_calls) == 2
+
+
+def test_describe_snapshots_to_delete_skips_image_snapshots():
+    """Test describe_snapshots_to_delete skips snapshots used by images."""
+    oldest_allowed = datetime.datetime(2020, 10, 26, 12, 34, 56)
+    older = datetime.datetime(2020, 10, 26, 10, 0, 0)
+    fake_page = {
         "Snapshots": [
-            {"StartTime": older},  # ready to delete
-            {"StartTime": older},  # ready to delete
-            {"StartTime": older, "Tags": [{"Key": reaper.aws_delete.REAP_BYPASS_TAG}]},
-            {"StartTime": oldest_allowed},
-            {"StartTime": younger},
+            {"SnapshotId": "snap-image", "StartTime": older},
+            {"SnapshotId": "snap-old", "StartTime": older},
         ]
     }
-    expected_snapshots = fake_response["Snapshots"][:2]  # first two are ready to delete
     ec2_client = Mock()
-    ec2_client.describe_snapshots.return_value = fake_response
+    ec2_client.describe_snapshots.return_value = fake_page
 
-    volumes = reaper.aws_delete.describe_snapshots_to_delete(
-        ec2_client, Mock(), oldest_allowed
+    snapshots = reaper.aws_delete.describe_snapshots_to_delete(
+        ec2_client, Mock(), oldest_allowed, image_snapshot_ids={"snap-image"}
+    )
+
+    assert [snapshot.id for snapshot in snapshots] == ["snap-old"]
+
+
+def get_fake_images():
+    """Get one old image, one young image and one protected old image."""
+    return {
+        "Images": [
+            {
+                "ImageId": "ami-old",
+                "CreationDate": "2020-10-26T10:00:00.000Z",
+                "BlockDeviceMappings": [
+                    {"DeviceName": "/dev/sda1", "Ebs": {"SnapshotId": "snap-1"}},
+                    {"DeviceName": "/dev/sdb", "Ebs": {"SnapshotId": "snap-2"}},
+                    {"DeviceName": "/dev/sdc", "VirtualName": "ephemeral0"},
+                ],
+            },
+            {
+                "ImageId": "ami-young",
+                "CreationDate": "2020-10-26T13:00:00.000Z",
+                "BlockDeviceMappings": [
+                    {"DeviceName": "/dev/sda1", "Ebs": {"SnapshotId": "snap-3"}}
+                ],
+            },
+            {
+                "ImageId": "ami-protected",
+                "CreationDate": "2020-10-26T10:00:00.000Z",
+                "BlockDeviceMappings": [
+                    {"DeviceName": "/dev/sda1", "Ebs": {"SnapshotId": "snap-4"}}
+                ],
+                "Tags": [{"Key": reaper.aws_delete.REAP_BYPASS_TAG}],
+            },
+        ]
+    }
+
+
+def test_get_image_snapshot_ids():
+    """Test get_image_snapshot_ids collects every snapshot used by an image."""
+    oldest_allowed = datetime.datetime(
+        2020, 10, 26, 12, 34, 56, tzinfo=datetime.timezone.utc
+    )
+    ec2_client = Mock()
+    ec2_client.describe_images.return_value = get_fake_images()
+
+    image_snapshot_ids = reaper.aws_delete.get_image_snapshot_ids(
+        ec2_client, "123456789012", oldest_allowed
+    )
+
+    assert image_snapshot_ids == {"snap-1", "snap-2", "snap-3", "snap-4"}
+    assert ec2_client.describe_images.call_args.kwargs["Owners"] == ["123456789012"]
+    ec2_client.deregister_image.assert_not_called()
+
+
+@patch("reaper.aws_delete.REAP_DEREGISTER_IMAGES", True)
+@patch("reaper.aws_delete.REAP_DRYRUN", False)
+def test_get_image_snapshot_ids_deregisters_old_images():
+    """Test get_image_snapshot_ids frees the snapshots of deregistered images."""
+    oldest_allowed = datetime.datetime(
+        2020, 10, 26, 12, 34, 56, tzinfo=datetime.timezone.utc
+    )
+    ec2_client = Mock()
+    ec2_client.describe_images.return_value = get_fake_images()
+
+    image_snapshot_ids = reaper.aws_delete.get_image_snapshot_ids(
+        ec2_client, "123456789012", oldest_allowed
+    )
+
+    assert image_snapshot_ids == {"snap-3", "snap-4"}
+    ec2_client.deregister_image.assert_called_once_with(ImageId="ami-old", DryRun=False)
+
+
+@patch("reaper.aws_delete.REAP_DEREGISTER_IMAGES", True)
+@patch("reaper.aws_delete.REAP_DRYRUN", False)
+def test_get_image_snapshot_ids_deregister_failure():
+    """Test get_image_snapshot_ids keeps the snapshots it failed to free."""
+    oldest_allowed = datetime.datetime(
+        2020, 10, 26, 12, 34, 56, tzinfo=datetime.timezone.utc
+    )
+    ec2_client = Mock()
+    ec2_client.describe_images.return_value = get_fake_images()
+    ec2_client.deregister_image.side_effect = ClientError(
+        error_response={"Error": {"Code": "UnknownError"}},
+        operation_name=Mock(),
+    )
+
+    image_snapshot_ids = reaper.aws_delete.get_image_snapshot_ids(
+        ec2_client, "123456789012", oldest_allowed
     )
 
-    assert volumes == expected_snapshots
+    assert image_snapshot_ids == {"snap-1", "snap-2", "snap-3", "snap-4"}
+
+
+@patch("reaper.aws_delete.delete_snapshot")
+def test_delete_old_snapshots_skips_settled(mock_delete, tmp_path):
+    """Test snapshots found in use are not sent another delete on the next run."""
+    oldest_allowed = datetime.datetime(2020, 10, 26, 12, 34, 56)
+    older = datetime.datetime(2020, 10, 26, 10, 0, 0)
+    fake_page = {
+        "Snapshots": [
+            {"SnapshotId": "snap-in-use", "StartTime": older},
+            {"SnapshotId": "snap-old", "StartTime": older},
+        ]
+    }
+    ec2_client = Mock()
+    ec2_client.describe_snapshots.return_value = fake_page
+    ec2_client.describe_images.return_value = {"Images": []}
+    in_use_error = ClientError(
+        error_response={"Error": {"Code": "InvalidSnapshot.InUse"}},
+        operation_name=Mock(),
+    )
+
+    def fake_delete_snapshot(client, snapshot):
+        if snapshot.id == "snap-in-use":
+            raise in_use_error
+
+    mock_delete.side_effect = fake_delete_snapshot
+    path = str(tmp_path / "state.jsonl")
+
+    reaper.aws_state.load(path)
+    reaper.aws_delete.delete_old_snapshots(ec2_client, Mock(), oldest_allowed)
+    reaper.aws_state.save(path)
+    assert mock_delete.call_count == 2
 
+    mock_delete.reset_mock()
+    reaper.aws_state.load(path)
+    reaper.aws_delete.delete_old_snapshots(ec2_client, Mock(), oldest_allowed)
+    assert [c.args[1].id for c in mock_delete.mock_calls] == ["snap-old"]
 
+
+def test_describe_volumes_to_delete_schedules_young():
+    """Test young volumes are scheduled for when they become old enough."""
+    oldest_allowed = datetime.datetime(2020, 10, 26, 12, 34, 56)
+    younger = datetime.datetime(2020, 10, 26, 13, 0, 0)
+    ec2_client = Mock()
+    ec2_client.describe_volumes.return_value = {
+        "Volumes": [{"VolumeId": "vol-young", "CreateTime": younger, "Size": 8}]
+    }
+
+    volumes = reaper.aws_delete.describe_volumes_to_delete(ec2_client, oldest_allowed)
+
+    assert list(volumes) == []
+    eligible_at = younger + datetime.timedelta(
+        seconds=reaper.aws_delete.REAP_AGE_VOLUMES
+    )
+    assert reaper.aws_schedule.pop_due(eligible_at) == {
+        ("volume", ec2_client, None): ["vol-young"]
+    }
+
+
+@patch("reaper.aws_schedule.MAX_IDS_PER_FILTER", 1)
+@patch("reaper.aws_delete.time.sleep")
+@patch("reaper.aws_delete.get_now")
+@patch("reaper.aws_delete.get_image_snapshot_ids")
 @patch("reaper.aws_delete.delete_old_snapshots")
 @patch("reaper.aws_delete.delete_old_volumes")
-@patch("reaper.aws_delete.boto3")
-@patch("reaper.aws_delete.get_region_names")
-@patch("reaper.aws_delete.get_now")
-@patch("reaper.aws_delete.get_account")
-@patch("reaper.aws_delete.logger")
-def test_reap(
-    mock_logger,
-    mock_get_account,
-    mock_get_now,
-    mock_get_region_names,
-    mock_boto3,
+def test_reap_scheduled(
     mock_delete_old_volumes,
     mock_delete_old_snapshots,
+    mock_get_image_snapshot_ids,
+    mock_get_now,
+    mock_sleep,
 ):
-    """Test the main reap function typical behavior."""
-    fake_regions = ["region-1", "region-2"]
-    mock_get_region_names.return_value = fake_regions
-    mock_delete_old_volumes.return_value = (2, 3)
-    mock_delete_old_snapshots.return_value = (4, 5)
-    expected_info_calls = [
-        call("Checking region-1"),
-        call("Checking region-2"),
-        call("Deleted 4 volumes having total 6.0 GB"),
-        call("Deleted 8 snapshots having total 10.0 GB"),
+    """Test scheduled resources are deleted as they become eligible until the end."""
+    start = datetime.datetime(2020, 10, 26, 12, tzinfo=datetime.timezone.utc)
+    hour = datetime.timedelta(hours=1)
+    ec2_client = Mock()
+    reaper.aws_schedule.add(start + hour, "volume", "vol-1", 1.0, ec2_client)
+    reaper.aws_schedule.add(
+        start + 2 * hour, "snapshot", "snap-1", 2.0, ec2_client, "1"
+    )
+    reaper.aws_schedule.add(
+        start + 2 * hour, "snapshot", "snap-2", 2.0, ec2_client, "1"
+    )
+    reaper.aws_schedule.add(start + 5 * hour, "volume", "vol-late", 1.0, ec2_client)
+    mock_get_now.side_effect = [
+        start,
+        start + hour,
+        start + hour,
+        start + 2 * hour,
     ]
+    mock_delete_old_volumes.return_value = (1, 1.0)
+    mock_delete_old_snapshots.return_value = (1, 2.0)
+    image_snapshot_ids = {"snap-image"}
+    mock_get_image_snapshot_ids.return_value = image_snapshot_ids
+    oldest_allowed_snapshot_age = (
+        start
+        + 2 * hour
+        - datetime.timedelta(seconds=reaper.aws_delete.REAP_AGE_SNAPSHOTS)
+    )
+
+    totals = reaper.aws_delete.reap_scheduled(start + 3 * hour)
+
+    assert totals == (1, 1.0, 2, 4.0)
+    mock_sleep.assert_has_calls([call(3600.0), call(3600.0)])
+    mock_delete_old_volumes.assert_called_once_with(
+        ec2_client,
+        start + hour - datetime.timedelta(seconds=reaper.aws_delete.REAP_AGE_VOLUMES),
+        ["vol-1"],
+    )
+    mock_get_image_snapshot_ids.assert_called_once_with(
+        ec2_client, "1", oldest_allowed_snapshot_age, deregister=False
+    )
+    mock_delete_old_snapshots.assert_has_calls(
+        [
+            call(
+                ec2_client,
+                "1",
+                oldest_allowed_snapshot_age,
+                ["snap-1"],
+                image_snapshot_ids,
+            ),
+            call(
+                ec2_client,
+                "1",
+                oldest_allowed_snapshot_age,
+                ["snap-2"],
+                image_snapshot_ids,
+            ),
+        ]
+    )
+    assert reaper.aws_schedule.get_next_eligible_at() == start + 5 * hour
+
 
+@patch("reaper.aws_reap.reap")
+def test_reap(mock_aws_reap):
+    """Test reap reaps only volumes and snapshots through aws_reap."""
     reaper.aws_delete.reap()
 
-    assert len(mock_delete_old_volumes.mock_calls) == len(fake_regions)
-    assert len(mock_delete_old_snapshots.mock_calls) == len(fake_regions)
-    mock_logger.info.assert_has_calls(expected_info_calls)
+    mock_aws_reap.assert_called_once_with(("volumes", "snapshots"))
+
+
+def test_is_sweep_needed(tmp_path):
+    """Test regions reaped empty last run are probed and skipped if still empty."""
+    path = str(tmp_path / "history.jsonl")
+    reaper.aws_history.load(path)
+    reaper.aws_history.record("1", "r-empty", 1.0, volumes=0, snapshots=0)
+    reaper.aws_history.record("1", "r-full", 1.0, volumes=2, snapshots=0)
+    reaper.aws_history.save(path)
+    reaper.aws_history.load(path)
+    ec2_client = Mock()
+    ec2_client.describe_volumes.return_value = {"Volumes": []}
+    ec2_client.describe_snapshots.return_value = {"Snapshots": [], "NextToken": "x"}
+    oldest_allowed = datetime.datetime(2020, 10, 26, 12, 34, 56)
+
+    def is_sweep_needed(resource, region_name):
+        return reaper.aws_delete.is_sweep_needed(
+            resource, ec2_client, "1", region_name, oldest_allowed
+        )
+
+    assert not is_sweep_needed("volumes", "r-empty")
+    # An empty page with a NextToken may still be followed by snapshots.
+    assert is_sweep_needed("snapshots", "r-empty")
+    assert is_sweep_needed("volumes", "r-full")
+    assert ec2_client.describe_volumes.call_count == 1
+    assert (
+        ec2_client.describe_volumes.call_args.kwargs["MaxResults"]
+        == reaper.aws_delete.PROBE_PAGE_SIZE
+    )
+
+
+def test_get_role_arn():
+    """Test get_role_arn builds role ARNs from account IDs and keeps given ARNs."""
+    role_arn = "arn:aws:iam::123456789:role/potato"
+    assert reaper.aws_delete.get_role_arn(role_arn) == role_arn
+    assert reaper.aws_delete.get_role_arn("987654321") == (
+        f"arn:aws:iam::987654321:role/{reaper.aws_delete.REAP_AWS_ROLE_NAME}"
+    )
+
+
+@patch("reaper.aws_delete.REAP_AWS_ACCOUNTS", ["111", "arn:aws:iam::222:role/r"])
+def test_find_role_arn():
+    """Test find_role_arn finds the listed role for an account, if any."""
+    assert reaper.aws_delete.find_role_arn("111") == (
+        f"arn:aws:iam::111:role/{reaper.aws_delete.REAP_AWS_ROLE_NAME}"
+    )
+    assert reaper.aws_delete.find_role_arn("222") == "arn:aws:iam::222:role/r"
+    assert reaper.aws_delete.find_role_arn("333") is None
+    assert reaper.aws_delete.find_role_arn(None) is None
+
+
+@patch("reaper.aws_delete.REAP_AWS_ACCOUNTS", ["111"])
+@patch("reaper.aws_delete.delete_old_volumes")
+@patch("reaper.aws_delete.get_client")
+def test_apply_plan_group_assumes_role(mock_get_client, mock_delete_old_volumes):
+    """Test apply_plan_group assumes the role of the group's listed account."""
+    mock_delete_old_volumes.return_value = (1, 2.0)
+    group = {
+        "account": "111",
+        "region": "region-1",
+        "kind": "volume",
+        "resources": [["vol-1", 2.0, "2020-10-26T12:00:00+00:00"]],
+    }
+
+    totals = reaper.aws_delete.apply_plan_group(datetime.datetime.now(), group)
+
+    assert totals == (1, 2.0, 0, 0.0)
+    mock_get_client.assert_called_once_with(
+        "ec2",
+        region_name="region-1",
+        role_arn=f"arn:aws:iam::111:role/{reaper.aws_delete.REAP_AWS_ROLE_NAME}",
+    )
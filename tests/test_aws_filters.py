@@ -0,0 +1,53 @@
+"""Unit tests for reaper.aws_filters."""
+
+import datetime
+from unittest.mock import patch
+
+import reaper.aws_filters
+
+
+def test_get_age_prefixes():
+    """Test age prefixes cover whole years, whole months, then days to the cutoff."""
+    oldest_allowed = datetime.datetime(2010, 3, 2, 12, 34, 56)
+    prefixes = reaper.aws_filters.get_age_prefixes(oldest_allowed)
+    assert prefixes == [
+        "2008-*",
+        "2009-*",
+        "2010-01-*",
+        "2010-02-*",
+        "2010-03-01*",
+        "2010-03-02*",
+    ]
+
+
+def test_get_age_prefixes_stay_short():
+    """Test the prefix count stays well under EC2's limit on filter values."""
+    oldest_allowed = datetime.datetime(2030, 12, 31)
+    assert len(reaper.aws_filters.get_age_prefixes(oldest_allowed)) < 100
+
+
+@patch("reaper.aws_filters.REAP_SERVER_AGE_FILTER", False)
+def test_get_filters_without_age():
+    """Test only exact status filters are sent by default."""
+    oldest_allowed = datetime.datetime(2020, 10, 26)
+    assert reaper.aws_filters.get_volume_filters(oldest_allowed) == [
+        {"Name": "status", "Values": ["available"]}
+    ]
+    assert reaper.aws_filters.get_snapshot_filters(oldest_allowed) == [
+        {"Name": "status", "Values": ["completed"]}
+    ]
+
+
+@patch("reaper.aws_filters.REAP_SERVER_AGE_FILTER", True)
+def test_get_filters_with_age():
+    """Test REAP_SERVER_AGE_FILTER adds the age prefixes to each filter set."""
+    oldest_allowed = datetime.datetime(2020, 10, 26)
+    prefixes = reaper.aws_filters.get_age_prefixes(oldest_allowed)
+    assert reaper.aws_filters.get_volume_filters(oldest_allowed) == [
+        {"Name": "status", "Values": ["available"]},
+        {"Name": "create-time", "Values": prefixes},
+    ]
+    assert reaper.aws_filters.get_snapshot_filters(oldest_allowed) == [
+        {"Name": "status", "Values": ["completed"]},
+        {"Name": "start-time", "Values": prefixes},
+    ]
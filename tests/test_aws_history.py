@@ -0,0 +1,88 @@
+"""Unit tests for reaper.aws_history."""
+
+import json
+
+import reaper.aws_history
+
+
+def write_history(path, *entries):
+    """Write a history file with the given entries."""
+    with open(path, "w") as history_file:
+        for entry in entries:
+            history_file.write(json.dumps(entry) + "\n")
+
+
+def test_order_regions(tmp_path):
+    """Test unknown regions come first, then known regions longest first."""
+    path = str(tmp_path / "history.jsonl")
+    write_history(
+        path,
+        {"account": "1", "region": "r-fast", "seconds": 1.0},
+        {"account": "1", "region": "r-slow", "seconds": 60.0},
+        {"account": "2", "region": "r-new", "seconds": 600.0},
+    )
+    reaper.aws_history.load(path)
+
+    region_names = reaper.aws_history.order_regions(
+        "1", ["r-fast", "r-new", "r-slow", "r-other"]
+    )
+
+    assert region_names == ["r-new", "r-other", "r-slow", "r-fast"]
+
+
+def test_order_regions_disabled():
+    """Test regions keep their order without a history file."""
+    reaper.aws_history.load("")
+    assert reaper.aws_history.order_regions("1", ["b", "a"]) == ["b", "a"]
+
+
+def test_is_known_empty(tmp_path):
+    """Test only resources counted as zero last run are known to be empty."""
+    path = str(tmp_path / "history.jsonl")
+    write_history(
+        path,
+        {"account": "1", "region": "r-1", "seconds": 1.0, "volumes": 0, "snapshots": 3},
+    )
+    reaper.aws_history.load(path)
+
+    assert reaper.aws_history.is_known_empty("1", "r-1", "volumes")
+    assert not reaper.aws_history.is_known_empty("1", "r-1", "snapshots")
+    assert not reaper.aws_history.is_known_empty("1", "r-2", "volumes")
+
+
+def test_record_and_save(tmp_path):
+    """Test this run's records are merged into the history of earlier runs."""
+    path = str(tmp_path / "history.jsonl")
+    write_history(
+        path,
+        {"account": "1", "region": "r-1", "seconds": 1.0, "volumes": 0, "snapshots": 3},
+        {"account": "1", "region": "r-2", "seconds": 2.0, "volumes": 4, "snapshots": 5},
+    )
+    reaper.aws_history.load(path)
+
+    reaper.aws_history.record("1", "r-1", 9.0, volumes=6)
+    reaper.aws_history.save(path)
+    reaper.aws_history.load(path)
+
+    assert reaper.aws_history.order_regions("1", ["r-2", "r-1"]) == ["r-1", "r-2"]
+    assert not reaper.aws_history.is_known_empty("1", "r-1", "volumes")
+    assert not reaper.aws_history.is_known_empty("1", "r-1", "snapshots")
+
+
+def test_count_described(tmp_path):
+    """Test described resources are counted per client and resource until popped."""
+    reaper.aws_history.load(str(tmp_path / "history.jsonl"))
+    client_1, client_2 = object(), object()
+
+    assert list(reaper.aws_history.count_described(client_1, "volumes", "abc")) == [
+        "a",
+        "b",
+        "c",
+    ]
+    list(reaper.aws_history.count_described(client_1, "volumes", "d"))
+    list(reaper.aws_history.count_described(client_2, "volumes", ""))
+
+    assert reaper.aws_history.pop_described(client_1, "volumes") == 4
+    assert reaper.aws_history.pop_described(client_1, "volumes") == 0
+    assert reaper.aws_history.pop_described(client_1, "snapshots") == 0
+    assert reaper.aws_history.pop_described(client_2, "volumes") == 0
@@ -0,0 +1,55 @@
+"""Unit tests for reaper.aws_plan."""
+
+import datetime
+import json
+from unittest.mock import Mock
+
+import reaper.aws_plan
+
+
+def test_save_and_load(tmp_path):
+    """Test planned resources are grouped by account, region and kind."""
+    created_at = datetime.datetime(2020, 10, 26, 12, tzinfo=datetime.timezone.utc)
+    ec2_client = Mock()
+    ec2_client.meta.region_name = "us-east-1"
+    reaper.aws_plan.add("volume", "vol-1", 8.0, created_at, ec2_client)
+    reaper.aws_plan.add("snapshot", "snap-1", 2.0, created_at, ec2_client, "123")
+    reaper.aws_plan.add("snapshot", "snap-2", 4.0, created_at, ec2_client, "123")
+    path = str(tmp_path / "plan.jsonl")
+
+    reaper.aws_plan.save(path)
+    groups = reaper.aws_plan.load(path)
+
+    assert groups == [
+        {
+            "account": "123",
+            "region": "us-east-1",
+            "kind": "snapshot",
+            "reason": reaper.aws_plan.REASONS["snapshot"],
+            "resources": [
+                ["snap-1", 2.0, "2020-10-26T12:00:00+00:00"],
+                ["snap-2", 4.0, "2020-10-26T12:00:00+00:00"],
+            ],
+        },
+        {
+            "account": None,
+            "region": "us-east-1",
+            "kind": "volume",
+            "reason": reaper.aws_plan.REASONS["volume"],
+            "resources": [["vol-1", 8.0, "2020-10-26T12:00:00+00:00"]],
+        },
+    ]
+    with open(path) as plan_file:
+        assert [json.loads(line) for line in plan_file] == groups
+
+
+def test_clear(tmp_path):
+    """Test a cleared plan is saved empty."""
+    created_at = datetime.datetime(2020, 10, 26, 12, tzinfo=datetime.timezone.utc)
+    reaper.aws_plan.add("volume", "vol-1", 8.0, created_at, Mock())
+    path = str(tmp_path / "plan.jsonl")
+
+    reaper.aws_plan.clear()
+    reaper.aws_plan.save(path)
+
+    assert reaper.aws_plan.load(path) == []
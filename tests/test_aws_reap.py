@@ -0,0 +1,274 @@
+"""Unit tests for reaper.aws_reap."""
+
+import json
+from unittest.mock import ANY, Mock, call, patch
+
+import pytest
+
+import reaper.aws_reap
+import reaper.metrics
+from benchmarks import fakes
+
+
+@patch("reaper.aws_reap.aws_delete")
+@patch("reaper.aws_reap.aws_stop_instances")
+@patch("reaper.aws_reap.aws_zero_autoscaling")
+@patch("reaper.aws_reap.get_client")
+def test_reap_region_order(
+    mock_get_client, mock_zero_autoscaling, mock_stop_instances, mock_delete
+):
+    """Test reap_region reaps resources in dependency order."""
+    reaper.metrics.reset()
+    manager = Mock()
+    manager.attach_mock(mock_zero_autoscaling.reap_region, "zero_autoscaling")
+    manager.attach_mock(mock_stop_instances.reap_region, "stop_instances")
+    manager.attach_mock(mock_delete.delete_old_volumes, "delete_old_volumes")
+    manager.attach_mock(mock_delete.delete_old_snapshots, "delete_old_snapshots")
+    mock_delete.delete_old_volumes.return_value = (1, 2.0)
+    mock_delete.delete_old_snapshots.return_value = (3, 4.0)
+    oldest_allowed = {"volumes": Mock(), "snapshots": Mock()}
+    ec2_client = mock_get_client.return_value
+
+    results, failed_resources = reaper.aws_reap.reap_region(
+        # Deliberately out of order to show the order comes from RESOURCES.
+        ("snapshots", "volumes", "instances", "autoscaling"),
+        "account",
+        oldest_allowed,
+        "region-1",
+    )
+
+    assert manager.mock_calls == [
+        call.zero_autoscaling("region-1", role_arn=None),
+        call.stop_instances("region-1", role_arn=None),
+        call.delete_old_volumes(ec2_client, oldest_allowed["volumes"]),
+        call.delete_old_snapshots(ec2_client, "account", oldest_allowed["snapshots"]),
+    ]
+    assert set(results) == set(reaper.aws_reap.RESOURCES)
+    assert failed_resources == []
+    assert [
+        gauge["labels"]
+        for gauge in reaper.metrics.get_report()["gauges"]
+        if gauge["name"] == "reaper_region_seconds"
+    ] == [{"account": "account", "region": "region-1"}]
+    assert {
+        gauge["labels"]["resource"]: gauge["labels"]["account"]
+        for gauge in reaper.metrics.get_report()["gauges"]
+        if gauge["name"] == "reaper_resource_seconds"
+    } == {resource: "account" for resource in reaper.aws_reap.RESOURCES}
+
+
+@patch("reaper.aws_reap.aws_delete")
+@patch("reaper.aws_reap.aws_stop_instances")
+@patch("reaper.aws_reap.get_client")
+def test_reap_region_failure(mock_get_client, mock_stop_instances, mock_delete):
+    """Test reap_region keeps going when one kind of resource fails."""
+    mock_stop_instances.reap_region.side_effect = ValueError("potato")
+    mock_delete.delete_old_volumes.return_value = (1, 2.0)
+
+    results, failed_resources = reaper.aws_reap.reap_region(
+        ("instances", "volumes"), None, {"volumes": Mock()}, "region-1"
+    )
+
+    assert results == {"volumes": (1, 2.0)}
+    assert failed_resources == ["instances"]
+
+
+@patch("reaper.aws_reap.reap_resource")
+@patch("reaper.aws_reap.aws_delete")
+@patch("reaper.aws_reap.logger")
+def test_reap(mock_logger, mock_delete, mock_reap_resource):
+    """Test reap discovers regions once and logs a consolidated summary."""
+    mock_delete.get_region_names.return_value = ["region-1", "region-2"]
+    mock_delete.get_role_arns.return_value = [None]
+    mock_delete.REAP_ACCOUNT_CONCURRENCY = 1
+    mock_delete.REAP_REGION_CONCURRENCY = 2
+    mock_delete.REAP_AGE_VOLUMES = 1
+    mock_delete.REAP_AGE_SNAPSHOTS = 1
+    mock_delete.get_now.return_value = reaper.aws_reap.datetime.datetime.now()
+    mock_reap_resource.side_effect = lambda resource, *args: {
+        "autoscaling": 1,
+        "instances": 2,
+        "volumes": (3, 4.0),
+        "snapshots": (5, 6.0),
+    }[resource]
+
+    reaper.aws_reap.reap()
+
+    mock_delete.get_region_names.assert_called_once_with(None)
+    mock_delete.get_account.assert_called_once_with(None)
+    mock_logger.info.assert_has_calls(
+        [
+            call("Scaled down %s auto scaling groups", 2),
+            call("Stopped %s instances", 4),
+            call("Deleted %s volumes having total %s GB", 6, 8.0),
+            call("Deleted %s snapshots having total %s GB", 10, 12.0),
+        ]
+    )
+
+
+@patch("reaper.aws_reap.reap_resource")
+@patch("reaper.aws_reap.aws_delete")
+@patch("reaper.aws_reap.logger")
+def test_reap_failure(mock_logger, mock_delete, mock_reap_resource):
+    """Test reap raises after reaping everything else when something fails."""
+    mock_delete.get_region_names.return_value = ["region-1", "region-2"]
+    mock_delete.get_role_arns.return_value = [None]
+    mock_delete.REAP_ACCOUNT_CONCURRENCY = 1
+    mock_delete.REAP_REGION_CONCURRENCY = 1
+    mock_delete.REAP_AGE_VOLUMES = 1
+    mock_delete.REAP_AGE_SNAPSHOTS = 1
+    mock_delete.get_now.return_value = reaper.aws_reap.datetime.datetime.now()
+
+    def fake_reap_resource(resource, region_name, *args):
+        if region_name == "region-2":
+            raise ValueError("taters")
+        return 7
+
+    mock_reap_resource.side_effect = fake_reap_resource
+
+    with pytest.raises(RuntimeError, match="instances in region-2"):
+        reaper.aws_reap.reap(("instances",))
+
+    mock_delete.get_account.assert_called_once_with(None)
+    mock_logger.info.assert_any_call("Stopped %s instances", 7)
+
+
+@patch("reaper.aws_reap.reap_resource")
+@patch("reaper.aws_reap.aws_delete")
+@patch("reaper.aws_reap.logger")
+def test_reap_accounts(mock_logger, mock_delete, mock_reap_resource):
+    """Test reap assumes a role in each account and logs totals for each."""
+    role_arns = ["arn:aws:iam::1:role/reaper", "arn:aws:iam::2:role/reaper"]
+    mock_delete.get_role_arns.return_value = role_arns
+    mock_delete.get_account.side_effect = lambda role_arn: role_arn.split(":")[4]
+    mock_delete.get_region_names.return_value = ["region-1", "region-2"]
+    mock_delete.REAP_ACCOUNT_CONCURRENCY = 2
+    mock_delete.REAP_REGION_CONCURRENCY = 1
+    mock_delete.REAP_AGE_VOLUMES = 1
+    mock_delete.REAP_AGE_SNAPSHOTS = 1
+    mock_delete.get_now.return_value = reaper.aws_reap.datetime.datetime.now()
+
+    def fake_reap_resource(resource, region_name, account, *args):
+        if (account, region_name) == ("2", "region-2"):
+            raise ValueError("taters")
+        return 1 if resource == "instances" else (2, 3.0)
+
+    mock_reap_resource.side_effect = fake_reap_resource
+
+    with pytest.raises(RuntimeError, match="instances in region-2 in 2"):
+        reaper.aws_reap.reap(("instances", "volumes"))
+
+    mock_delete.get_region_names.assert_has_calls(
+        [call(role_arn) for role_arn in role_arns], any_order=True
+    )
+    for role_arn in role_arns:
+        for region_name in ("region-1", "region-2"):
+            mock_reap_resource.assert_any_call(
+                "instances",
+                region_name,
+                role_arn.split(":")[4],
+                ANY,
+                False,
+                role_arn,
+            )
+    mock_logger.info.assert_any_call("Stopped %s instances in account %s", 2, "1")
+    mock_logger.info.assert_any_call("Stopped %s instances in account %s", 1, "2")
+    mock_logger.info.assert_any_call("Stopped %s instances", 3)
+    mock_logger.info.assert_any_call(
+        "Deleted %s volumes having total %s GB in account %s", 4, 6.0, "1"
+    )
+    mock_logger.info.assert_any_call("Deleted %s volumes having total %s GB", 6, 9.0)
+
+
+@patch("reaper.metrics.set_rate")
+@patch("reaper.aws_reap.reap_resource")
+@patch("reaper.aws_reap.aws_delete")
+@patch("reaper.aws_reap.logger")
+def test_reap_until(mock_logger, mock_delete, mock_reap_resource, mock_set_rate):
+    """Test reap keeps deleting scheduled resources until the given time."""
+    mock_delete.get_region_names.return_value = ["region-1"]
+    mock_delete.get_role_arns.return_value = [None]
+    mock_delete.REAP_ACCOUNT_CONCURRENCY = 1
+    mock_delete.REAP_REGION_CONCURRENCY = 1
+    mock_delete.REAP_AGE_VOLUMES = 1
+    mock_delete.REAP_AGE_SNAPSHOTS = 1
+    mock_delete.get_now.return_value = reaper.aws_reap.datetime.datetime.now()
+    mock_delete.reap_scheduled.return_value = (1, 2.0, 3, 4.0)
+    mock_reap_resource.return_value = (5, 6.0)
+    until = Mock()
+
+    reaper.aws_reap.reap(("volumes", "snapshots"), until=until)
+
+    mock_delete.reap_scheduled.assert_called_once_with(until)
+    # The rate covers only the sweep, not the scheduled deletes.
+    mock_set_rate.assert_has_calls(
+        [
+            call("reaper_deletes_per_second", 5, resource="volumes"),
+            call("reaper_deletes_per_second", 5, resource="snapshots"),
+        ]
+    )
+    mock_logger.info.assert_has_calls(
+        [
+            call("Deleted %s volumes having total %s GB", 6, 8.0),
+            call("Deleted %s snapshots having total %s GB", 8, 10.0),
+        ]
+    )
+
+
+@patch("reaper.aws_delete.get_now", Mock(return_value=fakes.NOW))
+def test_reap_history_does_not_probe_young_regions(tmp_path):
+    """Test a region holding only young resources is swept without a probe."""
+    backend = fakes.FakeBackend()
+    fakes.install_aws(backend, volumes=10, snapshots=10, young_fraction=1.0)
+    path = str(tmp_path / "history.jsonl")
+    describe_calls = []
+
+    with patch("reaper.aws_history.REAP_HISTORY_FILE", path):
+        for _ in range(3):
+            backend.calls.clear()
+            reaper.aws_reap.reap(("volumes", "snapshots"))
+            describe_calls.append(
+                backend.calls["describe_volumes"] + backend.calls["describe_snapshots"]
+            )
+
+    assert describe_calls[0] == describe_calls[1] == describe_calls[2]
+    with open(path) as history_file:
+        (entry,) = [json.loads(line) for line in history_file]
+    assert entry["volumes"] > 0
+    assert entry["snapshots"] > 0
+
+
+@patch("reaper.aws_delete.get_now", Mock(return_value=fakes.NOW))
+def test_reap_plan_and_apply(tmp_path):
+    """Test planning sends no mutating calls and applying deletes the plan."""
+    backend = fakes.FakeBackend()
+    ec2_clients = fakes.install_aws(backend, regions=2, volumes=20, snapshots=30)
+    inventory = {
+        region_name: (set(client.volumes), set(client.snapshots))
+        for region_name, client in ec2_clients.items()
+    }
+    path = str(tmp_path / "plan.jsonl")
+
+    reaper.aws_reap.reap(plan=path)
+
+    assert not any(action.startswith("delete_") for action in backend.calls)
+    assert "deregister_image" not in backend.calls
+    groups = reaper.aws_plan.load(path)
+    assert {(group["region"], group["kind"]) for group in groups} == {
+        (region_name, kind)
+        for region_name in ec2_clients
+        for kind in ("volume", "snapshot")
+    }
+    planned = {resource[0] for group in groups for resource in group["resources"]}
+
+    reaper.aws_reap.apply(path)
+
+    for region_name, client in ec2_clients.items():
+        volumes, snapshots = inventory[region_name]
+        deleted = (volumes - set(client.volumes)) | (snapshots - set(client.snapshots))
+        assert deleted == {
+            resource_id for resource_id in planned if region_name in resource_id
+        }
+    assert backend.calls["delete_snapshot"] + backend.calls["delete_volume"] == len(
+        planned
+    )
@@ -0,0 +1,65 @@
+"""Unit tests for reaper.aws_schedule."""
+
+import datetime
+import json
+from unittest.mock import Mock
+
+import reaper.aws_schedule
+
+
+def test_pop_due():
+    """Test only eligible resources are popped, grouped by kind and client."""
+    now = datetime.datetime(2020, 10, 26, 12, tzinfo=datetime.timezone.utc)
+    hour = datetime.timedelta(hours=1)
+    client_1, client_2 = Mock(), Mock()
+    reaper.aws_schedule.add(now - hour, "volume", "vol-1", 1.0, client_1)
+    reaper.aws_schedule.add(now + hour, "volume", "vol-2", 1.0, client_1)
+    reaper.aws_schedule.add(now, "volume", "vol-3", 1.0, client_1)
+    reaper.aws_schedule.add(now, "snapshot", "snap-1", 1.0, client_2, "123")
+
+    due = reaper.aws_schedule.pop_due(now)
+
+    assert due == {
+        ("volume", client_1, None): ["vol-1", "vol-3"],
+        ("snapshot", client_2, "123"): ["snap-1"],
+    }
+    assert reaper.aws_schedule.get_next_eligible_at() == now + hour
+
+
+def test_get_next_eligible_at_empty():
+    """Test an empty schedule has no next eligible time."""
+    assert reaper.aws_schedule.get_next_eligible_at() is None
+
+
+def test_save_report(tmp_path):
+    """Test the report lists scheduled resources in eligibility order."""
+    now = datetime.datetime(2020, 10, 26, 12, tzinfo=datetime.timezone.utc)
+    ec2_client = Mock()
+    ec2_client.meta.region_name = "us-east-1"
+    reaper.aws_schedule.add(now, "snapshot", "snap-1", 2.0, ec2_client, "123")
+    reaper.aws_schedule.add(
+        now - datetime.timedelta(days=1), "volume", "vol-1", 1.0, ec2_client
+    )
+    path = tmp_path / "schedule.jsonl"
+
+    reaper.aws_schedule.save_report(str(path))
+
+    reports = [json.loads(line) for line in path.read_text().splitlines()]
+    assert reports == [
+        {
+            "eligible_at": "2020-10-25T12:00:00+00:00",
+            "kind": "volume",
+            "id": "vol-1",
+            "size": 1.0,
+            "region": "us-east-1",
+            "account": None,
+        },
+        {
+            "eligible_at": "2020-10-26T12:00:00+00:00",
+            "kind": "snapshot",
+            "id": "snap-1",
+            "size": 2.0,
+            "region": "us-east-1",
+            "account": "123",
+        },
+    ]
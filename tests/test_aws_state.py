@@ -0,0 +1,71 @@
+"""Unit tests for reaper.aws_state."""
+
+import json
+from unittest.mock import patch
+
+import reaper.aws_state
+
+TAGS = [{"Key": "do-not-delete", "Value": ""}, {"Key": "Name", "Value": "potato"}]
+
+
+def test_disabled_without_state_file():
+    """Test nothing is recorded or skipped without REAP_STATE_FILE."""
+    reaper.aws_state.load("")
+    reaper.aws_state.record("vol-1", TAGS, "protected")
+    assert not reaper.aws_state.is_settled("vol-1", TAGS)
+    assert not reaper.aws_state.get_changes()
+
+
+def test_get_fingerprint_ignores_tag_order():
+    """Test the fingerprint depends on the tags but not on their order."""
+    fingerprint = reaper.aws_state.get_fingerprint(TAGS)
+    assert fingerprint == reaper.aws_state.get_fingerprint(list(reversed(TAGS)))
+    assert fingerprint != reaper.aws_state.get_fingerprint(TAGS[1:])
+    assert reaper.aws_state.get_fingerprint(None) == (
+        reaper.aws_state.get_fingerprint([])
+    )
+
+
+def test_save_and_load(tmp_path):
+    """Test settled resources are skipped by the next run until their tags change."""
+    path = str(tmp_path / "state.jsonl")
+    reaper.aws_state.load(path, now=1000)
+    reaper.aws_state.record("vol-protected", TAGS, "protected", now=1000)
+    reaper.aws_state.record("snap-in-use", [], "in_use", now=1000)
+    reaper.aws_state.record("vol-young", [], "young", now=1000)
+    reaper.aws_state.record("vol-gone", [], "young", now=1000)
+    reaper.aws_state.save(path)
+
+    reaper.aws_state.load(path, now=2000)
+    assert reaper.aws_state.is_settled("vol-protected", TAGS)
+    assert reaper.aws_state.is_settled("snap-in-use", [])
+    assert not reaper.aws_state.is_settled("vol-young", [])
+    reaper.aws_state.record("vol-young", [], "deleted", now=2000)
+    reaper.aws_state.record("vol-new", [], "young", now=2000)
+
+    assert reaper.aws_state.get_changes() == {
+        ("young", "deleted"): 1,
+        ("new", "young"): 1,
+        ("young", "gone"): 1,
+    }
+    reaper.aws_state.save(path)
+    with open(path) as state_file:
+        records = {record["id"]: record for record in map(json.loads, state_file)}
+    assert set(records) == {"vol-protected", "snap-in-use", "vol-young", "vol-new"}
+    # Settled records keep the time they were first decided so the TTL applies.
+    assert records["vol-protected"]["evaluated_at"] == 1000
+
+
+def test_load_invalidates(tmp_path):
+    """Test settled records are ignored once tags change or the TTL expires."""
+    path = str(tmp_path / "state.jsonl")
+    reaper.aws_state.load(path, now=1000)
+    reaper.aws_state.record("vol-1", TAGS, "protected", now=1000)
+    reaper.aws_state.save(path)
+
+    reaper.aws_state.load(path, now=2000)
+    assert not reaper.aws_state.is_settled("vol-1", TAGS[1:])
+
+    with patch.object(reaper.aws_state, "REAP_STATE_TTL", 500):
+        reaper.aws_state.load(path, now=2000)
+    assert not reaper.aws_state.is_settled("vol-1", TAGS)
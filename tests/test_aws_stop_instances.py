@@ -0,0 +1,121 @@
+"""Unit tests for reaper.aws_stop_instances."""
+
+from unittest.mock import Mock, call, patch
+
+from botocore.exceptions import ClientError
+
+import reaper.aws_clients
+import reaper.aws_delete
+import reaper.aws_stop_instances
+
+
+def make_instance(instance_id, tags=None):
+    """Make a described instance dict."""
+    instance = {"InstanceId": instance_id}
+    if tags is not None:
+        instance["Tags"] = tags
+    return instance
+
+
+def test_describe_instances_to_stop():
+    """Test describe_instances_to_stop skips instances having the bypass tag."""
+    bypass_tags = [{"Key": reaper.aws_delete.REAP_BYPASS_TAG}]
+    ec2_client = Mock()
+    ec2_client.describe_instances.side_effect = [
+        {
+            "Reservations": [
+                {"Instances": [make_instance("i-1"), make_instance("i-2", [])]},
+                {"Instances": [make_instance("i-3", bypass_tags)]},
+            ],
+            "NextToken": "page-2",
+        },
+        {"Reservations": [{"Instances": [make_instance("i-4")]}]},
+    ]
+
+    instance_ids = reaper.aws_stop_instances.describe_instances_to_stop(ec2_client)
+
+    assert list(instance_ids) == ["i-1", "i-2", "i-4"]
+    assert ec2_client.describe_instances.call_args_list[0].kwargs["Filters"] == [
+        {"Name": "instance-state-code", "Values": ["16"]}
+    ]
+
+
+@patch("reaper.aws_stop_instances.MAX_INSTANCE_IDS_PER_CALL", 2)
+@patch("reaper.aws_stop_instances.describe_instances_to_stop")
+def test_stop_running_instances(mock_describe):
+    """Test stop_running_instances stops instances in batches."""
+    mock_describe.return_value = iter(["i-1", "i-2", "i-3"])
+    ec2_client = Mock()
+
+    total_count = reaper.aws_stop_instances.stop_running_instances(ec2_client)
+
+    assert total_count == 3
+    assert ec2_client.stop_instances.call_args_list == [
+        call(InstanceIds=["i-1", "i-2"], DryRun=False),
+        call(InstanceIds=["i-3"], DryRun=False),
+    ]
+
+
+@patch("reaper.aws_stop_instances.describe_instances_to_stop")
+def test_stop_running_instances_retries_failed_batch(mock_describe):
+    """Test stop_running_instances retries a rejected batch one at a time."""
+    mock_describe.return_value = iter(["i-1", "i-2", "i-3"])
+    client_error = ClientError(
+        error_response={"Error": {"Code": "IncorrectInstanceState"}},
+        operation_name=Mock(),
+    )
+    ec2_client = Mock()
+    ec2_client.stop_instances.side_effect = [client_error, None, client_error, None]
+
+    total_count = reaper.aws_stop_instances.stop_running_instances(ec2_client)
+
+    assert total_count == 2
+    assert ec2_client.stop_instances.call_args_list == [
+        call(InstanceIds=["i-1", "i-2", "i-3"], DryRun=False),
+        call(InstanceIds=["i-1"], DryRun=False),
+        call(InstanceIds=["i-2"], DryRun=False),
+        call(InstanceIds=["i-3"], DryRun=False),
+    ]
+
+
+@patch("reaper.aws_stop_instances.describe_instances_to_stop")
+def test_stop_running_instances_does_not_retry_other_errors(mock_describe):
+    """Test a batch rejected for a reason unrelated to its instances is not split."""
+    mock_describe.return_value = iter(["i-1", "i-2", "i-3"])
+    ec2_client = Mock()
+    ec2_client.stop_instances.side_effect = ClientError(
+        error_response={"Error": {"Code": "UnauthorizedOperation"}},
+        operation_name=Mock(),
+    )
+
+    total_count = reaper.aws_stop_instances.stop_running_instances(ec2_client)
+
+    assert total_count == 0
+    ec2_client.stop_instances.assert_called_once_with(
+        InstanceIds=["i-1", "i-2", "i-3"], DryRun=False
+    )
+
+
+@patch("reaper.aws_stop_instances.REAP_DRYRUN", True)
+@patch("reaper.aws_stop_instances.describe_instances_to_stop")
+def test_stop_running_instances_dryrun(mock_describe):
+    """Test stop_running_instances handles DryRunOperation."""
+    mock_describe.return_value = iter(["i-1"])
+    ec2_client = Mock()
+    ec2_client.stop_instances.side_effect = ClientError(
+        error_response={"Error": {"Code": "DryRunOperation"}},
+        operation_name=Mock(),
+    )
+
+    total_count = reaper.aws_stop_instances.stop_running_instances(ec2_client)
+
+    assert total_count == 1
+    ec2_client.stop_instances.assert_called_once_with(InstanceIds=["i-1"], DryRun=True)
+
+
+@patch("reaper.aws_reap.reap")
+def test_reap(mock_aws_reap):
+    """Test reap stops only instances through aws_reap."""
+    reaper.aws_stop_instances.reap()
+
+    mock_aws_reap.assert_called_once_with(("instances",))
@@ -0,0 +1,90 @@
+"""Unit tests for reaper.aws_zero_autoscaling."""
+
+from unittest.mock import Mock, patch
+
+from botocore.exceptions import ClientError
+
+import reaper.aws_clients
+import reaper.aws_delete
+import reaper.aws_zero_autoscaling
+
+
+def make_group(name, capacity=1, tags=None):
+    """Make a described auto scaling group dict."""
+    return {
+        "AutoScalingGroupName": name,
+        "MinSize": capacity,
+        "MaxSize": capacity,
+        "DesiredCapacity": capacity,
+        "Tags": tags if tags else [],
+    }
+
+
+def test_describe_groups_to_scale_down():
+    """Test describe_groups_to_scale_down skips scaled down and bypassed groups."""
+    bypass_tags = [{"Key": reaper.aws_delete.REAP_BYPASS_TAG, "Value": ""}]
+    autoscaling_client = Mock()
+    autoscaling_client.describe_auto_scaling_groups.side_effect = [
+        {
+            "AutoScalingGroups": [
+                make_group("running"),
+                make_group("already-zero", capacity=0),
+            ],
+            "NextToken": "page-2",
+        },
+        {
+            "AutoScalingGroups": [
+                make_group("bypassed", tags=bypass_tags),
+                dict(make_group("partly-zero", capacity=0), MaxSize=2),
+            ]
+        },
+    ]
+
+    groups = reaper.aws_zero_autoscaling.describe_groups_to_scale_down(
+        autoscaling_client
+    )
+
+    names = [group["AutoScalingGroupName"] for group in groups]
+    assert names == ["running", "partly-zero"]
+
+
+@patch("reaper.aws_zero_autoscaling.describe_groups_to_scale_down")
+def test_scale_down_groups(mock_describe):
+    """Test scale_down_groups updates each group and counts failures correctly."""
+    mock_describe.return_value = [make_group("one"), make_group("two")]
+    autoscaling_client = Mock()
+    autoscaling_client.update_auto_scaling_group.side_effect = [
+        None,
+        ClientError(
+            error_response={"Error": {"Code": "ResourceInUse"}},
+            operation_name=Mock(),
+        ),
+    ]
+
+    total_count = reaper.aws_zero_autoscaling.scale_down_groups(autoscaling_client)
+
+    assert total_count == 1
+    autoscaling_client.update_auto_scaling_group.assert_any_call(
+        AutoScalingGroupName="one", MinSize=0, MaxSize=0, DesiredCapacity=0
+    )
+
+
+@patch("reaper.aws_zero_autoscaling.REAP_DRYRUN", True)
+@patch("reaper.aws_zero_autoscaling.describe_groups_to_scale_down")
+def test_scale_down_groups_dryrun(mock_describe):
+    """Test scale_down_groups makes no updates during a dry run."""
+    mock_describe.return_value = [make_group("one")]
+    autoscaling_client = Mock()
+
+    total_count = reaper.aws_zero_autoscaling.scale_down_groups(autoscaling_client)
+
+    assert total_count == 1
+    autoscaling_client.update_auto_scaling_group.assert_not_called()
+
+
+@patch("reaper.aws_reap.reap")
+def test_reap(mock_aws_reap):
+    """Test reap scales down only auto scaling groups through aws_reap."""
+    reaper.aws_zero_autoscaling.reap()
+
+    mock_aws_reap.assert_called_once_with(("autoscaling",))
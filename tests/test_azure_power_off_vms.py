@@ -1,7 +1,18 @@
 """Unit tests for reaper.azure_power_off_vms."""
 
+import io
+import json
+import time
 import uuid
-from unittest.mock import Mock, patch
+from functools import partial
+from unittest.mock import Mock, call, patch
+
+import pytest
+import requests
+from azure.core.credentials import AccessToken
+from azure.core.pipeline.transport import RequestsTransport
+from azure.mgmt.compute.models import VirtualMachineScaleSetVMInstanceIDs
+from azure.mgmt.core import ARMPipelineClient
 
 import reaper.azure_power_off_vms
 
@@ -139,10 +150,46 @@ def test_power_off_vm():
     mock_vm = create_mock_resource(name=name, resource_group=resource_group)
     mock_client = Mock()
 
-    reaper.azure_power_off_vms.power_off_vm(mock_client, mock_vm)
+    poller = reaper.azure_power_off_vms.power_off_vm(mock_client, mock_vm)
     mock_client.virtual_machines.begin_power_off.assert_called_once_with(
         resource_group, name
     )
+    assert poller == mock_client.virtual_machines.begin_power_off.return_value
+
+
+def create_mock_poller(done=True, status="Succeeded", error=None):
+    """Create a Mock object that looks like an Azure LROPoller."""
+    mock_poller = Mock()
+    mock_poller.done.return_value = done
+    mock_poller.status.return_value = status
+    if error:
+        mock_poller.wait.side_effect = error
+    return mock_poller
+
+
+def test_power_off_all():
+    """Test power_off_all tracks how each power-off turned out."""
+    stopped_poller = create_mock_poller()
+    failed_poller = create_mock_poller(status="Failed")
+    error_poller = create_mock_poller(error=Exception("potato"))
+    timed_out_poller = create_mock_poller(done=False, status="InProgress")
+
+    def explode():
+        raise Exception("taters")
+
+    power_offs = [
+        ("stopped", 2, lambda: stopped_poller),
+        ("failed", 1, lambda: failed_poller),
+        ("error", 1, lambda: error_poller),
+        ("timed_out", 3, lambda: timed_out_poller),
+        ("begin_failed", 1, explode),
+    ]
+
+    outcomes = reaper.azure_power_off_vms.power_off_all(power_offs)
+
+    assert outcomes == {"stopped": 2, "failed": 3, "timed_out": 3}
+    for poller in (stopped_poller, failed_poller, error_poller, timed_out_poller):
+        assert len(poller.wait.mock_calls) == 1
 
 
 def test_get_vms():
@@ -180,35 +227,65 @@ def test_get_vms():
         # The second `list_all` call gets the version with statuses.
         [mock_vm_0_with_status, mock_vm_1_with_status],
     ]
-    vms = reaper.azure_power_off_vms.get_vms(mock_client)
+    vms = list(reaper.azure_power_off_vms.get_vms(mock_client))
 
     # These assertions verify that multiple `list_all` results were combined correctly.
     assert vms[0].id == mock_vm_0_id
-    assert vms[0].tags == mock_vm_0_with_tags_with_bypass.tags
-    assert vms[0].instance_view == mock_vm_0_with_status.instance_view
+    assert vms[0].name == mock_vm_0_with_status.name
+    assert vms[0].resource_group == mock_vm_0_id.split("/")[4]
+    assert vms[0].has_bypass_tag is True
+    assert vms[0].power_state == "PowerState/running"
     assert vms[1].id == mock_vm_1_id
-    assert vms[1].tags == mock_vm_1_with_tags_without_bypass.tags
-    assert vms[1].instance_view == mock_vm_1_with_status.instance_view
+    assert vms[1].has_bypass_tag is False
+    assert vms[1].power_state == "PowerState/running"
+
+
+def test_get_vms_tolerates_changes_between_listings():
+    """Test get_vms skips VMs created or deleted between its two listings."""
+    mock_vm_id = synthesize_resource_id()
+    mock_vm_with_tags = create_mock_resource(resource_id=mock_vm_id.upper())
+    mock_vm_with_status = create_mock_resource(
+        resource_id=mock_vm_id, is_running=False, include_statuses=True
+    )
+    # This VM was deleted after the first listing.
+    mock_deleted_vm_with_tags = create_mock_resource()
+    # This VM was created after the first listing.
+    mock_created_vm_with_status = create_mock_resource(include_statuses=True)
+
+    mock_client = Mock()
+    mock_client.virtual_machines.list_all.side_effect = [
+        [mock_vm_with_tags, mock_deleted_vm_with_tags],
+        [mock_created_vm_with_status, mock_vm_with_status],
+    ]
+    vms = list(reaper.azure_power_off_vms.get_vms(mock_client))
+
+    assert len(vms) == 1
+    assert vms[0].id == mock_vm_id
+    assert vms[0].power_state == "PowerState/off"
+
+
+def create_vm_record(name, resource_group=None, has_bypass_tag=False, is_running=True):
+    """Create a VmRecord like get_vms generates."""
+    resource_group = resource_group if resource_group else str(uuid.uuid4())
+    return reaper.azure_power_off_vms.VmRecord(
+        id=synthesize_resource_id(resource_group=resource_group),
+        name=name,
+        resource_group=resource_group,
+        has_bypass_tag=has_bypass_tag,
+        power_state="PowerState/running" if is_running else "PowerState/off",
+    )
 
 
 def test_handle_regular_vms():
     """Test handle_regular_vms bypasses or powers off VMs correctly."""
-    mock_vm_running_with_bypass = create_mock_resource(
-        name="mock_vm_running_with_bypass",
-        tags=synthesize_tags(with_bypass_tag=True),
-        is_running=True,
-        include_statuses=True,
+    mock_vm_running_with_bypass = create_vm_record(
+        "mock_vm_running_with_bypass", has_bypass_tag=True
     )
     mock_vm_running_resource_group = str(uuid.uuid4())
-    mock_vm_running = create_mock_resource(
-        name="mock_vm_running",
-        resource_group=mock_vm_running_resource_group,
-        is_running=True,
-        include_statuses=True,
-    )
-    mock_vm_not_running = create_mock_resource(
-        name="mock_vm_not_running", is_running=False, include_statuses=True
+    mock_vm_running = create_vm_record(
+        "mock_vm_running", resource_group=mock_vm_running_resource_group
     )
+    mock_vm_not_running = create_vm_record("mock_vm_not_running", is_running=False)
     mock_vms = [mock_vm_running_with_bypass, mock_vm_running, mock_vm_not_running]
 
     mock_client = Mock()
@@ -221,6 +298,8 @@ def test_handle_regular_vms():
     mock_client.virtual_machines.begin_power_off.assert_called_once_with(
         mock_vm_running_resource_group, mock_vm_running.name
     )
+    mock_poller = mock_client.virtual_machines.begin_power_off.return_value
+    mock_poller.wait.assert_called_once()
 
 
 def test_get_scale_sets():
@@ -250,21 +329,37 @@ def test_get_vms_for_scale_set():
     assert vms == mock_client.virtual_machine_scale_set_vms.list.return_value
 
 
-def test_power_off_scale_set_vm():
-    """Test power_off_scale_set_vm correctly powers off the VMSS Virtual Machine."""
+def test_power_off_scale_set_vms():
+    """Test power_off_scale_set_vms powers off the given VMSS instances at once."""
     mock_client = Mock()
-    mock_scale_set = create_mock_resource()
-    vm_resource_group = str(uuid.uuid4())
-    mock_vm = create_mock_resource(resource_group=vm_resource_group)
+    scale_set_resource_group = str(uuid.uuid4())
+    mock_scale_set = create_mock_resource(resource_group=scale_set_resource_group)
 
-    reaper.azure_power_off_vms.power_off_scale_set_vm(
-        mock_client, mock_scale_set, mock_vm
+    poller = reaper.azure_power_off_vms.power_off_scale_set_vms(
+        mock_client, mock_scale_set, ["1", "2"]
     )
 
-    mock_client.virtual_machine_scale_set_vms.begin_power_off(
-        resource_group_name=vm_resource_group,
+    mock_begin_power_off = mock_client.virtual_machine_scale_sets.begin_power_off
+    mock_begin_power_off.assert_called_once_with(
+        resource_group_name=scale_set_resource_group,
         vm_scale_set_name=mock_scale_set.name,
-        instance_id=mock_vm.instance_id,
+        vm_instance_i_ds=VirtualMachineScaleSetVMInstanceIDs(instance_ids=["1", "2"]),
+    )
+    assert poller == mock_begin_power_off.return_value
+
+
+def test_power_off_scale_set_vms_whole_scale_set():
+    """Test power_off_scale_set_vms powers off a whole VMSS without instance IDs."""
+    mock_client = Mock()
+    scale_set_resource_group = str(uuid.uuid4())
+    mock_scale_set = create_mock_resource(resource_group=scale_set_resource_group)
+
+    reaper.azure_power_off_vms.power_off_scale_set_vms(mock_client, mock_scale_set)
+
+    mock_client.virtual_machine_scale_sets.begin_power_off.assert_called_once_with(
+        resource_group_name=scale_set_resource_group,
+        vm_scale_set_name=mock_scale_set.name,
+        vm_instance_i_ds=None,
     )
 
 
@@ -290,6 +385,7 @@ def test_handle_scale_set_vms():
         is_running=True,
         include_statuses=True,
     )
+    mock_vm_running.instance_id = "1"
     # Third VM is not running. It should be skipped.
     mock_vm_not_running = create_mock_resource(
         name="mock_vm_not_running", is_running=False, include_statuses=True
@@ -302,16 +398,317 @@ def test_handle_scale_set_vms():
     ) as mock_get_scale_sets, patch.object(
         reaper.azure_power_off_vms, "get_vms_for_scale_set"
     ) as mock_get_vms_for_scale_set, patch.object(
-        reaper.azure_power_off_vms, "power_off_scale_set_vm"
-    ) as mock_power_off_scale_set_vm:
+        reaper.azure_power_off_vms, "power_off_scale_set_vms"
+    ) as mock_power_off_scale_set_vms:
         mock_get_scale_sets.return_value = [mock_scale_set_with_bypass, mock_scale_set]
         mock_get_vms_for_scale_set.side_effect = [mock_vms]
         reaper.azure_power_off_vms.handle_scale_set_vms(mock_client)
 
-        # power_off_scale_set_vm should be called only once for the one untagged and
+        # power_off_scale_set_vms should be called only once for the one untagged and
         # powered VM in the second VMSS. The first VMSS should be skipped entirely due
         # to its bypass tag, and the other VMs in the second VMSS either have the bypass
         # tag or are not powered on.
-        mock_power_off_scale_set_vm.assert_called_once_with(
-            mock_client, mock_scale_set, mock_vm_running
+        mock_power_off_scale_set_vms.assert_called_once_with(
+            mock_client, mock_scale_set, [mock_vm_running.instance_id]
         )
+
+
+@patch("reaper.azure_power_off_vms.REAP_SCALE_SET_BATCH_SIZE", 2)
+def test_get_scale_set_vm_power_offs_batches():
+    """Test scale set power-offs are batched or cover the whole scale set."""
+    # No VM in this VMSS has the bypass tag, so the whole VMSS is powered off.
+    mock_scale_set_all = create_mock_resource(name="all")
+    mock_vms_all = [
+        create_mock_resource(is_running=is_running, include_statuses=True)
+        for is_running in (True, False, True)
+    ]
+    # One VM in this VMSS has the bypass tag, so instances are powered off in batches.
+    mock_scale_set_some = create_mock_resource(name="some")
+    mock_vms_some = [create_mock_resource(include_statuses=True) for _ in range(3)]
+    mock_vms_some.append(
+        create_mock_resource(tags=synthesize_tags(), include_statuses=True)
+    )
+    for instance_id, mock_vm in enumerate(mock_vms_some):
+        mock_vm.instance_id = str(instance_id)
+    # No VM in this VMSS is running, so nothing is powered off.
+    mock_scale_set_none = create_mock_resource(name="none")
+    mock_vms_none = [create_mock_resource(is_running=False, include_statuses=True)]
+    vms_by_scale_set_name = {
+        "all": mock_vms_all,
+        "some": mock_vms_some,
+        "none": mock_vms_none,
+    }
+
+    mock_client = Mock()
+    with patch.object(
+        reaper.azure_power_off_vms, "get_scale_sets"
+    ) as mock_get_scale_sets, patch.object(
+        reaper.azure_power_off_vms, "get_vms_for_scale_set"
+    ) as mock_get_vms_for_scale_set, patch.object(
+        reaper.azure_power_off_vms, "power_off_scale_set_vms"
+    ) as mock_power_off_scale_set_vms:
+        mock_get_scale_sets.return_value = [
+            mock_scale_set_all,
+            mock_scale_set_some,
+            mock_scale_set_none,
+        ]
+        mock_get_vms_for_scale_set.side_effect = (
+            lambda client, scale_set: vms_by_scale_set_name[scale_set.name]
+        )
+        power_offs = {}
+        for name, count, begin_power_off in (
+            reaper.azure_power_off_vms.get_scale_set_vm_power_offs(mock_client)
+        ):
+            power_offs[name] = count
+            begin_power_off()
+
+    assert power_offs == {
+        "VM scale set all": 2,
+        "VM scale set some instances 0, 1": 2,
+        "VM scale set some instances 2": 1,
+    }
+    mock_power_off_scale_set_vms.assert_has_calls(
+        [
+            call(mock_client, mock_scale_set_all),
+            call(mock_client, mock_scale_set_some, ["0", "1"]),
+            call(mock_client, mock_scale_set_some, ["2"]),
+        ],
+        any_order=True,
+    )
+
+
+@patch("reaper.azure_power_off_vms.EnvironmentCredential")
+@patch("reaper.azure_power_off_vms.get_subscription_ids")
+@patch("reaper.azure_power_off_vms.get_azure_compute_client")
+@patch("reaper.azure_power_off_vms.handle_scale_set_vms")
+@patch("reaper.azure_power_off_vms.handle_regular_vms")
+@patch("reaper.azure_power_off_vms.logger")
+def test_reap(
+    mock_logger,
+    mock_handle_regular_vms,
+    mock_handle_scale_set_vms,
+    mock_get_azure_compute_client,
+    mock_get_subscription_ids,
+    mock_environment_class,
+):
+    """Test the main reap function reports combined power-off outcomes."""
+    mock_get_subscription_ids.return_value = ["sub-1"]
+    mock_handle_regular_vms.return_value = {"stopped": 2, "failed": 1}
+    mock_handle_scale_set_vms.return_value = {"stopped": 3, "timed_out": 1}
+
+    reaper.azure_power_off_vms.reap()
+
+    credential = mock_environment_class.return_value
+    mock_get_azure_compute_client.assert_called_once_with("sub-1", credential)
+    compute_client = mock_get_azure_compute_client.return_value
+    mock_handle_regular_vms.assert_called_once_with(compute_client)
+    mock_handle_scale_set_vms.assert_called_once_with(compute_client)
+    mock_logger.info.assert_called_with(
+        "Powered off %s VMs; %s failed and %s timed out", 5, 1, 1
+    )
+
+
+@patch("reaper.azure_power_off_vms.REAP_SUBSCRIPTION_CONCURRENCY", 3)
+@patch("reaper.azure_power_off_vms.EnvironmentCredential")
+@patch("reaper.azure_power_off_vms.get_subscription_ids")
+@patch("reaper.azure_power_off_vms.reap_subscription")
+@patch("reaper.azure_power_off_vms.logger")
+def test_reap_multiple_subscriptions(
+    mock_logger,
+    mock_reap_subscription,
+    mock_get_subscription_ids,
+    mock_environment_class,
+):
+    """Test reap shares one credential and reports each subscription."""
+    mock_get_subscription_ids.return_value = ["sub-1", "sub-2", "sub-3"]
+
+    def fake_reap_subscription(credential, subscription_id):
+        if subscription_id == "sub-2":
+            raise Exception("potato")
+        return {"stopped": 2, "failed": 1, "timed_out": 0}
+
+    mock_reap_subscription.side_effect = fake_reap_subscription
+
+    with pytest.raises(RuntimeError, match="Failed to reap sub-2"):
+        reaper.azure_power_off_vms.reap()
+
+    credential = mock_environment_class.return_value
+    mock_environment_class.assert_called_once_with()
+    mock_reap_subscription.assert_has_calls(
+        [
+            call(credential, "sub-1"),
+            call(credential, "sub-2"),
+            call(credential, "sub-3"),
+        ],
+        any_order=True,
+    )
+    mock_logger.info.assert_any_call(
+        "Powered off %s VMs; %s failed and %s timed out in subscription %s",
+        2,
+        1,
+        0,
+        "sub-3",
+    )
+    mock_logger.info.assert_called_with(
+        "Powered off %s VMs; %s failed and %s timed out", 4, 2, 0
+    )
+
+
+@patch("reaper.azure_power_off_vms.env")
+def test_get_subscription_ids(mock_env):
+    """Test subscriptions come from AZURE_SUBSCRIPTION_IDS or AZURE_SUBSCRIPTION_ID."""
+    mock_env.list.return_value = ["sub-1", "sub-2"]
+    assert reaper.azure_power_off_vms.get_subscription_ids(Mock()) == [
+        "sub-1",
+        "sub-2",
+    ]
+
+    mock_env.list.return_value = []
+    mock_env.return_value = "sub-3"
+    assert reaper.azure_power_off_vms.get_subscription_ids(Mock()) == ["sub-3"]
+    mock_env.assert_called_once_with("AZURE_SUBSCRIPTION_ID")
+
+
+@patch("reaper.azure_power_off_vms.list_subscription_ids")
+@patch("reaper.azure_power_off_vms.env")
+def test_get_subscription_ids_all(mock_env, mock_list_subscription_ids):
+    """Test AZURE_SUBSCRIPTION_IDS=all lists every visible subscription."""
+    mock_env.list.return_value = ["all"]
+    mock_list_subscription_ids.return_value = iter(["sub-1", "sub-2"])
+    credential = Mock()
+    assert reaper.azure_power_off_vms.get_subscription_ids(credential) == [
+        "sub-1",
+        "sub-2",
+    ]
+    mock_list_subscription_ids.assert_called_once_with(credential)
+
+
+@patch("reaper.azure_power_off_vms.ARMPipelineClient")
+def test_list_subscription_ids(mock_client_class):
+    """Test listing follows nextLink and skips subscriptions that are not enabled."""
+    first_page, second_page = Mock(), Mock()
+    first_page.json.return_value = {
+        "value": [
+            {"subscriptionId": "sub-1", "state": "Enabled"},
+            {"subscriptionId": "sub-2", "state": "Disabled"},
+        ],
+        "nextLink": "https://management.azure.com/subscriptions?page=2",
+    }
+    second_page.json.return_value = {
+        "value": [{"subscriptionId": "sub-3", "state": "Enabled"}]
+    }
+    mock_client = mock_client_class.return_value
+    mock_client.send_request.side_effect = [first_page, second_page]
+
+    subscription_ids = list(reaper.azure_power_off_vms.list_subscription_ids(Mock()))
+
+    assert subscription_ids == ["sub-1", "sub-3"]
+    requested_urls = [
+        mock_call.args[0].url for mock_call in mock_client.send_request.mock_calls
+    ]
+    assert requested_urls == [
+        "https://management.azure.com/subscriptions?api-version=2022-12-01",
+        "https://management.azure.com/subscriptions?page=2",
+    ]
+
+
+class FakeAdapter(requests.adapters.BaseAdapter):
+    """A requests adapter that answers every request with the next JSON page."""
+
+    def __init__(self, pages):
+        """Initialize an adapter that answers with the given pages in order."""
+        super().__init__()
+        self.pages = list(pages)
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        """Record the request and answer it with the next page."""
+        self.requests.append(request)
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps(self.pages.pop(0)).encode()
+        response.raw = io.BytesIO(response._content)
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        """Do nothing, since there is nothing to close."""
+
+
+def test_list_subscription_ids_pipeline():
+    """Test listing sends authenticated https requests through a real pipeline."""
+    adapter = FakeAdapter(
+        [
+            {
+                "value": [{"subscriptionId": "sub-1", "state": "Enabled"}],
+                "nextLink": "https://management.azure.com/subscriptions?page=2",
+            },
+            {"value": [{"subscriptionId": "sub-2", "state": "Enabled"}]},
+        ]
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    credential = Mock(spec=["get_token"])
+    credential.get_token.return_value = AccessToken("potato", int(time.time()) + 3600)
+    client_class = partial(
+        ARMPipelineClient, transport=RequestsTransport(session=session)
+    )
+
+    with patch("reaper.azure_power_off_vms.ARMPipelineClient", client_class):
+        subscription_ids = list(
+            reaper.azure_power_off_vms.list_subscription_ids(credential)
+        )
+
+    assert subscription_ids == ["sub-1", "sub-2"]
+    assert [request.url for request in adapter.requests] == [
+        "https://management.azure.com/subscriptions?api-version=2022-12-01",
+        "https://management.azure.com/subscriptions?page=2",
+    ]
+    assert adapter.requests[0].headers["Authorization"] == "Bearer potato"
+
+
+@patch("reaper.azure_power_off_vms.REAP_SCALE_SET_CONCURRENCY", 4)
+def test_get_scale_set_vm_power_offs_concurrent():
+    """Test scale sets are listed concurrently and failed listings are skipped."""
+    mock_scale_set_with_bypass = create_mock_resource(
+        name="bypassed", tags=synthesize_tags(with_bypass_tag=True)
+    )
+    mock_scale_set_broken = create_mock_resource(name="broken")
+    mock_scale_sets = [create_mock_resource(name=f"vmss-{n}") for n in range(5)]
+    vms_by_scale_set_name = {
+        scale_set.name: [
+            create_mock_resource(name=f"{scale_set.name}-vm", include_statuses=True)
+        ]
+        for scale_set in mock_scale_sets
+    }
+
+    def fake_get_vms_for_scale_set(compute_client, scale_set):
+        if scale_set.name == "broken":
+            raise Exception("potato")
+        return iter(vms_by_scale_set_name[scale_set.name])
+
+    mock_client = Mock()
+    with patch.object(
+        reaper.azure_power_off_vms, "get_scale_sets"
+    ) as mock_get_scale_sets, patch.object(
+        reaper.azure_power_off_vms, "get_vms_for_scale_set"
+    ) as mock_get_vms_for_scale_set:
+        mock_get_scale_sets.return_value = [
+            mock_scale_set_with_bypass,
+            mock_scale_set_broken,
+            *mock_scale_sets,
+        ]
+        mock_get_vms_for_scale_set.side_effect = fake_get_vms_for_scale_set
+        power_offs = list(
+            reaper.azure_power_off_vms.get_scale_set_vm_power_offs(mock_client)
+        )
+
+    # The bypassed scale set must never even be listed.
+    listed_names = {
+        mock_call.args[1].name for mock_call in mock_get_vms_for_scale_set.mock_calls
+    }
+    assert listed_names == {"broken", *vms_by_scale_set_name}
+    names = sorted(name for name, _, _ in power_offs)
+    assert names == [f"VM scale set vmss-{n}" for n in range(5)]
@@ -0,0 +1,46 @@
+"""Smoke tests for the benchmarks and their fake backends."""
+
+import benchmarks.__main__
+from benchmarks import fakes
+
+
+def test_fake_ec2_client_pages_and_filters():
+    """Test the fake EC2 client pages through a filtered listing like EC2."""
+    client = fakes.FakeEC2Client(fakes.FakeBackend(), "region-0", snapshots=25)
+    snapshot_id = next(iter(client.snapshots))
+
+    first_page = client.describe_snapshots(MaxResults=10)
+    second_page = client.describe_snapshots(
+        MaxResults=10, NextToken=first_page["NextToken"]
+    )
+    filtered = client.describe_snapshots(
+        Filters=[{"Name": "snapshot-id", "Values": [snapshot_id]}]
+    )
+
+    assert len(first_page["Snapshots"]) == 10
+    assert first_page["Snapshots"] != second_page["Snapshots"]
+    assert [s["SnapshotId"] for s in filtered["Snapshots"]] == [snapshot_id]
+    assert client.backend.calls["describe_snapshots"] == 3
+
+
+def test_main(capsys):
+    """Test every scenario runs end to end at a tiny scale."""
+    results = benchmarks.__main__.main(
+        [
+            "--regions=2",
+            "--volumes=20",
+            "--snapshots=30",
+            "--vms=10",
+            "--scale-sets=2",
+            "--vms-per-scale-set=3",
+            "--page-size=7",
+        ]
+    )
+
+    assert [result["scenario"] for result in results] == list(
+        benchmarks.__main__.SCENARIOS
+    )
+    assert all(result["items"] > 0 for result in results)
+    aws_reap = results[3]
+    assert aws_reap["calls"]["describe_regions"] == 1
+    assert len(capsys.readouterr().out.splitlines()) == len(results)
@@ -0,0 +1,72 @@
+"""Unit tests for reaper.concurrency."""
+
+import pytest
+
+import reaper.concurrency
+
+
+def test_map_concurrently():
+    """Test map_concurrently yields each item's result."""
+    results = reaper.concurrency.map_concurrently(lambda x: x * 2, [1, 2, 3], 2)
+    assert sorted(results) == [(1, 2, None), (2, 4, None), (3, 6, None)]
+
+
+def test_map_concurrently_exception():
+    """Test map_concurrently yields exceptions without stopping other items."""
+    error = ValueError("potato")
+
+    def explode_on_two(x):
+        if x == 2:
+            raise error
+        return x
+
+    results = {
+        item: (result, exception)
+        for item, result, exception in reaper.concurrency.map_concurrently(
+            explode_on_two, [1, 2, 3], 2
+        )
+    }
+    assert results == {1: (1, None), 2: (None, error), 3: (3, None)}
+
+
+def test_run_pipeline():
+    """Test run_pipeline hands every produced item to the handler."""
+    tally = reaper.concurrency.Tally()
+    reaper.concurrency.run_pipeline(iter(range(100)), tally.add, max_workers=4)
+    assert tally.count == 100
+    assert tally.size == sum(range(100))
+
+
+def test_run_pipeline_handler_exception():
+    """Test run_pipeline re-raises a handler exception after workers stop."""
+    handled = []
+
+    def explode_on_three(x):
+        if x == 3:
+            raise ValueError("potato")
+        handled.append(x)
+
+    with pytest.raises(ValueError, match="potato"):
+        reaper.concurrency.run_pipeline(range(10), explode_on_three)
+    assert handled == [0, 1, 2]
+
+
+def test_run_pipeline_producer_exception():
+    """Test run_pipeline re-raises a producer exception after workers stop."""
+    handled = []
+
+    def produce():
+        yield 1
+        yield 2
+        raise ValueError("taters")
+
+    with pytest.raises(ValueError, match="taters"):
+        reaper.concurrency.run_pipeline(produce(), handled.append, max_workers=2)
+    assert sorted(handled) == [1, 2]
+
+
+def test_batched():
+    """Test batched splits items into lists of the given size."""
+    batches = reaper.concurrency.batched(iter(range(7)), 3)
+    assert list(batches) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(reaper.concurrency.batched([], 3)) == []
@@ -0,0 +1,52 @@
+"""Guard the cost of importing reaper with `python -X importtime`."""
+
+import subprocess
+import sys
+
+import pytest
+
+# Generous enough for a slow CI runner; parsing arguments used to take 250+ ms.
+CLI_IMPORT_BUDGET_SECONDS = 0.2
+
+
+def get_imported_modules(code):
+    """Run code in a fresh interpreter and get {module: cumulative seconds}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative) / 1e6
+    return modules
+
+
+def test_cli_imports_no_cloud_sdk():
+    """Test parsing arguments imports neither boto3 nor the Azure SDK."""
+    modules = get_imported_modules(
+        "import reaper.__main__ as m; "
+        "m.get_parser().parse_args(['aws', '--resources', 'volumes'])"
+    )
+    assert not {"boto3", "botocore", "azure"} & set(modules)
+    assert modules["reaper.__main__"] < CLI_IMPORT_BUDGET_SECONDS
+
+
+def test_import_does_not_configure_logging():
+    """Test importing reaper leaves logging alone until an entry point runs."""
+    modules = get_imported_modules("import reaper")
+    assert "logging.config" not in modules
+
+
+@pytest.mark.parametrize(
+    "module, other_sdk",
+    [("reaper.aws_reap", "azure"), ("reaper.azure_power_off_vms", "boto3")],
+)
+def test_each_cloud_imports_only_its_sdk(module, other_sdk):
+    """Test reaping one cloud never pays for importing the other's SDK."""
+    assert other_sdk not in get_imported_modules(f"import {module}")
@@ -0,0 +1,119 @@
+"""Unit tests for reaper.logs."""
+
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+from unittest.mock import Mock
+
+import reaper.logs
+
+# Log a few per-resource records and fail, the way a reaper command would.
+FAILING_COMMAND = """
+import logging
+from reaper import configure_logging, logs
+
+configure_logging()
+logger = logging.getLogger("reaper.test")
+for n in range(3):
+    logger.info(
+        "Deleting %s", n, extra=logs.per_resource("Deleted", "snapshots", "us-east-1")
+    )
+logger.info("Not per resource")
+raise RuntimeError("potato")
+"""
+
+
+def make_record(msg, **extra):
+    """Make an INFO record as if it had been logged with extra."""
+    return logging.makeLogRecord(
+        {"name": "reaper", "levelno": logging.INFO, "msg": msg, **extra}
+    )
+
+
+def test_json_formatter():
+    """Test records are formatted as one JSON object per line."""
+    record = make_record("Deleting %s", args=("snap-1",), levelname="INFO")
+
+    entry = json.loads(reaper.logs.JsonFormatter().format(record))
+
+    assert entry["message"] == "Deleting snap-1"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "reaper"
+
+
+def test_aggregating_handler():
+    """Test per-resource records are counted and totaled on close."""
+    target = Mock()
+    handler = reaper.logs.AggregatingHandler(target)
+    other = make_record("Checking us-east-1")
+    handler.handle(other)
+    for _ in range(3):
+        handler.handle(
+            make_record(
+                "Deleting", **reaper.logs.per_resource("Deleted", "snapshots", "r-1")
+            )
+        )
+    handler.handle(make_record("Skipping", **reaper.logs.per_resource("Skipped", "x")))
+
+    assert [c.args[0] for c in target.handle.mock_calls] == [other]
+    handler.close()
+    totals = [c.args[0].getMessage() for c in target.handle.mock_calls[1:]]
+    assert totals == ["Deleted 3 snapshots in r-1", "Skipped 1 x"]
+
+
+def test_aggregating_handler_sample():
+    """Test every Nth per-resource record is still passed on."""
+    target = Mock()
+    handler = reaper.logs.AggregatingHandler(target, sample_every=2)
+    records = [
+        make_record(str(n), **reaper.logs.per_resource("Deleted", "volumes", "r-1"))
+        for n in range(5)
+    ]
+    for record in records:
+        handler.handle(record)
+
+    assert [c.args[0] for c in target.handle.mock_calls] == records[::2]
+
+
+def test_record_queue_handler_keeps_exception():
+    """Test queued records still carry their exception for JsonFormatter."""
+    records = queue.SimpleQueue()
+    handler = reaper.logs.RecordQueueHandler(records)
+    try:
+        raise ValueError("taters")
+    except ValueError:
+        record = make_record("Failed %s", args=("vol-1",), exc_info=sys.exc_info())
+    handler.handle(record)
+
+    entry = json.loads(reaper.logs.JsonFormatter().format(records.get_nowait()))
+
+    assert entry["message"] == "Failed vol-1"
+    assert "ValueError: taters" in entry["exception"]
+
+
+def test_queue_is_drained_when_the_command_fails():
+    """Test queued records and totals are all written even if the command raises."""
+    env = dict(
+        os.environ,
+        REAP_LOG_QUEUE="true",
+        REAP_LOG_AGGREGATE="true",
+        REAP_LOG_FORMAT="json",
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", FAILING_COMMAND],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+
+    assert result.returncode == 1
+    messages = [
+        json.loads(line)["message"]
+        for line in result.stderr.splitlines()
+        if line.startswith("{")
+    ]
+    assert messages == ["Not per resource", "Deleted 3 snapshots in us-east-1"]
+    assert "RuntimeError: potato" in result.stderr
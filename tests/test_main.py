@@ -0,0 +1,82 @@
+"""Unit tests for reaper.__main__."""
+
+import datetime
+from unittest.mock import patch
+
+import pytest
+
+import reaper.__main__
+from reaper.aws_reap import RESOURCES
+
+
+@patch("reaper.aws_reap.reap")
+def test_main_aws(mock_reap):
+    """Test main reaps every AWS resource by default."""
+    reaper.__main__.main(["aws"])
+    mock_reap.assert_called_once_with(
+        ("autoscaling", "instances", "volumes", "snapshots"), until=None, plan=None
+    )
+
+
+@patch("reaper.aws_reap.reap")
+def test_main_aws_resources(mock_reap):
+    """Test main reaps only the selected AWS resources."""
+    reaper.__main__.main(["aws", "--resources", "volumes,snapshots"])
+    mock_reap.assert_called_once_with(("volumes", "snapshots"), until=None, plan=None)
+
+
+@patch("reaper.aws_reap.reap")
+def test_main_aws_until(mock_reap):
+    """Test main passes --until as a UTC datetime."""
+    reaper.__main__.main(["aws", "--until", "2024-01-01T06:00"])
+    until = datetime.datetime(2024, 1, 1, 6, tzinfo=datetime.timezone.utc)
+    mock_reap.assert_called_once_with(RESOURCES, until=until, plan=None)
+
+
+@patch("reaper.aws_reap.reap")
+def test_main_aws_until_z(mock_reap):
+    """Test main accepts a trailing Z for UTC on every supported Python."""
+    reaper.__main__.main(["aws", "--until", "2024-01-01T06:00Z"])
+    until = datetime.datetime(2024, 1, 1, 6, tzinfo=datetime.timezone.utc)
+    mock_reap.assert_called_once_with(RESOURCES, until=until, plan=None)
+
+
+@patch("reaper.aws_reap.reap")
+def test_main_aws_plan(mock_reap):
+    """Test main passes --plan through to reap."""
+    reaper.__main__.main(["aws", "--plan", "plan.jsonl"])
+    mock_reap.assert_called_once_with(RESOURCES, until=None, plan="plan.jsonl")
+
+
+@patch("reaper.aws_reap.apply")
+@patch("reaper.aws_reap.reap")
+def test_main_aws_apply(mock_reap, mock_apply):
+    """Test main applies a saved plan instead of reaping."""
+    reaper.__main__.main(["aws", "--apply", "plan.jsonl"])
+    mock_apply.assert_called_once_with("plan.jsonl")
+    mock_reap.assert_not_called()
+
+
+def test_main_aws_plan_until():
+    """Test main rejects planning and reaping --until at once."""
+    with pytest.raises(SystemExit):
+        reaper.__main__.main(["aws", "--plan", "plan.jsonl", "--until", "2024-01-01"])
+
+
+def test_main_aws_bad_until():
+    """Test main rejects --until values that are not ISO 8601 times."""
+    with pytest.raises(SystemExit):
+        reaper.__main__.main(["aws", "--until", "tomorrow"])
+
+
+def test_main_aws_unknown_resource():
+    """Test main rejects unknown AWS resources."""
+    with pytest.raises(SystemExit):
+        reaper.__main__.main(["aws", "--resources", "volumes,potatoes"])
+
+
+@patch("reaper.azure_power_off_vms.reap")
+def test_main_azure(mock_reap):
+    """Test main reaps Azure."""
+    reaper.__main__.main(["azure"])
+    mock_reap.assert_called_once_with()
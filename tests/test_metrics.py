@@ -0,0 +1,113 @@
+"""Unit tests for reaper.metrics."""
+
+import json
+from unittest.mock import Mock, patch
+
+import reaper.metrics
+import reaper.throttle
+
+
+def test_get_report():
+    """Test counters, gauges and histograms are reported with their labels."""
+    reaper.metrics.reset()
+    reaper.metrics.increment("reaper_deleted_total", resource="volumes")
+    reaper.metrics.increment("reaper_deleted_total", 2, resource="volumes")
+    reaper.metrics.set_gauge("reaper_region_seconds", 1.5, region="us-east-1")
+    reaper.metrics.observe("reaper_api_call_seconds", 0.07, action="describe")
+    reaper.metrics.observe("reaper_api_call_seconds", 1000, action="describe")
+
+    report = reaper.metrics.get_report()
+
+    assert report["counters"] == [
+        {
+            "name": "reaper_deleted_total",
+            "labels": {"resource": "volumes"},
+            "value": 3,
+        }
+    ]
+    assert report["gauges"] == [
+        {
+            "name": "reaper_region_seconds",
+            "labels": {"region": "us-east-1"},
+            "value": 1.5,
+        }
+    ]
+    (histogram,) = report["histograms"]
+    assert histogram["count"] == 2
+    assert histogram["sum"] == 1000.07
+    assert histogram["buckets"]["0.1"] == 1
+    assert histogram["buckets"]["+Inf"] == 1
+
+
+def test_format_textfile():
+    """Test the textfile has cumulative buckets and escaped labels."""
+    report = {
+        "duration_seconds": 12.5,
+        "counters": [
+            {"name": "reaper_api_errors_total", "labels": {"code": 'a"b'}, "value": 4}
+        ],
+        "gauges": [],
+        "histograms": [
+            {
+                "name": "reaper_api_call_seconds",
+                "labels": {"action": "describe"},
+                "count": 3,
+                "sum": 0.6,
+                "buckets": {"0.1": 1, "0.5": 2, "+Inf": 0},
+            }
+        ],
+    }
+
+    lines = reaper.metrics.format_textfile(report).splitlines()
+
+    assert lines == [
+        "# TYPE reaper_api_errors_total counter",
+        'reaper_api_errors_total{code="a\\"b"} 4',
+        "# TYPE reaper_run_seconds gauge",
+        "reaper_run_seconds 12.5",
+        "# TYPE reaper_api_call_seconds histogram",
+        'reaper_api_call_seconds_bucket{action="describe",le="0.1"} 1',
+        'reaper_api_call_seconds_bucket{action="describe",le="0.5"} 3',
+        'reaper_api_call_seconds_bucket{action="describe",le="+Inf"} 3',
+        'reaper_api_call_seconds_sum{action="describe"} 0.6',
+        'reaper_api_call_seconds_count{action="describe"} 3',
+    ]
+
+
+def test_write_reports(tmp_path):
+    """Test both reports are written when configured."""
+    reaper.metrics.reset()
+    reaper.metrics.increment("reaper_deleted_total", resource="snapshots")
+    json_path, textfile_path = tmp_path / "run.json", tmp_path / "reaper.prom"
+
+    reaper.metrics.write_reports(str(json_path), str(textfile_path))
+
+    report = json.loads(json_path.read_text())
+    assert report["counters"][0]["name"] == "reaper_deleted_total"
+    assert 'reaper_deleted_total{resource="snapshots"} 1' in (textfile_path.read_text())
+
+
+@patch("reaper.metrics.logger")
+def test_write_reports_failure(mock_logger, tmp_path):
+    """Test a failure to write metrics is logged and does not fail the run."""
+    reaper.metrics.write_reports(str(tmp_path / "missing" / "run.json"), "")
+    mock_logger.error.assert_called_once()
+
+
+def test_throttle_call_metrics():
+    """Test API calls are timed and their errors counted by code."""
+    reaper.metrics.reset()
+    client = Mock()
+    client.meta.region_name = "us-east-1"
+    client.describe_volumes.return_value = {}
+
+    reaper.throttle.call(client, "describe_volumes")
+
+    report = reaper.metrics.get_report()
+    (histogram,) = report["histograms"]
+    assert histogram["name"] == "reaper_api_call_seconds"
+    assert histogram["labels"] == {
+        "action": "describe_volumes",
+        "region": "us-east-1",
+    }
+    assert histogram["count"] == 1
@@ -0,0 +1,155 @@
+"""Unit tests for reaper.throttle."""
+
+from unittest.mock import Mock, patch
+
+import pytest
+from botocore.exceptions import (
+    ClientError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+import reaper.throttle
+
+
+def make_client_error(code):
+    """Make a ClientError having the given error code."""
+    return ClientError(error_response={"Error": {"Code": code}}, operation_name=Mock())
+
+
+def test_token_bucket_aimd():
+    """Test TokenBucket increases additively and decreases multiplicatively."""
+    bucket = reaper.throttle.TokenBucket(rate=10.0, max_rate=10.5)
+    bucket.on_success()
+    assert bucket.rate == pytest.approx(10.1)
+    for _ in range(100):
+        bucket.on_success()
+    assert bucket.rate == 10.5
+    bucket.on_throttle()
+    assert bucket.rate == 5.25
+    for _ in range(100):
+        bucket.on_throttle()
+    assert bucket.rate == reaper.throttle.RATE_MIN
+
+
+@patch("reaper.throttle.time")
+def test_token_bucket_acquire_waits_when_empty(mock_time):
+    """Test TokenBucket.acquire sleeps until a token has refilled."""
+    mock_time.monotonic.return_value = 100.0
+    bucket = reaper.throttle.TokenBucket(rate=2.0)
+    bucket.acquire()
+    bucket.acquire()
+    mock_time.sleep.assert_not_called()
+
+    def advance_clock(seconds):
+        mock_time.monotonic.return_value += seconds
+
+    mock_time.sleep.side_effect = advance_clock
+    bucket.acquire()
+    mock_time.sleep.assert_called_once_with(0.5)
+
+
+def test_get_bucket_is_shared_per_client_and_action():
+    """Test get_bucket returns one bucket per client and action."""
+    client_1, client_2 = Mock(), Mock()
+    bucket = reaper.throttle.get_bucket(client_1, "delete_volume")
+    assert reaper.throttle.get_bucket(client_1, "delete_volume") is bucket
+    assert reaper.throttle.get_bucket(client_1, "delete_snapshot") is not bucket
+    assert reaper.throttle.get_bucket(client_2, "delete_volume") is not bucket
+
+
+@patch("reaper.throttle.time.sleep")
+def test_call_retries_throttled(mock_sleep):
+    """Test call retries throttled calls and counts them."""
+    client = Mock()
+    client.delete_volume.side_effect = [
+        make_client_error("RequestLimitExceeded"),
+        make_client_error("Throttling"),
+        "deleted",
+    ]
+    stats_before = reaper.throttle.get_stats()
+
+    response = reaper.throttle.call(client, "delete_volume", VolumeId="vol-1")
+
+    assert response == "deleted"
+    assert len(client.delete_volume.mock_calls) == 3
+    assert len(mock_sleep.mock_calls) == 2
+    stats_after = reaper.throttle.get_stats()
+    assert stats_after["throttles"] - stats_before["throttles"] == 2
+    assert stats_after["retries"] - stats_before["retries"] == 2
+
+
+@patch("reaper.throttle.time.sleep")
+@patch("reaper.throttle.REAP_API_MAX_RETRIES", 1)
+def test_call_gives_up_after_max_retries(mock_sleep):
+    """Test call raises the throttling error once retries are exhausted."""
+    client = Mock()
+    client.delete_volume.side_effect = make_client_error("RequestLimitExceeded")
+
+    with pytest.raises(ClientError):
+        reaper.throttle.call(client, "delete_volume", VolumeId="vol-1")
+
+    assert len(client.delete_volume.mock_calls) == 2
+
+
+@patch("reaper.throttle.time.sleep")
+def test_call_retries_transient_errors(mock_sleep):
+    """Test call retries transient failures without slowing the bucket down."""
+    client = Mock()
+    server_error = ClientError(
+        error_response={
+            "Error": {"Code": "SomethingOdd"},
+            "ResponseMetadata": {"HTTPStatusCode": 503},
+        },
+        operation_name=Mock(),
+    )
+    client.delete_volume.side_effect = [
+        make_client_error("InternalError"),
+        server_error,
+        EndpointConnectionError(endpoint_url="https://ec2.example"),
+        ReadTimeoutError(endpoint_url="https://ec2.example"),
+        "deleted",
+    ]
+    bucket = reaper.throttle.get_bucket(client, "delete_volume")
+    rate = bucket.rate
+    stats_before = reaper.throttle.get_stats()
+
+    response = reaper.throttle.call(client, "delete_volume", VolumeId="vol-1")
+
+    assert response == "deleted"
+    assert len(client.delete_volume.mock_calls) == 5
+    assert len(mock_sleep.mock_calls) == 4
+    assert bucket.rate > rate
+    stats_after = reaper.throttle.get_stats()
+    assert stats_after["throttles"] == stats_before["throttles"]
+    assert stats_after["retries"] - stats_before["retries"] == 4
+
+
+def test_call_raises_other_errors_immediately():
+    """Test call does not retry errors that are not throttling."""
+    client = Mock()
+    client.delete_volume.side_effect = make_client_error("InvalidVolume.NotFound")
+
+    with pytest.raises(ClientError):
+        reaper.throttle.call(client, "delete_volume", VolumeId="vol-1")
+
+    assert len(client.delete_volume.mock_calls) == 1
+
+
+def test_paginate():
+    """Test paginate follows NextToken through every page."""
+    client = Mock()
+    client.describe_volumes.side_effect = [
+        {"Volumes": [1, 2], "NextToken": "token-1"},
+        {"Volumes": [3], "NextToken": "token-2"},
+        {"Volumes": []},
+    ]
+
+    items = reaper.throttle.paginate(client, "describe_volumes", "Volumes", Foo="bar")
+
+    assert list(items) == [1, 2, 3]
+    assert client.describe_volumes.call_args_list[0].kwargs == {"Foo": "bar"}
+    assert client.describe_volumes.call_args_list[2].kwargs == {
+        "Foo": "bar",
+        "NextToken": "token-2",
+    }